@@ -0,0 +1,61 @@
+'''
+Benchmark of appending spectra one file at a time, as "Add File" does.
+
+Compares the previous np.column_stack path, which copies the whole stack on every
+append, with the growable SpectraStore used by DataHandler.add_data. The time per
+appended spectrum stays flat for the store (linear total) and grows with N for
+np.column_stack (quadratic total).
+
+Usage:
+    python benchmarks/bench_append.py --rows 3600 --counts 100 200 400 800
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stack_module import SpectraStore  # noqa: E402
+
+
+def append_column_stack(first, spectra) -> np.ndarray:
+    '''Append every spectrum with np.column_stack.'''
+    data = first
+    for spectrum in spectra:
+        data = np.column_stack((data, spectrum))
+    return data
+
+
+def append_store(first, spectra) -> np.ndarray:
+    '''Append every spectrum to a SpectraStore.'''
+    store = SpectraStore.from_array(first)
+    for spectrum in spectra:
+        store.append(spectrum)
+    return store.data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=3600)
+    parser.add_argument('--counts', type=int, nargs='+', default=[100, 200, 400, 800])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    first = np.column_stack((np.linspace(4000, 400, args.rows), rng.random(args.rows)))
+
+    print(f'{"N":>6} {"column_stack (s)":>18} {"us/append":>10} {"SpectraStore (s)":>18} {"us/append":>10}')
+    for count in args.counts:
+        spectra = [rng.random(args.rows) for _ in range(count)]
+        timings = []
+        for append in (append_column_stack, append_store):
+            start = time.perf_counter()
+            append(first, spectra)
+            timings.append(time.perf_counter() - start)
+        print(f'{count:>6} {timings[0]:>18.3f} {timings[0] / count * 1e6:>10.1f} '
+              f'{timings[1]:>18.3f} {timings[1] / count * 1e6:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
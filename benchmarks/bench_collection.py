@@ -0,0 +1,78 @@
+'''
+Benchmark of the two ways PlotHandler draws a stack: one Line2D per spectrum or
+one LineCollection.
+
+For every number of spectra the plot is built, updated with another offset and
+drawn on the Agg canvas, once with lines and once with a collection (by moving
+collection_threshold), and the colors of a palette are set. Times are in ms.
+The spectra are decimated as in the GUI.
+
+Usage:
+    python benchmarks/bench_collection.py --rows 3600 --counts 100 500 1000 2000 --repeat 3
+'''
+import argparse
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logic_module_fit import DataHandler, PlotHandler  # noqa: E402
+
+
+def spectra(x_data, count, rng):
+    '''Absorption bands at random positions, one spectrum per column.'''
+    centers = rng.uniform(x_data.min(), x_data.max(), count)
+    return np.exp(-0.5 * ((x_data[:, None] - centers) / 30) ** 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=3600)
+    parser.add_argument('--counts', type=int, nargs='+', default=[100, 500, 1000, 2000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"N":>6} {"artists":>11} {"build + draw":>13} {"update + draw":>14} {"colors":>8}')
+    for count in args.counts:
+        x_data = np.linspace(4000, 400, args.rows)
+        # Fortran-ordered like the display block of the stack
+        data_txt = np.asfortranarray(np.column_stack((x_data, spectra(x_data, count, rng))))
+        handler = DataHandler()
+        handler.generate_colors('Thermometer', count)
+        for threshold in (count, count - 1):
+            plot_handler = PlotHandler()
+            plot_handler.collection_threshold = threshold
+            canvas = plot_handler.fig.canvas
+            canvas.draw_idle = lambda *args, **kwargs: None
+
+            start = time.perf_counter()
+            plot_handler.update_plot(data_txt, 0.0, 'collection', handler.data_color)
+            canvas.draw()
+            build_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for i in range(args.repeat):
+                plot_handler.update_plot(data_txt, 0.01 * (i + 1), 'collection', handler.data_color)
+                canvas.draw()
+            update_time = (time.perf_counter() - start) / args.repeat
+
+            start = time.perf_counter()
+            for palette in ('Red', 'Blue')[:args.repeat]:
+                handler.generate_colors(palette, count)
+                plot_handler.set_colors(handler.data_color, draw=False)
+            color_time = (time.perf_counter() - start) / min(2, args.repeat)
+
+            artists = 'collection' if plot_handler.collection is not None else 'lines'
+            print(f'{count:>6} {artists:>11} {build_time * 1e3:>13.1f} {update_time * 1e3:>14.1f} '
+                  f'{color_time * 1e3:>8.2f}')
+            plt.close(plot_handler.fig)
+
+
+if __name__ == '__main__':
+    main()
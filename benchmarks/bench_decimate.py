@@ -0,0 +1,93 @@
+'''
+Benchmark of the display decimation of long spectra.
+
+Plots spectra of narrow bands on 50k to 200k points with and without the per-pixel
+min/max decimation of PlotHandler, and reports the points given to every line,
+the time of the first draw and of a zoom or pan (set_xlim and draw) on the Agg
+canvas, and the largest difference of the plotted peak heights.
+
+A second table compares, for the whole x range, the min/max decimation from the
+spectra (minmax_decimate) with the view of their MinMaxPyramid, whose time does
+not grow with the length of the spectra, and the time to build the pyramid.
+
+Usage:
+    python benchmarks/bench_decimate.py --rows 50000 200000 --spectra 50 --repeat 3
+'''
+import argparse
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logic_module_fit import PlotHandler  # noqa: E402
+from decimate_module import MinMaxPyramid, minmax_decimate  # noqa: E402
+
+
+def spectra(x_data, count, rng):
+    '''Narrow bands at random positions with a little noise, one spectrum per column.'''
+    centers = rng.uniform(x_data.min(), x_data.max(), count)
+    return np.exp(-0.5 * ((x_data[:, None] - centers) / 1.0) ** 2) + 0.002 * rng.standard_normal((x_data.size, count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[50000, 200000])
+    parser.add_argument('--spectra', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"rows":>8} {"decimate":>9} {"points/line":>12} {"first draw (ms)":>16} {"zoom/pan (ms)":>14} '
+          f'{"peak error":>11}')
+    for rows in args.rows:
+        x_data = np.linspace(4000, 400, rows)
+        data_txt = np.column_stack((x_data, spectra(x_data, args.spectra, rng)))
+        peaks = (data_txt[:, 1:] - data_txt[1, 1:]).max(axis=0)
+        for decimate in (False, True):
+            plot_handler = PlotHandler()
+            plot_handler.decimate = decimate
+            canvas = plot_handler.fig.canvas
+            canvas.draw_idle = lambda *args, **kwargs: None
+            start = time.perf_counter()
+            plot_handler.update_plot(data_txt, 0.0, 'decimate', None)
+            canvas.draw()
+            first_time = time.perf_counter() - start
+            points = plot_handler.lines[0].get_xdata().size
+            error = np.abs(np.array([line.get_ydata().max() for line in plot_handler.lines]) - peaks).max()
+
+            zoom_time = 0.0
+            for i in range(args.repeat):
+                center = 3000 - 500 * i
+                start = time.perf_counter()
+                plot_handler.ax.set_xlim(center + 400, center - 400)
+                canvas.draw()
+                zoom_time += time.perf_counter() - start
+            plt.close(plot_handler.fig)
+            print(f'{rows:>8} {str(decimate):>9} {points:>12} {first_time * 1e3:>16.1f} '
+                  f'{zoom_time / args.repeat * 1e3:>14.1f} {error:>11.2g}')
+
+    print(f'\n{"rows":>8} {"build pyramid (ms)":>19} {"decimate (ms)":>14} {"pyramid view (ms)":>18}')
+    for rows in args.rows:
+        x_data = np.linspace(4000, 400, rows)
+        y_data = np.asfortranarray(spectra(x_data, args.spectra, rng))
+        start = time.perf_counter()
+        pyramid = MinMaxPyramid(x_data, y_data)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            minmax_decimate(x_data, y_data, 1000)
+        decimate_time = (time.perf_counter() - start) / args.repeat
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            pyramid.view(4000, 400, 1000)
+        view_time = (time.perf_counter() - start) / args.repeat
+        print(f'{rows:>8} {build_time * 1e3:>19.1f} {decimate_time * 1e3:>14.1f} {view_time * 1e3:>18.2f}')
+
+
+if __name__ == '__main__':
+    main()
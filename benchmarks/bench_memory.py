@@ -0,0 +1,103 @@
+'''
+Benchmark of the peak resident memory of loading and processing a large text file.
+
+Writes a CSV file of --spectra spectra of --rows points, then loads it in a fresh
+process for every mode, sets a Savitzky-Golay smoothing and builds the plot
+pyramid, and reports the peak resident set size (ru_maxrss) over the baseline of
+the process after its imports:
+
+    whole array   read_numeric then SpectrumStack.from_array, the parsed array
+                  held next to the stores
+    memory        DataHandler.load_data streaming into in-memory stores
+    memmap        DataHandler.load_data streaming into memory-mapped stores,
+                  whose pages are released column block by column block
+
+The stores hold float32, so the data itself takes 2 * rows * spectra * 4 bytes
+(raw and display). The memmap peak should stay near a few column blocks whatever
+the size of the file.
+
+Usage:
+    python benchmarks/bench_memory.py --rows 10000 --spectra 1000
+'''
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MODES = ('whole array', 'memory', 'memmap')
+
+
+def peak_rss() -> int:
+    '''Peak resident set size of this process in bytes.'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def write_csv(file_path, rows, spectra, block_rows=1000):
+    '''Write a CSV file of random spectra on a descending axis, one block of rows at a time.'''
+    rng = np.random.default_rng(0)
+    x_data = np.linspace(4000, 400, rows)
+    with open(file_path, 'w') as f:
+        f.write('x,' + ','.join(f'spectrum {i}' for i in range(spectra)) + '\n')
+        for first in range(0, rows, block_rows):
+            last = min(first + block_rows, rows)
+            block = np.column_stack((x_data[first:last], rng.random((last - first, spectra))))
+            np.savetxt(f, block, fmt='%.6g', delimiter=',')
+
+
+def run(mode, file_path):
+    '''Load and process the file with one mode; print the elapsed time and the peak RSS over the baseline of each step.'''
+    from io_module import sniff_file, read_numeric
+    from logic_module_fit import DataHandler
+    from stack_module import SpectrumStack
+
+    baseline = peak_rss()
+    start = time.perf_counter()
+    if mode == 'whole array':
+        data = read_numeric(file_path, sniff_file(file_path))
+        stack = SpectrumStack.from_array(data, dtype=np.float32)
+    else:
+        handler = DataHandler(storage=mode)
+        handler.load_data(file_path)
+        stack = handler.stack
+    loaded = time.perf_counter(), peak_rss()
+    stack.set_smoothing('Savitzky-Golay', 11)
+    stack.build_pyramid()
+    print(loaded[0] - start, loaded[1] - baseline, time.perf_counter() - loaded[0], peak_rss() - baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--spectra', type=int, default=1000)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.file)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'spectra.csv')
+        write_csv(file_path, args.rows, args.spectra)
+        data_mb = 2 * args.rows * args.spectra * 4 / 1024 ** 2
+        print(f'{args.rows} rows x {args.spectra} spectra, file {os.path.getsize(file_path) / 1024 ** 2:.0f} MB, '
+              f'stores {data_mb:.0f} MB')
+        print(f'{"Mode":<12} {"load (s)":>9} {"peak RSS (MB)":>14} {"process (s)":>12} {"peak RSS (MB)":>14}')
+        for mode in MODES:
+            result = subprocess.run([sys.executable, __file__, '--mode', mode, '--file', file_path],
+                                    capture_output=True, text=True, check=True)
+            load_time, load_peak, process_time, process_peak = map(float, result.stdout.split())
+            print(f'{mode:<12} {load_time:>9.2f} {load_peak / 1024 ** 2:>14.0f} '
+                  f'{process_time:>12.2f} {process_peak / 1024 ** 2:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
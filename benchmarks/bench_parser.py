@@ -0,0 +1,66 @@
+'''
+Benchmark of the text parsers used by DataHandler.load_data.
+
+Writes a synthetic multi-spectrum file and reports the throughput (MB/s) of the
+chunked engine against the np.loadtxt path.
+
+Usage:
+    python benchmarks/bench_parser.py --rows 10000 --columns 200
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from io_module import sniff_file, read_numeric  # noqa: E402
+
+
+def write_sample(file_path, rows, columns, delimiter):
+    '''Write a synthetic spectrum file with one wavenumber column and `columns` spectra.'''
+    x_data = np.linspace(4000, 400, rows)
+    y_data = np.random.default_rng(0).random((rows, columns))
+    header = delimiter.join(['Wavenumber'] + [f'Spectrum {i + 1}' for i in range(columns)])
+    np.savetxt(file_path, np.column_stack((x_data, y_data)), delimiter=delimiter, header=header, fmt='%.6f')
+
+
+def time_engine(file_path, engine, repeat) -> tuple[float, np.ndarray]:
+    '''Return the best time of `repeat` parses and the parsed array.'''
+    best = float('inf')
+    data = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        file_format = sniff_file(file_path)
+        data = read_numeric(file_path, file_format, engine=engine)
+        best = min(best, time.perf_counter() - start)
+    return best, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--columns', type=int, default=200)
+    parser.add_argument('--delimiter', default='\t')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'bench.dat')
+        write_sample(file_path, args.rows, args.columns, args.delimiter)
+        size_mb = os.path.getsize(file_path) / 1024 ** 2
+        print(f'File: {args.rows} rows x {args.columns + 1} columns, {size_mb:.1f} MB')
+
+        results = {}
+        for engine in ('loadtxt', 'chunked'):
+            elapsed, results[engine] = time_engine(file_path, engine, args.repeat)
+            print(f'{engine:>8}: {elapsed:8.3f} s  {size_mb / elapsed:8.1f} MB/s')
+
+        if not np.array_equal(results['loadtxt'], results['chunked']):
+            print('WARNING: engines returned different arrays')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+'''
+Benchmark of a plot update, as on every offset keystroke or color change.
+
+Compares the previous PlotHandler.update_plot, which cleared the axes and plotted
+every spectrum again, with the current one, which keeps the Line2D artists and
+only sets their y data. The time of the update itself (artists and data limits)
+and of the update followed by a draw on the Agg canvas are reported; the drawing
+of the lines by Agg is the same for both.
+
+draw_idle draws at once on the Agg canvas, while in the Tk window it only
+schedules one draw; it is disabled here so every update is drawn once.
+
+The blitted update is the persistent one with blitting on: the offset goes down
+so the lines stay in view, and only the lines are drawn over the cached
+background, which is what dragging the offset slider does. Its update includes
+that drawing.
+
+Usage:
+    python benchmarks/bench_plot_update.py --rows 3600 --counts 10 100 1000 --repeat 5
+'''
+import argparse
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logic_module_fit import DataHandler, PlotHandler  # noqa: E402
+
+
+def spectra(x_data, count, rng):
+    '''Absorption bands at random positions with a little noise, one spectrum per column.'''
+    centers = rng.uniform(x_data.min(), x_data.max(), count)
+    return np.exp(-0.5 * ((x_data[:, None] - centers) / 30) ** 2) + 0.002 * rng.standard_normal((x_data.size, count))
+
+
+def update_replot(plot_handler, data_txt, offset, colors):
+    '''The previous update: clear the axes and plot every spectrum again.'''
+    ax = plot_handler.ax
+    ax.clear()
+    y_data = data_txt[:, 1:] - data_txt[1, 1:] + offset * np.arange(data_txt.shape[1] - 1)
+    lines = ax.plot(data_txt[:, 0], y_data)
+    for i, line in enumerate(lines):
+        line.set_color((colors['Red'][i], colors['Green'][i], colors['Blue'][i]))
+    ax.set_title('replot')
+    ax.invert_xaxis()
+    ax.set_xlabel(r'Wavenumber (cm$^{-1}$)')
+    ax.set_ylabel('Optical Depth')
+
+
+def update_persistent(plot_handler, data_txt, offset, colors):
+    '''The current update: the line artists are kept.'''
+    plot_handler.update_plot(data_txt, offset, 'persistent', colors)
+
+
+def update_blitted(plot_handler, data_txt, offset, colors):
+    '''The persistent update with blitting: only the lines are drawn.'''
+    plot_handler.update_plot(data_txt, offset, 'persistent', colors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=3600)
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"N":>6} {"replot update":>14} {"+ draw (ms)":>12} {"persistent update":>18} {"+ draw (ms)":>12} '
+          f'{"blitted (ms)":>13}')
+    for count in args.counts:
+        x_data = np.linspace(4000, 400, args.rows)
+        data_txt = np.column_stack((x_data, spectra(x_data, count, rng)))
+        handler = DataHandler()
+        handler.generate_colors('Thermometer', count)
+        timings = []
+        for update in (update_replot, update_persistent, update_blitted):
+            plot_handler = PlotHandler()
+            plot_handler.set_blit(update is update_blitted)
+            canvas = plot_handler.fig.canvas
+            canvas.draw_idle = lambda *args, **kwargs: None
+            update(plot_handler, data_txt, 0.1 * (args.repeat + 1), handler.data_color)
+            canvas.draw()
+            update_time = draw_time = 0.0
+            for i in range(args.repeat):
+                start = time.perf_counter()
+                update(plot_handler, data_txt, 0.1 * (args.repeat - i), handler.data_color)
+                middle = time.perf_counter()
+                if not plot_handler.blit:
+                    canvas.draw()
+                update_time += middle - start
+                draw_time += time.perf_counter() - start
+            timings += [update_time / args.repeat * 1e3, draw_time / args.repeat * 1e3]
+            plt.close(plot_handler.fig)
+        print(f'{count:>6} {timings[0]:>14.1f} {timings[1]:>12.1f} {timings[2]:>18.1f} {timings[3]:>12.1f} '
+              f'{timings[4]:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
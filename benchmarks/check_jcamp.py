@@ -0,0 +1,161 @@
+'''
+Round-trip check of the JCAMP-DX reader on compressed DIFDUP tables and point tables.
+
+Encodes synthetic spectra as (X++(Y..Y)) tables in DIFDUP form: SQZ values
+starting every line, DIF differences with DUP runs, the Y-check value repeated at
+the start of the next line and negative multi-digit ordinates. The spectra are
+written as single blocks and as a link block, read back with sniff_file and
+read_numeric, and compared to the integers encoded, scaled by YFACTOR. Point
+tables are checked the same way: (XY..XY) XYPOINTS in AFFN with comma and
+semicolon separators and in SQZ form with DUP runs, and a (XYW..XYW) PEAKTABLE
+whose widths must be left out.
+
+Usage:
+    python benchmarks/check_jcamp.py --points 5000 --spectra 3
+'''
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from io_module import sniff_file, read_numeric  # noqa: E402
+
+SQZ_POSITIVE, SQZ_NEGATIVE = '@ABCDEFGHI', '@abcdefghi'
+DIF_POSITIVE, DIF_NEGATIVE = '%JKLMNOPQR', '%jklmnopqr'
+DUP_CHARS = 'STUVWXYZs'
+
+
+def compress(value, positive, negative) -> str:
+    '''Replace the sign and the first digit of an integer by its SQZ or DIF character.'''
+    digits = str(abs(int(value)))
+    return (negative if value < 0 else positive)[int(digits[0])] + digits[1:]
+
+
+def dup(count) -> str:
+    '''DUP token repeating the previous token up to count occurrences.'''
+    digits = str(count)
+    return DUP_CHARS[int(digits[0]) - 1] + digits[1:]
+
+
+def encode_difdup(x_data, y_data, per_line) -> list[str]:
+    '''Lines of a DIFDUP table; every line starts with the last ordinate of the previous one.'''
+    lines = []
+    start = 0
+    while start < y_data.size - 1:
+        stop = min(start + per_line, y_data.size - 1)
+        tokens = [compress(y_data[start], SQZ_POSITIVE, SQZ_NEGATIVE)]
+        differences = [compress(d, DIF_POSITIVE, DIF_NEGATIVE) for d in np.diff(y_data[start:stop + 1])]
+        i = 0
+        while i < len(differences):
+            run = 1
+            while i + run < len(differences) and differences[i + run] == differences[i]:
+                run += 1
+            tokens.append(differences[i] + (dup(run) if run > 1 else ''))
+            i += run
+        lines.append(f'{x_data[start]:.6f} ' + ''.join(tokens))
+        start = stop
+    # The Y-check of the last line
+    lines.append(f'{x_data[-1]:.6f} ' + compress(y_data[-1], SQZ_POSITIVE, SQZ_NEGATIVE))
+    return lines
+
+
+def encode_points(values, per_line) -> list[str]:
+    '''Lines of a point table in SQZ form, runs of equal values written with DUP.'''
+    tokens = []
+    i = 0
+    while i < values.size:
+        run = 1
+        while i + run < values.size and values[i + run] == values[i]:
+            run += 1
+        tokens.append(compress(values[i], SQZ_POSITIVE, SQZ_NEGATIVE) + (dup(run) if run > 1 else ''))
+        i += run
+    return [''.join(tokens[start:start + per_line]) for start in range(0, len(tokens), per_line)]
+
+
+def point_block(title, label, form, lines, y_factor) -> list[str]:
+    '''Records of one block holding a point table.'''
+    return [f'##TITLE= {title}', '##JCAMP-DX= 5.01', '##XUNITS= 1/CM', '##YUNITS= ABSORBANCE', '##XFACTOR= 1',
+            f'##YFACTOR= {y_factor!r}', f'##{label}= {form}', *lines, '##END=']
+
+
+def block(title, x_data, y_data, y_factor, per_line) -> list[str]:
+    '''Records of one spectrum block.'''
+    return [f'##TITLE= {title}', '##JCAMP-DX= 4.24', '##DATA TYPE= INFRARED SPECTRUM', '##XUNITS= 1/CM',
+            '##YUNITS= ABSORBANCE', f'##FIRSTX= {x_data[0]:.6f}', f'##LASTX= {x_data[-1]:.6f}',
+            '##XFACTOR= 1', f'##YFACTOR= {y_factor!r}', f'##NPOINTS= {y_data.size}', '##XYDATA= (X++(Y..Y))',
+            *encode_difdup(x_data, y_data, per_line), '##END=']
+
+
+def sample_ordinates(rng, points) -> np.ndarray:
+    '''Integer spectrum made of runs of equal steps, crossing zero, with multi-digit values.'''
+    steps = np.repeat(rng.integers(-3000, 3000, points), rng.integers(1, 12, points))[:points - 1]
+    steps[rng.random(steps.size) < 0.05] = 0
+    y_data = np.concatenate(([-45678], -45678 + np.cumsum(steps)))
+    return y_data - (y_data.max() + y_data.min()) // 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--spectra', type=int, default=3)
+    parser.add_argument('--per-line', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x_data = np.linspace(4000, 400, args.points)
+    y_factor = 0.000125
+    ordinates = [sample_ordinates(rng, args.points) for _ in range(args.spectra)]
+    expected = np.column_stack([x_data] + [y_data * y_factor for y_data in ordinates])
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cases = {}
+        for i, y_data in enumerate(ordinates):
+            cases[f'single block {i + 1}'] = ([i + 1], block(f'spectrum {i + 1}', x_data, y_data, y_factor,
+                                                                args.per_line))
+        link = ['##TITLE= link', '##JCAMP-DX= 5.01', f'##BLOCKS= {args.spectra}']
+        for i, y_data in enumerate(ordinates):
+            link += block(f'spectrum {i + 1}', x_data, y_data, y_factor, args.per_line)
+        cases['link block'] = (list(range(1, args.spectra + 1)), link + ['##END='])
+
+        # Point tables of integers, some ordinates equal to the next abscissa so that DUP runs appear
+        x_points = 1000 + 10 * np.arange(args.points // 10)
+        y_points = rng.integers(-500, 500, x_points.size)
+        y_points[:-1:5] = x_points[1::5]
+        widths = rng.integers(1, 50, x_points.size)
+        point_expected = np.column_stack((x_points, y_points * y_factor))
+        point_tables = {
+            'XYPOINTS AFFN': ('XYPOINTS', '(XY..XY)', [f'{x}, {y};' for x, y in zip(x_points, y_points)]),
+            'XYPOINTS SQZ DUP': ('XYPOINTS', '(XY..XY)',
+                                 encode_points(np.column_stack((x_points, y_points)).ravel(), args.per_line)),
+            'PEAKTABLE XYW': ('PEAKTABLE', '(XYW..XYW)',
+                              [f'{x} {y} {w}' for x, y, w in zip(x_points, y_points, widths)]),
+        }
+        for name, (label, form, lines) in point_tables.items():
+            cases[name] = (None, point_block(name, label, form, lines, y_factor))
+
+        print(f'{"Case":<20} {"spectra":>8} {"max abs error":>14}')
+        for name, (columns, records) in cases.items():
+            file_path = os.path.join(tmp_dir, 'check.jdx')
+            with open(file_path, 'w') as f:
+                f.write('\n'.join(records) + '\n')
+            file_format = sniff_file(file_path)
+            data = read_numeric(file_path, file_format)
+            reference = point_expected if columns is None else expected[:, [0] + columns]
+            if data.shape != reference.shape or file_format.n_columns != reference.shape[1]:
+                print(f'{name:<20} FAILED: shape {data.shape}, expected {reference.shape}')
+                failures += 1
+                continue
+            error = np.abs(data - reference).max()
+            ok = error <= 1e-9 * np.abs(reference).max()
+            failures += not ok
+            print(f'{name:<20} {data.shape[1] - 1:>8} {error:>14.3e}{"" if ok else "  FAILED"}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+'''
+Round-trip check of the OPUS reader on absorbance and transmittance blocks.
+
+Writes synthetic OPUS files holding an AB spectrum, a TR spectrum (the same data
+block type with PLF=TR in its parameters) and both in one file, with a scale
+factor (CSF) and a sample name. Every file is read back with sniff_file and
+read_numeric and compared to the float32 values stored times CSF, and the units
+of the sniffed metadata are checked. A TR block on a shorter range with another
+number of points, and one shifted with the same number of points, must come
+back interpolated onto the axis of the first block, holding their end values
+beyond their range (compared with np.interp).
+
+Usage:
+    python benchmarks/check_opus.py --points 5000
+'''
+import argparse
+import os
+import struct
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from io_module import sniff_file, read_numeric  # noqa: E402
+from opus_module import (MAGIC, HEADER_BYTES, DIRECTORY_ENTRY, PARAMETER_TYPE, SAMPLE_TYPE,  # noqa: E402
+                         Y_UNITS)
+
+DATA_TYPE = 15
+CHANNELS = {'AB': 4, 'TR': 8}
+
+
+def parameter_block(parameters) -> bytes:
+    '''Parameter block: name, type and size in 2-byte words, then the value, ending with END.'''
+    parts = []
+    for name, value in parameters.items():
+        if isinstance(value, int):
+            value_type, payload = 0, struct.pack('<i', value)
+        elif isinstance(value, float):
+            value_type, payload = 1, struct.pack('<d', value)
+        else:
+            payload = value.encode('latin-1') + b'\0'
+            payload += b'\0' * (-len(payload) % 4)
+            value_type = 2
+        parts.append(name.encode('latin-1')[:3] + b'\0' + struct.pack('<hh', value_type, len(payload) // 2) + payload)
+    parts.append(b'END\0' + struct.pack('<hh', 0, 0))
+    return b''.join(parts)
+
+
+def write_opus(file_path, x_data, spectra) -> tuple[np.ndarray, list[str]]:
+    '''Write an OPUS file with one data block per (kind, y_data, csf[, x_block]) and return the expected data and units.
+
+    Blocks without their own x_block use x_data, the axis of the first block.
+    '''
+    blocks = [(SAMPLE_TYPE, 0, parameter_block({'SNM': 'round-trip check'}))]
+    expected = [x_data]
+    for kind, y_data, csf, *x_block in spectra:
+        x_block = x_block[0] if x_block else x_data
+        stored = (y_data / csf).astype('<f4')
+        # The reader puts every block on the axis of the first one
+        expected.append(np.interp(x_data[::-1], x_block[::-1], (stored * csf)[::-1])[::-1])
+        parameters = {'DPF': 1, 'NPT': y_data.size, 'FXV': float(x_block[0]), 'LXV': float(x_block[-1]),
+                      'CSF': csf, 'DXU': 'WN', 'PLF': kind, 'DAT': '16/10/2026', 'TIM': '12:00:00'}
+        blocks.append((DATA_TYPE, CHANNELS[kind], stored.tobytes()))
+        blocks.append((DATA_TYPE + PARAMETER_TYPE, CHANNELS[kind], parameter_block(parameters)))
+
+    directory = np.zeros(len(blocks), DIRECTORY_ENTRY)
+    offset = HEADER_BYTES + directory.nbytes
+    for entry, (data_type, channel_type, payload) in zip(directory, blocks):
+        entry['data_type'], entry['channel_type'] = data_type, channel_type
+        entry['length'], entry['offset'] = -(-len(payload) // 4), offset
+        offset += 4 * int(entry['length'])
+
+    with open(file_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<d3i', 920622.0, HEADER_BYTES, len(blocks), len(blocks)))
+        f.write(directory.tobytes())
+        for _, _, payload in blocks:
+            f.write(payload + b'\0' * (-len(payload) % 4))
+    return np.column_stack(expected), [Y_UNITS[spectrum[0]] for spectrum in spectra]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x_data = np.linspace(3999.64, 399.19, args.points)
+    absorbance = (1.5 * np.exp(-((x_data - rng.uniform(600, 3800, 5)[:, np.newaxis]) / 25) ** 2).sum(axis=0)
+                  + 0.002 * rng.standard_normal(args.points))
+    transmittance = 10 ** -absorbance
+    x_short = np.linspace(3500.0, 600.0, args.points // 2)
+    transmittance_short = np.interp(x_short[::-1], x_data[::-1], transmittance[::-1])[::-1]
+    x_shifted = x_data - 50.0
+
+    cases = {
+        'AB block': [('AB', absorbance, 1.0)],
+        'TR block': [('TR', transmittance, 0.01)],
+        'AB and TR blocks': [('AB', absorbance, 0.5), ('TR', transmittance, 1.0)],
+        'TR other range': [('AB', absorbance, 1.0), ('TR', transmittance_short, 1.0, x_short)],
+        'TR shifted range': [('AB', absorbance, 1.0), ('TR', transmittance, 1.0, x_shifted)],
+    }
+    failures = 0
+    print(f'{"Case":<18} {"spectra":>8} {"max abs error":>14}  units')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'check.0')
+        for name, spectra in cases.items():
+            expected, units = write_opus(file_path, x_data, spectra)
+            file_format = sniff_file(file_path)
+            data = read_numeric(file_path, file_format)
+            read_units = [metadata['YUNITS'] for metadata in file_format.metadata]
+            if data.shape != expected.shape or read_units != units:
+                print(f'{name:<18} FAILED: shape {data.shape}, expected {expected.shape}, units {read_units}')
+                failures += 1
+                continue
+            error = np.abs(data - expected).max()
+            ok = error <= 1e-12 * np.abs(expected).max()
+            failures += not ok
+            print(f'{name:<18} {len(spectra):>8} {error:>14.3e}  {", ".join(read_units)}{"" if ok else "  FAILED"}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+'''
+Accuracy and memory check of the float32 storage mode against float64.
+
+Loads the same synthetic spectra with both storage precisions, runs the unit
+conversion, every smoothing method and a baseline subtraction, and reports the
+largest absolute and relative differences of the displayed data together with the
+memory of the stacks.
+
+Usage:
+    python benchmarks/check_precision.py --rows 7000 --columns 100
+'''
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logic_module_fit import DataHandler  # noqa: E402
+from stack_module import SMOOTH_METHODS  # noqa: E402
+
+
+def write_sample(file_path, rows, columns):
+    '''Write absorbance-like spectra: Gaussian bands over a sloped baseline plus noise.'''
+    rng = np.random.default_rng(0)
+    x_data = np.linspace(4000, 400, rows)
+    centers = rng.uniform(600, 3800, (1, columns))
+    y_data = (rng.uniform(0.1, 2.0, (1, columns)) * np.exp(-((x_data[:, np.newaxis] - centers) / 15) ** 2)
+              + 1e-5 * x_data[:, np.newaxis] + 1e-3 * rng.standard_normal((rows, columns)))
+    np.savetxt(file_path, np.column_stack((x_data, y_data)), delimiter='\t', fmt='%.8g')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=7000)
+    parser.add_argument('--columns', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'precision.dat')
+        write_sample(file_path, args.rows, args.columns)
+
+        handlers = {}
+        for precision in (np.float64, np.float32):
+            handler = DataHandler(precision=precision)
+            handler.load_data(file_path)
+            handler.set_intensity_units('Absorbance')
+            handlers[precision] = handler
+
+    reference, single = handlers[np.float64], handlers[np.float32]
+    print(f'Stack memory: float64 {reference.stack.nbytes / 1024 ** 2:.1f} MB, '
+          f'float32 {single.stack.nbytes / 1024 ** 2:.1f} MB')
+    print(f'{"Stage":<32} {"max abs error":>14} {"max rel error":>14}')
+
+    def report(stage):
+        expected, actual = reference.data_txt[:, 1:], single.data_txt[:, 1:].astype(np.float64)
+        error = np.abs(actual - expected)
+        scale = np.max(np.abs(expected))
+        print(f'{stage:<32} {error.max():>14.3e} {error.max() / scale:>14.3e}')
+
+    report('Conversion to optical depth')
+    for method in SMOOTH_METHODS[1:]:
+        for handler in (reference, single):
+            handler.smooth(method, 7)
+        report(f'Smoothing: {method}')
+    for handler in (reference, single):
+        handler.subtract_baseline([3900, 2500, 1800, 500], use_smoothing=True)
+    report('Baseline after smoothing')
+
+
+if __name__ == '__main__':
+    main()
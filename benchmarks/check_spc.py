@@ -0,0 +1,114 @@
+'''
+Round-trip check of the SPC reader on multifile, float and scaled-integer layouts.
+
+Writes synthetic spectra as new-format (0x4B) SPC files: multifiles with float,
+32-bit and 16-bit scaled-integer y values, a single spectrum with the exponent of
+the main header, a shared x array (TXVALS) and subfiles with their own x values
+(TXYXYS). Every file is read back with sniff_file and read_numeric and compared to
+the values stored, as the reader scales them.
+
+Usage:
+    python benchmarks/check_spc.py --points 5000 --spectra 4
+'''
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from io_module import sniff_file, read_numeric  # noqa: E402
+from spc_module import (MAIN_HEADER, SUB_HEADER, NEW_FORMAT, TSPREC, TMULTI, TXYXYS, TXVALS,  # noqa: E402
+                        FLOAT_EXPONENT)
+
+
+def encode_y(y_data, y_type) -> tuple[int, np.ndarray, np.ndarray]:
+    '''Exponent, stored values and values as read back of one spectrum.'''
+    if y_type == 'float':
+        stored = y_data.astype('<f4')
+        return FLOAT_EXPONENT, stored, stored.astype(np.float64)
+    dtype, bits = ('<i2', 16) if y_type == 'int16' else ('<i4', 32)
+    exponent = int(np.ceil(np.log2(np.abs(y_data).max()))) + 2
+    scale = 2.0 ** (exponent - bits)
+    stored = np.round(y_data / scale).astype(dtype)
+    return exponent, stored, stored * scale
+
+
+def write_spc(file_path, x_data, y_columns, y_type, flags) -> np.ndarray:
+    '''Write an SPC file and return the data the reader should give, x values in column 0.'''
+    n_points, n_spectra = y_columns.shape
+    flags |= TSPREC if y_type == 'int16' else 0
+    header = np.zeros(1, MAIN_HEADER)
+    header['ftflgs'] = flags
+    header['fversn'] = NEW_FORMAT
+    header['fnpts'] = n_points
+    header['ffirst'], header['flast'] = x_data[0], x_data[-1]
+    header['fnsub'] = n_spectra
+    header['fxtype'], header['fytype'] = 1, 2
+    header['fcmnt'] = b'round-trip check'
+
+    x_stored = x_data.astype('<f4')
+    expected = np.empty((n_points, 1 + n_spectra))
+    expected[:, 0] = x_stored if flags & (TXVALS | TXYXYS) else np.linspace(x_data[0], x_data[-1], n_points)
+    parts = []
+    for i in range(n_spectra):
+        exponent, stored, expected[:, 1 + i] = encode_y(y_columns[:, i], y_type)
+        if not flags & TMULTI:
+            header['fexp'] = exponent
+        sub_header = np.zeros(1, SUB_HEADER)
+        sub_header['subexp'] = exponent if flags & TMULTI else 0
+        sub_header['subindx'] = i
+        sub_header['subtime'] = i
+        sub_header['subnpts'] = n_points if flags & TXYXYS else 0
+        parts += [sub_header.tobytes()] + ([x_stored.tobytes()] if flags & TXYXYS else []) + [stored.tobytes()]
+
+    with open(file_path, 'wb') as f:
+        f.write(header.tobytes())
+        if flags & TXVALS and not flags & TXYXYS:
+            f.write(x_stored.tobytes())
+        f.write(b''.join(parts))
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--spectra', type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x_data = np.linspace(4000, 400, args.points)
+    bands = np.exp(-((x_data[:, np.newaxis] - rng.uniform(600, 3800, (1, args.spectra))) / 20) ** 2)
+    y_columns = rng.uniform(-2.0, 3.0, (1, args.spectra)) * bands - 0.25 + 0.01 * rng.standard_normal(bands.shape)
+
+    cases = {
+        'multifile float': ('float', TMULTI, args.spectra),
+        'multifile int32': ('int32', TMULTI, args.spectra),
+        'multifile int16': ('int16', TMULTI, args.spectra),
+        'single int32': ('int32', 0, 1),
+        'shared x float': ('float', TMULTI | TXVALS, args.spectra),
+        'own x int32': ('int32', TMULTI | TXYXYS | TXVALS, args.spectra),
+    }
+    failures = 0
+    print(f'{"Case":<18} {"spectra":>8} {"max abs error":>14}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'check.spc')
+        for name, (y_type, flags, n_spectra) in cases.items():
+            expected = write_spc(file_path, x_data, y_columns[:, :n_spectra], y_type, flags)
+            file_format = sniff_file(file_path)
+            data = read_numeric(file_path, file_format)
+            if data.shape != expected.shape or file_format.n_columns != expected.shape[1]:
+                print(f'{name:<18} FAILED: shape {data.shape}, expected {expected.shape}')
+                failures += 1
+                continue
+            error = np.abs(data - expected).max()
+            ok = error <= 1e-12 * np.abs(expected).max()
+            failures += not ok
+            print(f'{name:<18} {n_spectra:>8} {error:>14.3e}{"" if ok else "  FAILED"}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
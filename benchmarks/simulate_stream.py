@@ -0,0 +1,109 @@
+'''
+Rapid-scan instrument simulator for the streaming ingestion mode.
+
+Serves a spectrum stream on a local TCP port or Unix socket: the header with the
+wavenumber axis, then frames of a decaying band at the given rate (0 sends as fast
+as possible). Every --skip-every frames a sequence number is skipped, so the
+dropped-frame counter of the receiver can be checked.
+
+With --measure the simulator also connects a StreamReceiver in the same process
+and prints its throughput and counters, e.g. to check how many frames per second
+the ring buffer sustains with or without spilling.
+
+Usage:
+    python benchmarks/simulate_stream.py --address localhost:5555 --rate 500
+    python benchmarks/simulate_stream.py --address localhost:5555 --rate 0 --measure 5 --spill /tmp
+'''
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stream_module import StreamReceiver, pack_frame, pack_header, parse_address  # noqa: E402
+
+
+def frames(x_data, rng):
+    '''Endless kinetics of a band decaying over about a thousand frames, with noise.'''
+    band = np.exp(-0.5 * ((x_data - 2340) / 15) ** 2)
+    sequence = 0
+    while True:
+        yield sequence, band * np.exp(-sequence / 1000 % 5) + 0.01 * rng.standard_normal(x_data.size)
+        sequence += 1
+
+
+def serve(server, x_data, rate, skip_every, count, stop):
+    '''Send the stream to one client.'''
+    connection, _ = server.accept()
+    rng = np.random.default_rng(0)
+    interval = 1 / rate if rate > 0 else 0
+    next_time = time.perf_counter()
+    with connection:
+        try:
+            connection.sendall(pack_header(x_data))
+            for sequence, y_data in frames(x_data, rng):
+                if stop.is_set() or (count and sequence >= count):
+                    break
+                if skip_every and sequence % skip_every == skip_every - 1:
+                    continue
+                connection.sendall(pack_frame(sequence, y_data))
+                if interval:
+                    next_time += interval
+                    time.sleep(max(0.0, next_time - time.perf_counter()))
+        except OSError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default='localhost:5555', help='host:port or Unix socket path')
+    parser.add_argument('--points', type=int, default=3600)
+    parser.add_argument('--rate', type=float, default=500, help='frames per second, 0 for no limit')
+    parser.add_argument('--skip-every', type=int, default=0)
+    parser.add_argument('--count', type=int, default=0, help='frames to send, 0 for no limit')
+    parser.add_argument('--measure', type=float, default=0, help='seconds to receive in process')
+    parser.add_argument('--spill', default=None, help='spill directory of the measuring receiver')
+    args = parser.parse_args()
+
+    family, address = parse_address(args.address)
+    if family != socket.AF_INET and os.path.exists(address):
+        os.remove(address)
+    server = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_INET:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(address)
+    server.listen(1)
+
+    x_data = np.linspace(4000, 400, args.points)
+    stop = threading.Event()
+    print(f'Serving {args.points} points at {args.rate or "max"} frames/s on {args.address}')
+    if not args.measure:
+        try:
+            while True:
+                serve(server, x_data, args.rate, args.skip_every, args.count, stop)
+        except KeyboardInterrupt:
+            return
+        finally:
+            server.close()
+
+    sender = threading.Thread(target=serve, args=(server, x_data, args.rate, args.skip_every, args.count, stop))
+    sender.start()
+    receiver = StreamReceiver(args.address, spill_dir=args.spill)
+    receiver.start()
+    time.sleep(args.measure)
+    stats = receiver.stats()
+    stop.set()
+    receiver.stop()
+    sender.join()
+    server.close()
+
+    print(f'{stats["received"]} frames in {stats["elapsed"]:.2f} s: {stats["frames_per_s"]:.0f} frames/s, '
+          f'{stats["mb_per_s"]:.1f} MB/s, {stats["dropped"]} dropped, {stats["spilled"]} spilled')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from io_module import split_member
+
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+CACHE_MIN_BYTES = 1024 ** 2
+HASH_CHUNK_BYTES = 1024 ** 2
+
+
+def default_cache_dir() -> str:
+    '''Return the per-user directory where parsed arrays are cached.'''
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'fittingpy', 'parsed')
+
+
+def content_digest(file_path) -> str:
+    '''Hash the whole content of a file.
+
+    Hashing reads the file several times faster than parsing it, so validating
+    a hit still saves most of the load.
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    '''
+    Persistent cache of parsed arrays stored as .npy files next to a JSON index.
+
+    Entries are keyed by the absolute path of the source file and validated with its
+    size, modification time and a hash of its whole content, so a changed source is
+    re-parsed; a source that is gone drops its entry. Files are hashed outside the lock.
+    Archive members ('archive::member') are validated against their archive.
+    Hits are memory-mapped copy-on-write. The least recently used entries are evicted
+    when the cache grows over max_bytes. The public methods are thread-safe.
+
+    Attributes:
+    ----------------
+        cache_dir (str): Directory holding the cached arrays and the index.
+        max_bytes (int): Maximum total size of the cached arrays.
+        min_bytes (int): Source files smaller than this are not cached.
+        index (dict): Cache entries keyed by file name.
+
+    Methods:
+    ----------------
+        load(file_path): Return the cached array of a file or None.
+        store(file_path, data, columns): Cache the parsed array of a file, or its axis and a store of its spectra.
+        invalidate(file_path): Remove the entry of a file.
+        clear(): Remove every entry.
+    '''
+
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES, min_bytes=CACHE_MIN_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.min_bytes = min_bytes
+        self.index = {}
+        self._lock = threading.RLock()
+        self._index_path = os.path.join(self.cache_dir, 'index.json')
+        self._read_index()
+        self._evict()
+
+    def _read_index(self):
+        '''Read the index from disk, starting empty if it is missing or corrupt.'''
+        try:
+            with open(self._index_path, 'r') as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def _write_index(self):
+        '''Write the index atomically.'''
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _key(self, file_path) -> str:
+        '''Return the entry name of a source file.'''
+        abs_path = os.path.normcase(os.path.abspath(file_path))
+        return hashlib.sha1(abs_path.encode()).hexdigest() + '.npy'
+
+    def _remove(self, key):
+        '''Delete an entry and its array file.'''
+        self.index.pop(key, None)
+        try:
+            os.remove(os.path.join(self.cache_dir, key))
+        except OSError:
+            # Missing, or still memory-mapped on Windows
+            pass
+
+    def load(self, file_path) -> np.ndarray | None:
+        '''Return the cached array of a file, or None if it is missing or stale.'''
+        with self._lock:
+            key = self._key(file_path)
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            entry = dict(entry)
+
+        source = split_member(file_path)[0]
+        try:
+            stat = os.stat(source)
+            valid = (entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+                     and entry['digest'] == content_digest(source))
+        except OSError:
+            valid = False
+
+        with self._lock:
+            if self.index.get(key, {}).get('digest') != entry['digest']:
+                # Stored again meanwhile
+                return None
+            if not valid:
+                self._remove(key)
+                self._write_index()
+                return None
+
+            try:
+                data = np.load(os.path.join(self.cache_dir, key), mmap_mode='c')
+            except (OSError, ValueError):
+                self._remove(key)
+                self._write_index()
+                return None
+
+            self.index[key]['last_used'] = time.time()
+            self._write_index()
+            return data
+
+    def store(self, file_path, data: np.ndarray, columns=None) -> bool:
+        '''Cache the parsed array of a file. Returns True if the array was stored.
+
+        With columns, a SpectraStore of the spectra, data is the axis and the
+        array is written in Fortran order one column block at a time, so a file
+        parsed straight into a store is cached without assembling it in memory.
+        '''
+        source = split_member(file_path)[0]
+        stat = os.stat(source)
+        if stat.st_size < self.min_bytes:
+            return False
+        digest = content_digest(source)
+        with self._lock:
+            if columns is None:
+                shape, dtype = data.shape, data.dtype
+            else:
+                shape, dtype = (data.size, 1 + columns.n_columns), np.result_type(data, columns.buffer)
+            if np.prod(shape) * dtype.itemsize > self.max_bytes:
+                return False
+
+            key = self._key(file_path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            array_path = os.path.join(self.cache_dir, key)
+            tmp_path = array_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                if columns is None:
+                    np.save(f, np.ascontiguousarray(data))
+                else:
+                    header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': True, 'shape': shape}
+                    np.lib.format.write_array_header_1_0(f, header)
+                    f.write(np.asarray(data, dtype).tobytes())
+                    for first, last in columns.blocks(start=0):
+                        f.write(np.asarray(columns.buffer[:, first:last], dtype).tobytes('F'))
+                        columns.release()
+            try:
+                os.replace(tmp_path, array_path)
+            except OSError:
+                # The previous array is still memory-mapped on Windows
+                os.remove(tmp_path)
+                return False
+
+            self.index[key] = {
+                'path': os.path.abspath(file_path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'digest': digest,
+                'bytes': os.path.getsize(array_path),
+                'last_used': time.time(),
+            }
+            self._evict(keep=key)
+            self._write_index()
+            return True
+
+    def _evict(self, keep=None):
+        '''Drop the least recently used entries until the cache fits in max_bytes.'''
+        total = sum(entry['bytes'] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda k: self.index[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self.index[key]['bytes']
+            self._remove(key)
+
+    def invalidate(self, file_path):
+        '''Remove the entry of a file.'''
+        with self._lock:
+            key = self._key(file_path)
+            if key in self.index:
+                self._remove(key)
+                self._write_index()
+
+    def clear(self):
+        '''Remove every entry.'''
+        with self._lock:
+            for key in list(self.index):
+                self._remove(key)
+            self._write_index()
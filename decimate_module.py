@@ -0,0 +1,164 @@
+import numpy as np
+
+# Points kept per pixel column of the axes: the minimum and the maximum
+POINTS_PER_PIXEL = 2
+# Bins merged from one level of detail to the next, and rows per bin of the finest level
+LOD_FACTOR = 4
+LOD_MIN_BIN = 32
+
+
+def visible_rows(x_data, low, high) -> slice:
+    '''Rows of a monotonic axis between low and high, with one more row on each side.
+
+    The extra rows let the lines run to the edges of the view. Descending axes
+    are searched through a reversed view.
+    '''
+    low, high = min(low, high), max(low, high)
+    n = x_data.size
+    if x_data[0] <= x_data[-1]:
+        start, stop = np.searchsorted(x_data, low, 'left'), np.searchsorted(x_data, high, 'right')
+    else:
+        reversed_x = x_data[::-1]
+        start, stop = n - np.searchsorted(reversed_x, high, 'right'), n - np.searchsorted(reversed_x, low, 'left')
+    return slice(max(int(start) - 1, 0), min(int(stop) + 1, n))
+
+
+def minmax_decimate(x_data, y_data, n_bins) -> tuple[np.ndarray, np.ndarray]:
+    '''Reduce every column of y_data to the minimum and the maximum of n_bins bins of rows.
+
+    All the columns are reduced at once. Every bin gives two points, at the x of
+    its first and last row, so with one bin per pixel the lines cover the same
+    pixels as the full data and peaks keep their height. NaN are ignored. Data
+    with no more than two rows per bin is returned as it is.
+    '''
+    n_rows = x_data.size
+    if n_bins < 1 or n_rows <= POINTS_PER_PIXEL * n_bins:
+        return x_data, y_data
+
+    starts = np.arange(n_bins) * n_rows // n_bins
+    ends = np.append(starts[1:], n_rows) - 1
+    x_new = np.empty(2 * n_bins, dtype=x_data.dtype)
+    x_new[0::2] = x_data[starts]
+    x_new[1::2] = x_data[ends]
+
+    y_new = np.empty((2 * n_bins, y_data.shape[1]), dtype=y_data.dtype, order='F')
+    y_new[0::2] = np.fmin.reduceat(y_data, starts, axis=0)
+    y_new[1::2] = np.fmax.reduceat(y_data, starts, axis=0)
+    return x_new, y_new
+
+
+class MinMaxPyramid:
+    '''
+    Levels of detail of spectra on one axis: the minimum and maximum of every bin of rows.
+
+    The finest level has bins of min_bin rows and every next level merges factor
+    bins of the previous one, so all the levels together take about
+    2 / (min_bin - min_bin / factor) of the memory of the spectra. view() picks the
+    coarsest level that still has a bin per pixel of the view and reduces only
+    its bins, so zoom and pan cost the same whatever the length of the spectra.
+    Views narrower than min_bin rows per pixel are decimated from the spectra.
+
+    Attributes:
+    ----------------
+        x (numpy.ndarray): Shared axis, monotonic.
+        y (numpy.ndarray): Spectra, one per column, as passed to the last update.
+        factor (int): Number of bins merged from one level to the next.
+        levels (list): Rows per bin, minima and maxima of every level, finest first.
+
+    Methods:
+    ----------------
+        update(y_data, first, last): Recompute the levels of some columns.
+        view(low, high, n_bins): Min/max of every pixel of an x range.
+        limits(): Minimum and maximum of every spectrum.
+    '''
+
+    def __init__(self, x_data, y_data, factor=LOD_FACTOR, min_bin=LOD_MIN_BIN):
+        if factor < 2:
+            raise ValueError('The pyramid factor must be at least 2')
+        self.x = np.asarray(x_data)
+        self.factor = int(factor)
+        self.min_bin = max(int(min_bin), POINTS_PER_PIXEL + 1)
+        self.y = None
+        self.levels = []
+        self.update(y_data)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.y.shape
+
+    def _allocate(self, n_rows, n_columns):
+        '''Empty levels for spectra of n_rows, while a level has more than one bin.'''
+        self.levels = []
+        bin_rows = self.min_bin
+        while bin_rows < n_rows:
+            n_bins = -(-n_rows // bin_rows)
+            self.levels.append((bin_rows, np.empty((n_bins, n_columns), self.y.dtype, order='F'),
+                                np.empty((n_bins, n_columns), self.y.dtype, order='F')))
+            bin_rows *= self.factor
+
+    def update(self, y_data, first=0, last=None):
+        '''Recompute the levels of the columns first to last of y_data.
+
+        Only those columns are read. The levels are built again if the number of
+        rows changed, and follow a change of the number of columns; columns added
+        must be in the updated range.
+        '''
+        y_data = np.asarray(y_data)
+        if self.x.size != y_data.shape[0]:
+            raise ValueError('The axis and the spectra have different number of lines')
+        last = y_data.shape[1] if last is None else last
+        previous = self.y
+        self.y = y_data
+        if previous is None or previous.shape[0] != y_data.shape[0] or previous.dtype != y_data.dtype:
+            self._allocate(*y_data.shape)
+            first, last = 0, y_data.shape[1]
+        elif previous.shape[1] != y_data.shape[1]:
+            self.levels = [(bin_rows, _resize_columns(mins, y_data.shape[1]), _resize_columns(maxs, y_data.shape[1]))
+                           for bin_rows, mins, maxs in self.levels]
+
+        source_mins = source_maxs = y_data[:, first:last]
+        step = self.min_bin
+        for _, mins, maxs in self.levels:
+            starts = np.arange(0, source_mins.shape[0], step)
+            np.fmin.reduceat(source_mins, starts, axis=0, out=mins[:, first:last])
+            np.fmax.reduceat(source_maxs, starts, axis=0, out=maxs[:, first:last])
+            source_mins, source_maxs = mins[:, first:last], maxs[:, first:last]
+            step = self.factor
+
+    def view(self, low, high, n_bins) -> tuple[np.ndarray, np.ndarray]:
+        '''Axis and spectra reduced to the min/max of n_bins pixels between low and high, as in minmax_decimate.'''
+        rows = visible_rows(self.x, low, high)
+        n_rows = rows.stop - rows.start
+        levels = [level for level in self.levels if n_bins >= 1 and level[0] * n_bins <= n_rows]
+        if not levels:
+            return minmax_decimate(self.x[rows], self.y[rows], n_bins)
+
+        bin_rows, mins, maxs = levels[-1]
+        first_bin, last_bin = rows.start // bin_rows, -(-rows.stop // bin_rows)
+        n_level_bins = last_bin - first_bin
+        starts = np.arange(n_bins) * n_level_bins // n_bins
+        ends = np.append(starts[1:], n_level_bins)
+
+        x_new = np.empty(2 * n_bins, dtype=self.x.dtype)
+        x_new[0::2] = self.x[(first_bin + starts) * bin_rows]
+        x_new[1::2] = self.x[np.minimum((first_bin + ends) * bin_rows, self.x.size) - 1]
+        y_new = np.empty((2 * n_bins, mins.shape[1]), dtype=mins.dtype, order='F')
+        y_new[0::2] = np.fmin.reduceat(mins[first_bin:last_bin], starts, axis=0)
+        y_new[1::2] = np.fmax.reduceat(maxs[first_bin:last_bin], starts, axis=0)
+        return x_new, y_new
+
+    def limits(self) -> tuple[np.ndarray, np.ndarray]:
+        '''Minimum and maximum of every spectrum, NaN ignored, from the coarsest level.'''
+        if not self.levels:
+            with np.errstate(invalid='ignore'):
+                return np.fmin.reduce(self.y, axis=0), np.fmax.reduce(self.y, axis=0)
+        _, mins, maxs = self.levels[-1]
+        return np.fmin.reduce(mins, axis=0), np.fmax.reduce(maxs, axis=0)
+
+
+def _resize_columns(level, n_columns) -> np.ndarray:
+    '''Copy of a level with n_columns columns, the first ones kept.'''
+    resized = np.empty((level.shape[0], n_columns), level.dtype, order='F')
+    kept = min(n_columns, level.shape[1])
+    resized[:, :kept] = level[:, :kept]
+    return resized
@@ -1,17 +1,28 @@
 from tkinter import *
-from tkinter import ttk, filedialog, messagebox, scrolledtext
-<<<<<<< HEAD
-=======
-import numpy as np
-from scipy.signal import savgol_filter
-from scipy.ndimage import gaussian_filter1d
->>>>>>> 523a77b26fbbd9505ee6772a5b9fd69ea6cfb71c
+from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
+import os
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.signal import savgol_filter
-from scipy.ndimage import gaussian_filter1d
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 from logic_module_fit import DataHandler, PlotHandler, Logger
+from cache_module import ParseCache
+from io_module import collect_files
+from jobs_module import JobRunner
+from watch_module import FolderWatcher
+from stream_module import StreamReceiver, DISPLAY_FRAMES
+from project_module import PROJECT_SUFFIX
+
+STREAM_POLL_MS = 200
+
+SERIES_TYPES = [('Fittingpy series', '*.fps'), ('All files', '*.*')]
+PROJECT_TYPES = [('Fittingpy projects', f'*{PROJECT_SUFFIX}'), ('All files', '*.*')]
+FILE_TYPES = [('Data files', '*.dat *.txt *.csv'),
+              ('JCAMP-DX', '*.jdx *.dx *.jcamp'),
+              ('Instrument files', '*.spc *.[0-9] *.[0-9][0-9]'),
+              ('Fittingpy series', '*.fps'),
+              ('Compressed files', '*.gz *.bz2 *.xz'),
+              ('Archives', '*.zip *.tar *.tgz *.tbz2 *.txz'),
+              ('All files', '*.*')]
 
 class FitConfApp:
     '''
@@ -24,13 +35,36 @@ class FitConfApp:
         plot_handler (PlotHandler): Plot handler object.
         logger (Logger): Logger object.
         offset_var (DoubleVar): Variable for the offset value.
+        blit_var (BooleanVar): Whether offset and color changes redraw only the lines.
+        legend_var (BooleanVar): Whether the plot shows a legend of the spectra.
+        cache_var (BooleanVar): Whether parsed text files are kept in the parse cache.
         color_combobox (ttk.Combobox): Combobox for the color palette.
         canvas (FigureCanvasTkAgg): Canvas for the plot.
+        jobs (JobRunner): Background runner of the loads.
+        watcher (FolderWatcher): Watched folder, None when not watching.
+        stream (StreamReceiver): Connected spectrum stream, None when not streaming.
 
     Methods:
     ----------------
         create_widgets: Create the widgets for the main window.
         select_file: Select the file with the data to plot.
+        add_folder: Add every data file of a folder.
+        start_load: Read files in the background, replacing the load in progress.
+        cancel_load: Cancel the load in progress.
+        toggle_watch: Start or stop watching a folder for new or changed files.
+        poll_watch: Load the new or changed files of the watched folder.
+        apply_roi: Restrict the processing and the plot to a wavenumber window.
+        apply_undo: Undo the last change of units, smoothing, baseline or region of interest.
+        export_data: Save the workspace as a project.
+        open_project: Restore the workspace from a project.
+        export_series: Archive the processed spectra in a compact series file.
+        toggle_stream: Connect to a spectrum stream or disconnect.
+        poll_stream: Show the latest frames of the stream.
+        toggle_blit: Turn the blitted redraw of the lines on or off.
+        toggle_legend: Show or hide the legend of the spectra.
+        toggle_cache: Turn the parse cache on or off.
+        clear_cache: Delete every cached array.
+        show_picked: Show the spectrum clicked on in the plot.
         update_plot: Update the plot with the new colors.
         applied_colors: Apply the colors to the plot.
 
@@ -42,14 +76,22 @@ class FitConfApp:
         self.master.iconphoto(True, PhotoImage(file='./icon_material/FitPy_icon_32.png'))
         self.master.protocol('WM_DELETE_WINDOW', self.close_app)
 
-        self.data_handler = DataHandler()
+        self.data_handler = DataHandler(storage='auto')
         self.plot_handler = PlotHandler()
         self.logger = Logger()
+        self.jobs = JobRunner(self.master)
+        self.watcher: FolderWatcher = None
+        self.watch_after = None
+        self.stream: StreamReceiver = None
+        self.stream_after = None
 
         self.logger.log_start()
         self.log_version()
 
         self.offset_var = DoubleVar(value=0)
+        self.blit_var = BooleanVar(value=True)
+        self.legend_var = BooleanVar(value=False)
+        self.cache_var = BooleanVar(value=False)
         self.create_widgets()
 
     def __version__(self) -> str:
@@ -71,6 +113,39 @@ class FitConfApp:
         data_frame = ttk.LabelFrame(frame, text='Data')
         data_frame.pack(fill=X, pady=5)
 
+        self.progress_bar = ttk.Progressbar(data_frame, mode='determinate')
+        self.progress_bar.pack(side=BOTTOM, fill=X, padx=5, pady=5)
+
+        self.cancel_btn = ttk.Button(data_frame, text='Cancel', command=self.cancel_load, width=15)
+        self.cancel_btn.pack(side=BOTTOM, padx=5, pady=5)
+        self.cancel_btn.config(state='disabled')
+
+        self.resample_combobox = ttk.Combobox(data_frame, state='readonly', width=15)
+        self.resample_combobox['values'] = ['Linear', 'Cubic', 'Rebin', 'None']
+        self.resample_combobox.set('Linear')
+        self.resample_combobox.pack(side=BOTTOM, padx=5, pady=5)
+        #callback for resampling method change
+        self.resample_combobox.bind('<<ComboboxSelected>>', lambda e: self.set_resample_method())
+        ttk.Label(data_frame, text='Resample added files:').pack(side=BOTTOM, padx=5)
+
+        cache_frame = ttk.Frame(data_frame)
+        cache_frame.pack(side=BOTTOM, fill=X)
+        ttk.Checkbutton(cache_frame, text='Cache parsed files', variable=self.cache_var,
+                        command=self.toggle_cache).pack(side=LEFT, padx=5, pady=5)
+        ttk.Button(cache_frame, text='Clear Cache', command=self.clear_cache).pack(side=RIGHT, padx=5, pady=5)
+
+        self.stream_label = ttk.Label(data_frame, text='')
+        self.stream_label.pack(side=BOTTOM, padx=5)
+
+        self.stream_btn = ttk.Button(data_frame, text='Connect Stream', command=self.toggle_stream, width=15)
+        self.stream_btn.pack(side=BOTTOM, padx=5, pady=5)
+
+        self.watch_btn = ttk.Button(data_frame, text='Watch Folder', command=self.toggle_watch, width=15)
+        self.watch_btn.pack(side=BOTTOM, padx=5, pady=5)
+
+        self.add_folder_btn = ttk.Button(data_frame, text='Add Folder', command=self.add_folder, width=15)
+        self.add_folder_btn.pack(side=BOTTOM, padx=5, pady=5)
+
         self.load_data_btn = ttk.Button(data_frame, text='Select File', command=self.select_file, width=15)
         self.load_data_btn.pack(side=LEFT, padx= 5, pady=5)
         
@@ -86,6 +161,13 @@ class FitConfApp:
         self.offset_entry.pack(padx=10, pady=10)
         self.offset_entry.config(state='disabled')
 
+        self.offset_scale = ttk.Scale(offset_frame, from_=0, to=1, orient=HORIZONTAL, variable=self.offset_var)
+        self.offset_scale.pack(fill=X, padx=10)
+        self.offset_scale.config(state='disabled')
+
+        ttk.Checkbutton(offset_frame, text='Fast redraw', variable=self.blit_var,
+                        command=self.toggle_blit).pack(padx=10, pady=5)
+
         self.offset_var.trace_add('write', self.update_plot)
 
         # Color palette
@@ -98,11 +180,23 @@ class FitConfApp:
         self.color_combobox.pack(side=LEFT, padx=5, pady=10)
         self.color_combobox.config(state='disabled')
 
-<<<<<<< HEAD
         self.apply_color_btn = ttk.Button(color_frame, text='Apply', command=self.apply_colors)
         self.apply_color_btn.pack(side=LEFT, padx=5, pady=10)
         self.apply_color_btn.config(state='disabled')
+
+        ttk.Checkbutton(color_frame, text='Legend', variable=self.legend_var,
+                        command=self.toggle_legend).pack(side=LEFT, padx=5, pady=10)
         
+        # Region of interest
+        roi_frame = ttk.LabelFrame(frame, text='Region of Interest (cm-1)')
+        roi_frame.pack(fill=X, pady=5)
+        self.roi_low = ttk.Entry(roi_frame, width=8)
+        self.roi_low.pack(side=LEFT, padx=5, pady=5)
+        self.roi_high = ttk.Entry(roi_frame, width=8)
+        self.roi_high.pack(side=LEFT, padx=5, pady=5)
+        ttk.Button(roi_frame, text='Apply', command=self.apply_roi, width=6).pack(side=LEFT, padx=2, pady=5)
+        ttk.Button(roi_frame, text='Clear', command=self.clear_roi, width=6).pack(side=LEFT, padx=2, pady=5)
+
         # Baseline correction
         baseline_frame = ttk.LabelFrame(frame, text='Baseline Correction')
         baseline_frame.pack(fill=X, pady=5)
@@ -124,186 +218,372 @@ class FitConfApp:
         self.smooth_smt.pack(side=LEFT, padx=5, pady=10)
         #callback for smoothing parameter change
         self.smooth_smt.bind('<KeyRelease>', lambda e: self.apply_smooth())
+        ttk.Button(smooth_frame, text='Undo', command=self.apply_undo, width=6).pack(side=LEFT, padx=5, pady=10)
 
         # Version label
         version_label = ttk.Label(frame, text=self.__version__())
         version_label.config(foreground='gray')
         version_label.pack(side=BOTTOM, pady=10)
-=======
-        ttk.Button(color_frame, text='Apply', command=self.apply_colors).pack(side=LEFT, padx=5)
->>>>>>> 523a77b26fbbd9505ee6772a5b9fd69ea6cfb71c
 
         # Export data
         export_frame = ttk.LabelFrame(frame, text='Export')
         export_frame.pack(side=BOTTOM, fill=X, pady=5)
 
-        self.export_btn = ttk.Button(export_frame, text='Export Data', command=self.export_data, width=15)
-        self.export_btn.pack(padx=5, pady=5)
+        self.export_btn = ttk.Button(export_frame, text='Save Project', command=self.export_data, width=15)
+        self.export_btn.pack(side=LEFT, padx=5, pady=5)
         self.export_btn.config(state='disabled')
 
+        self.open_project_btn = ttk.Button(export_frame, text='Open Project', command=self.open_project, width=15)
+        self.open_project_btn.pack(side=RIGHT, padx=5, pady=5)
+
+        self.export_series_btn = ttk.Button(export_frame, text='Export Series', command=self.export_series, width=15)
+        self.export_series_btn.pack(side=BOTTOM, padx=5, pady=5)
+        self.export_series_btn.config(state='disabled')
+
         # Plot frame
         plot_frame = ttk.Frame(self.master)
         plot_frame.pack(side=RIGHT, fill=BOTH, expand=True, padx=10, pady=10)
 
+        # Packed first so the expanding canvas leaves it its line
+        self.pick_label = ttk.Label(plot_frame, text='')
+        self.pick_label.pack(side=BOTTOM, anchor=W)
+
         self.canvas = FigureCanvasTkAgg(self.plot_handler.fig, plot_frame)
         self.canvas.get_tk_widget().pack(fill=BOTH, expand=True)
 
         toolbar = NavigationToolbar2Tk(self.canvas, plot_frame)
         toolbar.update()
+        self.plot_handler.set_blit(self.blit_var.get())
+        self.plot_handler.on_pick = self.show_picked
 
-    def apply_baseline(self):
-        '''Apply the baseline correction.'''
-        x_data = self.data_handler.data_txt[:, 0]
-        y_data = self.data_handler.data_txt[:, 1:]
-
+    def apply_undo(self):
+        '''Undo the last change of units, smoothing, baseline or region of interest.'''
         try:
-            baseline_points = [float(i.strip()) for i in self.baseline_points.get('1.0', 'end-1c').strip().split(',')]
-            baseline_points.sort(reverse=True)
-            self.baseline_points.delete('1.0', 'end')
-            self.baseline_points.insert('1.0', ', '.join(map(str, baseline_points)))
-            baseline_points.insert(0, x_data[0])
-            self.logger.log(f'Baseline points applied: {baseline_points}')
-
-            baseline_index = [np.argmin(np.abs(x_data - point)) for point in baseline_points]
-            baseline_values = y_data[baseline_index, :]
-
-            baseline = np.zeros_like(y_data)
-
-            for i in range(baseline_values.shape[1]):
-                for index in range(1, len(baseline_index)):
-                    elements = baseline_index[index] - baseline_index[index-1]
-                    bl_y = np.linspace(baseline_values[index-1, i], baseline_values[index, i], elements)
-
-                    baseline[baseline_index[index - 1]:baseline_index[index], i] = bl_y
-                
-            # Subtract the baseline from the data
-            y_data -= baseline
-            self.data_handler.data_txt[:, 1:] = y_data
-            self.logger.log('Baseline correction applied successfully.')
-
-            self.update_plot()
-
+            recipe = self.data_handler.undo_recipe()
         except ValueError as e:
-            self.logger.log(f'Error applying baseline: {e}')
-            messagebox.showerror('Error', f'Invalid baseline points: {e}')
-
-    def apply_smooth(self):
-        '''Apply smoothing to the data.'''
-
-        if self.data_handler.data_previous is None:
-            self.data_handler.data_previous = self.data_handler.data_txt.copy()
-
-        case = self.smooth_combobox.get()
-
-        if case == 'None':
-            y_data = self.data_handler.data_previous[:, 1:]
-            self.logger.log('No smoothing applied.')
-        elif case == 'Savitzky-Golay':
-            window_size = self.smooth_smt.get()
-            if window_size % 2 == 0:
-                window_size += 1
-            window_size = max(3, window_size)  # Ensure minimum window size
-            y_data = savgol_filter(self.data_handler.data_previous[:, 1:], window_size, polyorder=2, axis=0)
-            self.logger.log(f'Savitzky-Golay smoothing applied with window size {window_size}.')
-        elif case == 'Gaussian':
-            sigma = 1.0
-            y_data = gaussian_filter1d(self.data_handler.data_previous[:, 1:], sigma=sigma, axis=0)
-            self.logger.log(f'Gaussian smoothing applied with sigma {sigma}.')
-        elif case == 'Moving Average':
-            window_size = self.smooth_smt.get()
-            if window_size < 1:
-                window_size = 1
-            y_data = np.convolve(self.data_handler.data_previous[:, 1:], np.ones(window_size)/window_size, mode='valid')
-            # Adjust the shape to match the original data
-            y_data = np.pad(y_data, (window_size//2, window_size//2), mode='edge')
-            self.logger.log(f'Moving Average smoothing applied with window size {window_size}.')
-
-        self.data_handler.data_txt[:, 1:] = y_data
-        self.logger.log('Smoothing applied successfully.')
+            self.logger.log(f'Undo: {e}')
+            messagebox.showinfo('Undo', str(e))
+            return
 
+        method, parameter = recipe['smoothing']
+        self.smooth_combobox.set(method)
+        if parameter is not None:
+            self.smooth_smt.set(parameter)
+        self.roi_low.delete(0, 'end')
+        self.roi_high.delete(0, 'end')
+        if recipe['roi']:
+            self.roi_low.insert(0, recipe['roi'][0])
+            self.roi_high.insert(0, recipe['roi'][1])
+        self.baseline_points.delete('1.0', 'end')
+        if recipe['baseline_points']:
+            self.baseline_points.insert('1.0', ', '.join(map(str, recipe['baseline_points'])))
+        self.logger.log('Undo operation applied successfully.')
         self.update_plot()
 
-
-    def apply_undo(self):
-        '''Undo the last operation.'''
-        if self.data_handler.data_previous is not None:
-            self.data_handler.data_txt = self.data_handler.data_previous.copy()
-            self.data_handler.data_previous = None
-
-            self.logger.log('Undo operation applied successfully.')
-            self.update_plot()
-        else:
-            self.logger.log('No previous data to undo.')
-            messagebox.showinfo('Undo', 'No previous data to undo.')
-        
-
     def select_file(self):
         '''Select the file with the data to plot.'''
-        file_path = filedialog.askopenfilename(filetypes=[('Data files', '*.dat'), ('All files', '*.*')])
-        self.file_path = file_path
+        file_path = filedialog.askopenfilename(filetypes=FILE_TYPES)
         if not file_path:
             self.logger.log('No file selected')
             messagebox.showerror('Error', 'No file selected')
             return
 
-        try:
-<<<<<<< HEAD
-            self.load_add_file(file_path)
-            self.convert_units()
-
-=======
-            header_lines, delimiter =self.data_handler.load_data(file_path)
-            self.logger.log(f'File loaded: {file_path =}')
-            self.logger.log(f'{header_lines=} and {delimiter=}')
-            messagebox.showinfo('File Loaded', f'{file_path.split("/")[-1]} loaded successfully.')
-            self.add_data_btn.config(state='normal')
-            self.offset_entry.config(state='normal')
-            self.color_combobox.config(state='normal')
-            self.apply_color_btn.config(state='normal')
-            num_lines = self.data_handler.data_txt[:, 1:].shape[1]
-            self.data_handler.generate_colors(self.color_combobox.get(), num_lines)
-            self.start_plot()
->>>>>>> 523a77b26fbbd9505ee6772a5b9fd69ea6cfb71c
-        except Exception as e:
-            self.logger.log(f'Failed to load file: {file_path =}')
-            self.logger.log(f'Error: {e}')
-            messagebox.showerror('Error', f'Failed to load file: {e}')
+        self.start_load(lambda job: self.data_handler.stage_data(file_path, progress=job.progress),
+                        f'Loading {file_path =}')
 
-<<<<<<< HEAD
     def add_file(self):
         '''Add a file with data to the existing data.'''
-        file_path = filedialog.askopenfilename(filetypes=[('Data files', '*.dat'), ('All files', '*.*')])
-        self.file_path = file_path
+        file_path = filedialog.askopenfilename(filetypes=FILE_TYPES)
         if not file_path:
             self.logger.log('ADD ERROR: No file selected')
             messagebox.showinfo('Attention', 'No file selected')
             return
 
+        self.start_load(lambda job: self.data_handler.stage_data(file_path, add=True, progress=job.progress),
+                        f'Adding {file_path =}')
+
+    def start_load(self, stage, description):
+        '''Run stage(job) in the background and apply the staged data when it finishes.
+
+        A new load cancels the one in progress, whose result is then discarded.
+        '''
+        if self.jobs.busy():
+            self.logger.log('Load in progress cancelled by a new load')
+        self.logger.log(description)
+        self.progress_bar.config(maximum=1, value=0)
+        self.cancel_btn.config(state='normal')
+        self.jobs.submit(stage, self.finish_load, on_error=self.fail_load, on_progress=self.show_progress,
+                         on_cancel=self.load_cancelled)
+
+    def show_progress(self, done, total):
+        '''Show the progress of the load in progress.'''
+        self.progress_bar.config(maximum=total or 1, value=done)
+
+    def end_load(self):
+        '''Reset the load controls. Called when a load is cancelled, fails or finishes.'''
+        self.progress_bar.config(value=0)
+        self.cancel_btn.config(state='disabled')
+
+    def cancel_load(self):
+        '''Cancel the load in progress.'''
+        self.jobs.cancel()
+
+    def load_cancelled(self):
+        '''Report a load that was cancelled. The loaded data is left untouched.'''
+        self.end_load()
+        self.logger.log('Load cancelled')
+
+    def fail_load(self, error):
+        '''Report a load that failed.'''
+        self.end_load()
+        self.logger.log(f'Failed to load data: {error}')
+        messagebox.showerror('Error', f'Failed to load data: {error}')
+
+    def finish_load(self, staged):
+        '''Apply the staged data of the latest load and plot it.'''
+        self.end_load()
         try:
-            self.load_add_file(file_path, add=True)
-            self.convert_units()
-        except Exception as e:
-            self.logger.log(f'Failed to add file: {file_path =}')
-            self.logger.log(f'Error: {e}')
-            messagebox.showerror('Error', f'Failed to add file: {e}')
-
-    def load_add_file(self, file_path, add: bool=False) -> int:
-        header_lines, delimiter = self.data_handler.load_data(file_path)
-        self.logger.log(f'File loaded: {file_path =}')
-        self.logger.log(f'{header_lines=} and {delimiter=}')
-        messagebox.showinfo('File Loaded', f'{file_path.split("/")[-1]} loaded successfully.')
+            self.data_handler.apply_load(staged)
+        except ValueError as e:
+            self.fail_load(e)
+            return
+
+        self.file_path = staged.file_path
+        file_name = os.path.basename(staged.file_path)
+        for warning in staged.warnings:
+            self.logger.log(f'Warning: {warning}')
+        if staged.kind == 'files':
+            self.logger.log(f'{staged.n_new} spectra added from folder')
+        else:
+            self.logger.log(f'File loaded: {staged.file_path =}')
+            self.logger.log(f'header_lines={staged.file_format.header_lines} and delimiter={staged.file_format.delimiter!r}')
+            messagebox.showinfo('File Loaded', f'{file_name} loaded successfully.')
+
         num_lines = self.data_handler.data_txt[:, 1:].shape[1]
         self.data_handler.generate_colors(self.color_combobox.get(), num_lines)
         self.update_plot()
-        if not add:
-            self.add_data_btn.config(state='normal')
-            self.offset_entry.config(state='normal')
-            self.color_combobox.config(state='normal')
-            self.apply_color_btn.config(state='normal')
-            self.export_btn.config(state='normal')
-
-        return 0
+        self.enable_data_controls()
+        self.convert_units()
+
+    def enable_data_controls(self):
+        '''Enable the controls that need loaded data.'''
+        self.add_data_btn.config(state='normal')
+        self.offset_entry.config(state='normal')
+        self.offset_scale.config(state='normal')
+        self.set_offset_range()
+        self.color_combobox.config(state='normal')
+        self.apply_color_btn.config(state='normal')
+        self.export_btn.config(state='normal')
+        self.export_series_btn.config(state='normal')
+
+    def set_resample_method(self):
+        '''Set how added files on another wavenumber grid are resampled.'''
+        method = self.resample_combobox.get()
+        self.data_handler.resample_method = None if method == 'None' else method.lower()
+        self.logger.log(f'Resample method set to: {method}')
+
+    def toggle_cache(self):
+        '''Turn the parse cache on or off; the cached arrays stay on disk until cleared.'''
+        self.data_handler.cache = ParseCache() if self.cache_var.get() else None
+        self.logger.log(f'Parse cache {"on" if self.cache_var.get() else "off"}')
+
+    def clear_cache(self):
+        '''Delete every cached array, whether the cache is on or not.'''
+        cache = self.data_handler.cache or ParseCache()
+        freed = sum(entry['bytes'] for entry in cache.index.values())
+        cache.clear()
+        self.logger.log(f'Parse cache cleared: {freed / 1024 ** 2:.1f} MB in {cache.cache_dir}')
+        messagebox.showinfo('Cache Cleared', f'{freed / 1024 ** 2:.1f} MB of cached arrays deleted.')
+
+    def add_folder(self):
+        '''Add every data file of a folder, loaded in parallel.'''
+        folder = filedialog.askdirectory()
+        if not folder:
+            self.logger.log('ADD ERROR: No folder selected')
+            messagebox.showinfo('Attention', 'No folder selected')
+            return
+
+        file_paths = collect_files(folder)
+        if not file_paths:
+            self.logger.log(f'ADD ERROR: No data files in {folder =}')
+            messagebox.showinfo('Attention', 'No data files found in the folder')
+            return
+
+        self.start_load(lambda job: self.data_handler.stage_files(file_paths, progress=job.progress),
+                        f'Adding {len(file_paths)} files from {folder =}')
     
+    def toggle_watch(self):
+        '''Start watching a folder for new or changed data files, or stop watching.'''
+        if self.watcher is not None:
+            self.stop_watch()
+            return
+
+        folder = filedialog.askdirectory()
+        if not folder:
+            self.logger.log('WATCH ERROR: No folder selected')
+            messagebox.showinfo('Attention', 'No folder selected')
+            return
+
+        self.watcher = FolderWatcher(os.path.normpath(folder))
+        # Files already loaded are only read again if they change
+        self.watcher.prime(set(self.data_handler.metadata.column('source')))
+        self.watch_btn.config(text='Stop Watching')
+        self.logger.log(f'Watching {folder =}')
+        self.poll_watch()
+
+    def stop_watch(self):
+        '''Stop watching the folder. A load in progress is left to finish.'''
+        if self.watch_after is not None:
+            self.master.after_cancel(self.watch_after)
+            self.watch_after = None
+        if self.watcher is not None:
+            self.logger.log(f'Stopped watching folder={self.watcher.folder!r}')
+        self.watcher = None
+        self.watch_btn.config(text='Watch Folder')
+
+    def poll_watch(self):
+        '''Check the watched folder and read its new or changed files in the background.
+
+        Polling waits while another load is running; the files are then picked up
+        by a later poll.
+        '''
+        self.watch_after = None
+        if self.watcher is None:
+            return
+
+        if not self.jobs.busy():
+            new, changed = self.watcher.poll()
+            if new or changed:
+                self.logger.log(f'Watch: {len(new)} new and {len(changed)} changed files')
+                self.progress_bar.config(maximum=1, value=0)
+                self.cancel_btn.config(state='normal')
+                self.jobs.submit(lambda job: self.stage_watched(new, changed, job),
+                                 lambda staged: self.finish_watch(staged, new + changed),
+                                 on_error=lambda error: self.fail_watch(error, new + changed),
+                                 on_progress=self.show_progress, on_cancel=self.end_load)
+
+        self.watch_after = self.master.after(self.watcher.poll_ms, self.poll_watch)
+
+    def stage_watched(self, new, changed, job) -> list:
+        '''Read the changed and the new files of the watched folder. Runs in the background.'''
+        staged = [self.data_handler.stage_update(file_path, job.progress) for file_path in changed]
+        if new:
+            staged.append(self.data_handler.stage_files(new, progress=job.progress))
+        return staged
+
+    def fail_watch(self, error, file_paths):
+        '''Report files of the watched folder that could not be read; they are retried once they change.'''
+        self.end_load()
+        if self.watcher is not None:
+            self.watcher.accept(file_paths)
+        self.logger.log(f'Watch: failed to load files: {error}')
+
+    def finish_watch(self, staged_loads, file_paths):
+        '''Apply the files read from the watched folder and redraw only their lines.'''
+        self.end_load()
+        first_load = self.data_handler.stack is None
+        changed_lines = []
+        for staged in staged_loads:
+            n_loaded = 0 if self.data_handler.stack is None else self.data_handler.stack.n_spectra
+            first = staged.first if staged.kind == 'update' else n_loaded
+            try:
+                self.data_handler.apply_load(staged)
+            except ValueError as e:
+                self.logger.log(f'Watch: failed to apply {staged.file_path =}: {e}')
+                continue
+            changed_lines.append((first, first + staged.n_new))
+            self.file_path = staged.file_path
+            for warning in staged.warnings:
+                self.logger.log(f'Watch: warning: {warning}')
+            self.logger.log(f'Watch: {staged.n_new} spectra {"updated" if staged.kind == "update" else "added"}')
+        if self.watcher is not None:
+            self.watcher.accept(file_paths)
+        if not changed_lines:
+            return
+
+        num_lines = self.data_handler.data_txt[:, 1:].shape[1]
+        self.data_handler.generate_colors(self.color_combobox.get(), num_lines)
+        if first_load:
+            self.update_plot()
+            self.enable_data_controls()
+            return
+
+        offset = self.offset_var.get()
+        for first, last in changed_lines:
+            if not self.plot_handler.update_lines(self.data_handler.data_txt, first, last, offset,
+                                                  self.data_handler.data_color, self.data_handler.pyramid):
+                self.update_plot()
+                break
+
+    def toggle_stream(self):
+        '''Connect to a spectrum stream (host:port or Unix socket path), or disconnect.'''
+        if self.stream is not None:
+            self.stop_stream()
+            return
+
+        address = simpledialog.askstring('Connect Stream', 'Stream address (host:port or socket path):',
+                                         initialvalue='localhost:5555')
+        if not address:
+            return
+
+        stream = StreamReceiver(address)
+        try:
+            stream.start()
+        except (OSError, ValueError) as e:
+            self.logger.log(f'STREAM ERROR: {e}')
+            messagebox.showerror('Error', f'Failed to connect to the stream: {e}')
+            return
+
+        self.stream = stream
+        self.stream_btn.config(text='Disconnect')
+        self.logger.log(f'Stream connected: {address =}')
+        self.poll_stream()
+
+    def stop_stream(self):
+        '''Disconnect the stream. The last frames shown are kept.'''
+        if self.stream_after is not None:
+            self.master.after_cancel(self.stream_after)
+            self.stream_after = None
+        if self.stream is not None:
+            self.stream.stop()
+            stats = self.stream.stats()
+            self.logger.log(f'Stream disconnected: {stats["received"]} frames received, {stats["dropped"]} dropped')
+        self.stream = None
+        self.stream_btn.config(text='Connect Stream')
+
+    def poll_stream(self):
+        '''Show frames spread over the ring of the stream, and its counters.
+
+        The frames are decimated to DISPLAY_FRAMES, so the plot costs the same at
+        any frame rate.
+        '''
+        self.stream_after = None
+        if self.stream is None:
+            return
+
+        stats = self.stream.stats()
+        self.stream_label.config(text=f'{stats["recent_frames_per_s"]:.0f} frames/s, {stats["dropped"]} dropped')
+        if not self.stream.running():
+            self.logger.log(f'Stream ended: {self.stream.error or "closed by the instrument"}')
+            self.stop_stream()
+            return
+
+        sequences, y_data = self.stream.ring.decimated(DISPLAY_FRAMES)
+        if sequences.size:
+            first_frames = self.data_handler.data_file != self.stream.address
+            n_lines = 0 if self.data_handler.stack is None else self.data_handler.stack.n_spectra
+            self.data_handler.load_frames(self.stream.ring.x, y_data, self.stream.address, sequences)
+            self.file_path = self.stream.address
+            if first_frames or n_lines != sequences.size:
+                self.data_handler.generate_colors(self.color_combobox.get(), sequences.size)
+            if first_frames or not self.plot_handler.update_lines(self.data_handler.data_txt, 0, None,
+                                                                  self.offset_var.get(), self.data_handler.data_color,
+                                                                  self.data_handler.pyramid):
+                self.update_plot()
+                self.enable_data_controls()
+
+        self.stream_after = self.master.after(STREAM_POLL_MS, self.poll_stream)
+
     def convert_units(self) -> str:
         '''Convert the intensity units to a standard unit.'''
 
@@ -323,144 +603,51 @@ class FitConfApp:
                 messagebox.showerror('Error', 'Invalid intensity unit. Please enter Absorbance, Transmittance or Optical Depth.')
                 return
             else:
-                self.data_handler.intensity_units = intensity_combobox.get()
-                if len(self.data_handler.original_data) == 0:
-                    self.data_handler.original_data = self.data_handler.convert_data_txt(self.data_handler.data_txt)
-                else:
-                    self.data_handler.original_data = self.data_handler.convert_data_txt(self.data_handler.data_txt)
+                self.data_handler.set_intensity_units(intensity_combobox.get())
                 self.logger.log(f'Intensity units set to: {self.data_handler.intensity_units}')
 
             intensity_window.destroy()
+            self.update_plot()
 
         ttk.Button(intensity_window, text='OK', command=on_close).pack(pady=10)
     
     def apply_smooth(self):
         '''Apply smoothing to the data.'''
-
-        self.data_previous = self.data_handler.original_data.copy()
-
         case = self.smooth_combobox.get()
 
-        x_data = self.data_handler.data_txt[:, 0]
+        try:
+            parameter = self.data_handler.smooth(case, int(self.smooth_smt.get()))
+        except ValueError as e:
+            self.logger.log(f'Error applying smoothing: {e}')
+            messagebox.showerror('Error', f'Failed to apply smoothing: {e}')
+            return
 
         if case == 'None':
-            y_data = self.data_previous[:, 1:]
             self.logger.log('No smoothing applied.')
-        elif case == 'Savitzky-Golay':
-            window_size = int(self.smooth_smt.get())
-            if window_size % 2 == 0:
-                window_size += 1
-            window_size = max(3, window_size)  # Ensure minimum window size
-            y_data = savgol_filter(self.data_previous[:, 1:], window_size, polyorder=2, axis=0)
-            self.logger.log(f'Savitzky-Golay smoothing applied with window size {window_size}.')
         elif case == 'Gaussian':
-            sigma = 1.0
-            y_data = gaussian_filter1d(self.data_previous[:, 1:], sigma=sigma, axis=0)
-            self.logger.log(f'Gaussian smoothing applied with sigma {sigma}.')
-        elif case == 'Moving Average':
-            window_size = int(self.smooth_smt.get())
-            if window_size < 1:
-                window_size = 1
-            # Apply moving average column-wise if multiple spectra
-            y_cols = []
-            for col in range(self.data_previous[:, 1:].shape[1]):
-                col_data = self.data_previous[:, 1 + col]
-                conv = np.convolve(col_data, np.ones(window_size) / window_size, mode='same')
-                y_cols.append(conv)
-            y_data = np.column_stack(y_cols)
-            self.logger.log(f'Moving Average smoothing applied with window size {window_size}.')
-
-        # Store the original smoothed data before baseline subtraction
-        self.data_handler.smooth_original = y_data.copy()
-
-        # By design, smoothing is applied over the original (converted) data
-        # and baseline (if present) is subtracted from the smoothed result.
-        self.data_handler.smooth_data = np.column_stack((x_data, y_data))
-
-        # If a baseline exists and matches the shape, subtract it from the smoothed data
-        if getattr(self.data_handler, 'data_baseline', None) is not None and self.data_handler.data_baseline.size and self.data_handler.data_baseline.shape == y_data.shape:
-            y_corrected = y_data - self.data_handler.data_baseline
+            self.logger.log(f'Gaussian smoothing applied with sigma {parameter}.')
         else:
-            y_corrected = y_data
-
-        # Update smooth_data and the data used by the plot (data_txt)
-        self.data_handler.smooth_data = np.column_stack((x_data, y_corrected))
-        try:
-            self.data_handler.data_txt[:, 1:] = y_corrected
-        except Exception:
-            # If shapes don't match, avoid crashing and log
-            self.logger.log('Warning: shapes mismatch when updating data_txt after smoothing.')
+            self.logger.log(f'{case} smoothing applied with window size {parameter}.')
 
         self.logger.log('Smoothing applied successfully.')
         self.update_plot()
     
     def apply_baseline(self):
         '''Apply the baseline correction.'''
-        x_data = self.data_handler.data_txt[:, 0]
 
-        # Decide source for baseline fitting: smoothed data if smoothing is selected, otherwise original data
+        # Fit on the smoothed data if smoothing is selected, otherwise on the original data
         use_smoothing = self.smooth_combobox.get() != 'None'
 
-
         try:
             points_str = self.baseline_points.get('1.0', 'end-1c').strip()
             baseline_points = [float(i.strip()) for i in points_str.split(',') if i.strip()]
-            if len(baseline_points) < 2:
-                raise ValueError('At least two baseline points are required')
-
-            # Sort ascending and ensure endpoints cover full x range
-            baseline_points.sort()
-            if baseline_points[0] > x_data[0]:
-                baseline_points.insert(0, float(x_data[0]))
-            if baseline_points[-1] < x_data[-1]:
-                baseline_points.append(float(x_data[-1]))
+            baseline_points = self.data_handler.subtract_baseline(baseline_points, use_smoothing)
 
             # Update displayed text
             self.baseline_points.delete('1.0', 'end')
             self.baseline_points.insert('1.0', ', '.join(map(str, baseline_points)))
             self.logger.log(f'Baseline points applied: {baseline_points}')
 
-            # Choose source data for baseline fitting. Use the preserved smoothed-original
-            # data if smoothing is selected, otherwise use the original converted data.
-            if use_smoothing and getattr(self.data_handler, 'smooth_original', None) is not None and self.data_handler.smooth_original.size:
-                y_source = self.data_handler.smooth_original.copy()
-            else:
-                if getattr(self.data_handler, 'original_data', None) is None or self.data_handler.original_data.size == 0:
-                    raise ValueError('No source data available for baseline fitting')
-                y_source = self.data_handler.original_data[:, 1:].copy()
-
-            baseline_index = [np.argmin(np.abs(x_data - point)) for point in baseline_points]
-            baseline_values = y_source[baseline_index, :]
-
-            baseline = np.empty_like(y_source)
-            for i in range(baseline_values.shape[1]):
-                baseline[:, i] = np.interp(x_data, x_data[baseline_index], baseline_values[:, i])
-
-            # Store baseline and subtract from the chosen (original) source so repeated
-            # applications use the unmodified original/smoothed-original data.
-            self.data_handler.data_baseline = baseline
-            y_corrected = y_source - baseline
-
-            # Update display data: always update data_txt so plots show corrected data
-            try:
-                self.data_handler.data_txt[:, 1:] = y_corrected
-            except Exception:
-                # Try a couple of fallbacks for shape mismatches
-                try:
-                    if y_corrected.ndim == 1:
-                        self.data_handler.data_txt[:, 1] = y_corrected
-                    else:
-                        self.data_handler.data_txt[:, 1:] = y_corrected.reshape(self.data_handler.data_txt[:, 1:].shape)
-                except Exception:
-                    self.logger.log('Warning: shapes mismatch when updating data_txt after baseline.')
-
-            # If smoothing was used, update smooth_data view but keep smooth_original unchanged
-            if use_smoothing and getattr(self.data_handler, 'smooth_data', None) is not None:
-                try:
-                    self.data_handler.smooth_data = np.column_stack((x_data, y_corrected))
-                except Exception:
-                    self.logger.log('Warning: shapes mismatch when updating smooth_data after baseline.')
-
             self.logger.log('Baseline correction applied successfully.')
             self.update_plot()
 
@@ -468,36 +655,184 @@ class FitConfApp:
             self.logger.log(f'Error applying baseline: {e}')
             messagebox.showerror('Error', f'Invalid baseline points: {e}')
 
-=======
->>>>>>> 523a77b26fbbd9505ee6772a5b9fd69ea6cfb71c
+    def apply_roi(self):
+        '''Restrict smoothing, baseline and the plot to the wavenumber window of the entries.'''
+        try:
+            low, high = float(self.roi_low.get()), float(self.roi_high.get())
+            kept_baseline = self.data_handler.set_roi(low, high)
+        except ValueError as e:
+            self.logger.log(f'Error applying region of interest: {e}')
+            messagebox.showerror('Error', f'Invalid region of interest: {e}')
+            return
+
+        self.logger.log(f'Region of interest set to {low} - {high} cm-1')
+        if not kept_baseline:
+            self.logger.log('Baseline removed: fewer than two of its points are in the region of interest')
+            messagebox.showinfo('Region of Interest', 'The baseline was removed: fewer than two of its points are in the region.')
+        self.update_plot()
+
+    def clear_roi(self):
+        '''Process and plot the whole wavenumber range again.'''
+        if self.data_handler.stack is None:
+            return
+        self.data_handler.clear_roi()
+        self.roi_low.delete(0, 'end')
+        self.roi_high.delete(0, 'end')
+        self.logger.log('Region of interest cleared')
+        self.update_plot()
+
+    def set_offset_range(self):
+        '''Let the offset slider go up to the largest spread of a spectrum.'''
+        y_data = self.data_handler.data_txt[:, 1:]
+        with np.errstate(invalid='ignore'):
+            spread = float(np.nanmax(np.nanmax(y_data, axis=0) - np.nanmin(y_data, axis=0))) if y_data.size else 0.0
+        self.offset_scale.config(to=spread if np.isfinite(spread) and spread > 0 else 1.0)
+
+    def toggle_blit(self):
+        '''Turn the blitted redraw of the lines on or off.'''
+        self.plot_handler.set_blit(self.blit_var.get())
+        self.logger.log(f'Fast redraw {"on" if self.plot_handler.blit else "off"}')
+
+    def spectrum_labels(self) -> list[str]:
+        '''File name of every loaded spectrum.'''
+        metadata = self.data_handler.metadata
+        return [os.path.basename(metadata.row(i).get('source', f'Spectrum {i + 1}')) for i in range(len(metadata))]
+
+    def toggle_legend(self):
+        '''Show or hide the legend of the spectra.'''
+        self.plot_handler.show_legend(self.spectrum_labels() if self.legend_var.get() else None)
+
+    def show_picked(self, indices):
+        '''Show the spectrum clicked on in the plot, and how many more are under the mouse.'''
+        index = indices[0]
+        source = self.data_handler.metadata.row(index).get('source', '') if index < len(self.data_handler.metadata) else ''
+        more = f' (+{len(indices) - 1} more)' if len(indices) > 1 else ''
+        self.pick_label.config(text=f'Spectrum {index + 1}: {os.path.basename(source)}{more}')
+        self.logger.log(f'Picked spectrum {index + 1}: {source}')
+
     def update_plot(self, *args):
         '''Update the plot with the new colors.'''
         try:
             offset = self.offset_var.get()
 
             # check if data 
-            self.plot_handler.update_plot(self.data_handler.data_txt, offset, self.file_path.split("/")[-1], self.data_handler.data_color, self.data_handler.intensity_units)
+            self.plot_handler.update_plot(self.data_handler.data_txt, offset, self.file_path.split("/")[-1], self.data_handler.data_color, self.data_handler.intensity_units,
+                                          self.data_handler.pyramid)
+            if self.legend_var.get() and len(self.plot_handler.legend_labels or []) != self.plot_handler.n_lines:
+                self.toggle_legend()
             self.logger.log(f'Plot updated with offset {offset =}')
         except Exception as e:
             self.logger.log(f'Failed to update plot: {e}')
             messagebox.showerror('Error', f'Failed to update plot: {e}')
 
     def export_data(self):
-        # Pendiente de implementar la función de exportar datos
-        self.logger.log('Export data function called')
-        messagebox.showinfo('Export Data', 'Export data function is not implemented yet.')
-        pass
+        '''Save the spectra, their processing and the state of the controls as a project.'''
+        file_path = filedialog.asksaveasfilename(defaultextension=PROJECT_SUFFIX, filetypes=PROJECT_TYPES)
+        if not file_path:
+            self.logger.log('SAVE ERROR: No file selected')
+            return
+
+        state = {
+            'title': self.file_path,
+            'offset': self.offset_var.get(),
+            'palette': self.color_combobox.get(),
+            'smoothing': self.smooth_combobox.get(),
+            'smoothing_window': self.smooth_smt.get(),
+            'baseline_points': self.baseline_points.get('1.0', 'end-1c').strip(),
+            'resample': self.resample_combobox.get(),
+        }
+        try:
+            self.data_handler.save_project(file_path, state)
+        except ValueError as e:
+            self.logger.log(f'Error saving project: {e}')
+            messagebox.showerror('Error', str(e))
+            return
+        self.logger.log(f'Project saved: {file_path =}')
+
+    def export_series(self):
+        '''Archive the processed spectra in a series file with a chosen error bound.'''
+        file_path = filedialog.asksaveasfilename(defaultextension='.fps', filetypes=SERIES_TYPES)
+        if not file_path:
+            self.logger.log('EXPORT ERROR: No file selected')
+            return
+        error_bound = simpledialog.askfloat('Export Series', 'Largest error of the stored intensities (0 for exact):',
+                                            initialvalue=1e-5, minvalue=0)
+        if error_bound is None:
+            return
+
+        def stage(job):
+            self.data_handler.export_series(file_path, error_bound, progress=job.progress)
+            return file_path
+
+        self.logger.log(f'Exporting series {file_path =} with {error_bound =}')
+        self.progress_bar.config(maximum=1, value=0)
+        self.cancel_btn.config(state='normal')
+        self.jobs.submit(stage, self.finish_export, on_error=self.fail_export, on_progress=self.show_progress,
+                         on_cancel=self.end_load)
+
+    def finish_export(self, file_path):
+        self.end_load()
+        self.logger.log(f'Series exported: {file_path =}')
+
+    def fail_export(self, error):
+        self.end_load()
+        self.logger.log(f'Error exporting series: {error}')
+        messagebox.showerror('Error', str(error))
+
+    def open_project(self):
+        '''Restore the spectra, their processing and the state of the controls from a project.'''
+        file_path = filedialog.askopenfilename(filetypes=PROJECT_TYPES)
+        if not file_path:
+            self.logger.log('OPEN ERROR: No file selected')
+            return
+
+        self.jobs.cancel()
+        try:
+            state = self.data_handler.open_project(file_path)
+        except ValueError as e:
+            self.logger.log(f'Error opening project: {e}')
+            messagebox.showerror('Error', str(e))
+            return
+
+        self.file_path = state.get('title') or file_path
+        self.color_combobox.set(state.get('palette', 'Thermometer'))
+        self.smooth_combobox.set(state.get('smoothing', 'None'))
+        self.smooth_smt.set(state.get('smoothing_window', 5))
+        self.baseline_points.delete('1.0', 'end')
+        self.baseline_points.insert('1.0', state.get('baseline_points', ''))
+        self.resample_combobox.set(state.get('resample', 'Linear'))
+        roi_range = self.data_handler.stack.roi_range or ('', '')
+        for entry, value in zip((self.roi_low, self.roi_high), roi_range):
+            entry.delete(0, 'end')
+            entry.insert(0, str(value))
+        self.logger.log(f'Project opened: {file_path =} with {self.data_handler.stack.n_spectra} spectra')
+
+        self.data_handler.generate_colors(self.color_combobox.get(), self.data_handler.stack.n_spectra)
+        self.enable_data_controls()
+        # Setting the offset redraws the plot through its trace
+        offset = state.get('offset', 0.0)
+        if offset != self.offset_var.get():
+            self.offset_var.set(offset)
+        else:
+            self.update_plot()
 
     def apply_colors(self):
         '''Apply the colors to the plot.'''
         palette = self.color_combobox.get()
         num_lines = self.data_handler.data_txt[:, 1:].shape[1] if self.data_handler.data_txt is not None else 0
         self.data_handler.generate_colors(palette, num_lines)
-        self.update_plot()
+        if self.plot_handler.n_lines == num_lines:
+            # Only the colors of the existing lines change
+            self.plot_handler.set_colors(self.data_handler.data_color)
+        else:
+            self.update_plot()
         self.logger.log(f'Colors applied: {palette =}')
 
     def close_app(self):
         '''Clear the graph and closes the application.'''
+        self.stop_watch()
+        self.stop_stream()
+        self.jobs.shutdown()
         self.logger.log_end()
         plt.close('all')  # Cierra todas las figuras de Matplotlib
         self.master.quit()
@@ -0,0 +1,488 @@
+import bz2
+import fnmatch
+import glob
+import gzip
+import importlib
+import io
+import lzma
+import os
+import re
+import tarfile
+import zipfile
+import numpy as np
+
+SNIFF_BYTES = 16 * 1024
+SNIFF_MAX_BYTES = 1024 * 1024
+COMMENT_PREFIXES = ('#', '%', '//', '!')
+DELIMITERS = (',', '\t', ';', None)
+DECIMALS = ('.', ',')
+CHUNK_BYTES = 1024 * 1024
+DATA_PATTERNS = ('*.dat', '*.txt', '*.csv', '*.jdx', '*.dx', '*.jcamp', '*.spc', '*.[0-9]', '*.[0-9][0-9]', '*.fps')
+# Modules reading formats other than delimited text, by file suffix. Each provides
+# sniff(file_path) -> FileFormat and read(file_path, file_format, progress=None), and
+# sets CACHE = False if its files are read without parsing. OPUS files are numbered
+# (.0, .1, ...) and are looked up as '.0'.
+FORMAT_READERS = {'.jdx': 'jcamp_module', '.dx': 'jcamp_module', '.jcamp': 'jcamp_module',
+                  '.spc': 'spc_module', '.0': 'opus_module', '.fps': 'series_module'}
+COMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+MEMBER_SEPARATOR = '::'
+HEADER_FIELD = re.compile(r'^[#%!/\s]*(?P<key>[A-Za-z][\w .()\[\]/-]*?)\s*[:=]\s*(?P<value>\S.*?)\s*$')
+
+
+class FileFormat:
+    '''
+    Layout of a delimited numeric file as detected by the sniffer.
+
+    Attributes:
+    ----------------
+        header_lines (int): Number of lines before the first data row.
+        delimiter (str | None): Column delimiter, None for runs of whitespace.
+        decimal (str): Decimal separator used by the numbers.
+        n_columns (int): Number of columns of the data rows.
+        dtype (numpy.dtype): Data type handed to the parser.
+        header (list): Raw header lines (comments included) without line breaks.
+        data_offset (int): Byte offset of the first data row.
+        row_bytes (float): Mean size in bytes of the sampled data rows.
+        reader (str): Module reading the file, 'text' for delimited text.
+        metadata (list): Header metadata of every spectrum, for the formats that have it.
+    '''
+
+    def __init__(self, header_lines, delimiter, decimal, n_columns, dtype=np.float64, header=None,
+                 data_offset=0, row_bytes=0.0, reader='text', metadata=None):
+        self.header_lines = header_lines
+        self.delimiter = delimiter
+        self.decimal = decimal
+        self.n_columns = n_columns
+        self.dtype = np.dtype(dtype)
+        self.header = header if header is not None else []
+        self.data_offset = data_offset
+        self.row_bytes = row_bytes
+        self.reader = reader
+        self.metadata = metadata if metadata is not None else []
+
+    def __repr__(self) -> str:
+        return (f'FileFormat(header_lines={self.header_lines}, delimiter={self.delimiter!r}, '
+                f'decimal={self.decimal!r}, n_columns={self.n_columns}, dtype={self.dtype})')
+
+
+def _split_floats(line, delimiter, decimal) -> int:
+    '''Return the number of float fields in the line, or 0 if it does not parse.'''
+    fields = line.split(delimiter)
+    if delimiter is not None:
+        fields = [field.strip() for field in fields]
+        if fields and fields[-1] == '':
+            # Trailing delimiter at the end of the row
+            fields.pop()
+    if not fields:
+        return 0
+    try:
+        for field in fields:
+            if decimal != '.':
+                if '.' in field:
+                    return 0
+                field = field.replace(decimal, '.')
+            float(field)
+    except ValueError:
+        return 0
+    return len(fields)
+
+
+def _detect_layout(lines) -> tuple[int, str, str, int] | None:
+    '''Find the header length, delimiter, decimal separator and column count of the lines.'''
+    best = None
+    best_score = (0, 0)
+
+    for delimiter in DELIMITERS:
+        for decimal in DECIMALS:
+            if decimal == delimiter:
+                continue
+
+            header_lines = None
+            n_columns = 0
+            matches = 0
+            for i, line in enumerate(lines):
+                stripped = line.strip()
+                if header_lines is None:
+                    if not stripped or stripped.startswith(COMMENT_PREFIXES):
+                        continue
+                    n_columns = _split_floats(stripped, delimiter, decimal)
+                    if n_columns:
+                        header_lines = i
+                        matches = 1
+                    continue
+                if not stripped:
+                    continue
+                if _split_floats(stripped, delimiter, decimal) != n_columns:
+                    break
+                matches += 1
+
+            if header_lines is None:
+                continue
+            score = (n_columns, matches)
+            if score > best_score:
+                best = (header_lines, delimiter, decimal, n_columns)
+                best_score = score
+
+    return best
+
+
+def sniff_file(file_path, sample_bytes=SNIFF_BYTES) -> FileFormat:
+    '''Detect the layout of a delimited numeric file reading only its first bytes.
+
+    The sample grows up to SNIFF_MAX_BYTES when the header does not fit in it.
+    Compressed files and archive members are sniffed from their decompressed stream.
+    Formats in FORMAT_READERS are sniffed by their reader.
+    '''
+    reader = format_reader(file_path)
+    if reader is not None:
+        return reader.sniff(file_path)
+
+    f, _ = open_stream(file_path)
+    with f:
+        sample = f.read(sample_bytes)
+        while True:
+            at_eof = len(sample) < sample_bytes
+            raw_lines = sample.splitlines(keepends=True)
+            if not at_eof and raw_lines:
+                # The last line of a partial read may be cut in the middle
+                raw_lines.pop()
+            lines = [line.decode('utf-8', errors='replace').rstrip('\r\n') for line in raw_lines]
+
+            layout = _detect_layout(lines)
+            if layout is not None or at_eof or sample_bytes >= SNIFF_MAX_BYTES:
+                break
+            sample += f.read(sample_bytes)
+            sample_bytes *= 2
+
+    if layout is None:
+        raise ValueError('Delimiter not found')
+
+    header_lines, delimiter, decimal, n_columns = layout
+    data_offset = sum(len(line) for line in raw_lines[:header_lines])
+    data_lines = raw_lines[header_lines:]
+    row_bytes = sum(len(line) for line in data_lines) / max(len(data_lines), 1)
+
+    header = lines[:header_lines]
+    return FileFormat(header_lines, delimiter, decimal, n_columns, header=header, data_offset=data_offset,
+                      row_bytes=row_bytes, metadata=header_metadata(header, delimiter, n_columns))
+
+
+def header_metadata(header, delimiter, n_columns) -> list[dict]:
+    '''Return the metadata of every spectrum found in the header lines of a text file.
+
+    'key: value' and 'key = value' lines are shared by all the spectra, and a line
+    with one name per column gives the LABEL of each spectrum.
+    '''
+    fields = {}
+    labels = None
+    for line in header:
+        match = HEADER_FIELD.match(line)
+        if match:
+            fields[match['key'].strip()] = match['value']
+            continue
+        names = [name.strip() for name in line.strip().lstrip('#%!/').split(delimiter)]
+        if len(names) == n_columns and all(names):
+            labels = names
+
+    if labels is None:
+        return [dict(fields) for _ in range(n_columns - 1)]
+    return [dict(fields, LABEL=label) for label in labels[1:]]
+
+
+class ChunkParseError(ValueError):
+    '''Raised when a chunk cannot be parsed by the fast path.'''
+
+
+def _translation_table(file_format: FileFormat) -> bytes | None:
+    '''Byte table mapping a decimal comma to a decimal point.'''
+    if file_format.decimal == '.':
+        return None
+    return bytes.maketrans(file_format.decimal.encode(), b'.')
+
+
+def _parse_block(block, file_format: FileFormat, table) -> np.ndarray:
+    '''Convert a block of complete rows to a 2-D array with the C tokenizer of numpy.'''
+    if table is not None:
+        block = block.translate(table)
+
+    try:
+        return np.loadtxt(io.BytesIO(block), delimiter=file_format.delimiter, dtype=file_format.dtype,
+                          usecols=range(file_format.n_columns), ndmin=2)
+    except ValueError as e:
+        raise ChunkParseError(str(e))
+
+
+def iter_chunks(f, file_format: FileFormat, size_hint=None, chunk_size=CHUNK_BYTES, progress=None):
+    '''Yield the data rows of a binary stream positioned at the first data row, one chunk at a time.
+
+    The stream is read in fixed-size chunks cut at the last line break and every
+    chunk is converted in bulk, so only one chunk of rows is held at a time.
+    progress(bytes_read, size_hint) is called after each chunk. Raises
+    ChunkParseError when a chunk does not parse.
+    '''
+    table = _translation_table(file_format)
+    n_bytes = 0
+    tail = b''
+
+    while True:
+        chunk = f.read(chunk_size)
+        block = tail + chunk
+        if chunk:
+            cut = block.rfind(b'\n')
+            if cut < 0:
+                tail = block
+                continue
+            block, tail = block[:cut], block[cut + 1:]
+        else:
+            block = block.rstrip()
+
+        if block.strip():
+            yield _parse_block(block, file_format, table)
+
+        if not chunk:
+            break
+        n_bytes += len(chunk)
+        if progress is not None:
+            progress(n_bytes, size_hint)
+
+
+def read_chunked(f, file_format: FileFormat, size_hint=None, chunk_size=CHUNK_BYTES, progress=None) -> np.ndarray:
+    '''Parse the data rows of a binary stream positioned at the first data row.
+
+    The chunks of iter_chunks are copied into an array preallocated from the size
+    hint that grows by doubling. Raises ChunkParseError when a chunk does not parse.
+    '''
+    n_columns = file_format.n_columns
+    capacity = 1024
+    if size_hint and file_format.row_bytes:
+        capacity = int(size_hint / file_format.row_bytes * 1.05) + 16
+    out = np.empty((capacity, n_columns), dtype=file_format.dtype)
+    n_rows = 0
+
+    for rows in iter_chunks(f, file_format, size_hint, chunk_size, progress):
+        if n_rows + rows.shape[0] > capacity:
+            capacity = max(2 * capacity, n_rows + rows.shape[0])
+            out.resize((capacity, n_columns), refcheck=False)
+        out[n_rows:n_rows + rows.shape[0]] = rows
+        n_rows += rows.shape[0]
+
+    if n_rows == 0:
+        raise ChunkParseError('No data rows found')
+    out.resize((n_rows, n_columns), refcheck=False)
+
+    return out
+
+
+def count_rows(file_path, file_format: FileFormat, chunk_size=CHUNK_BYTES) -> int:
+    '''Count the lines after the header of a delimited text file, an upper bound of its data rows.'''
+    n_lines = 0
+    last = b'\n'
+    f, _ = open_stream(file_path)
+    with f:
+        f.seek(file_format.data_offset)
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            n_lines += chunk.count(b'\n')
+            last = chunk[-1:]
+    return n_lines + (last != b'\n')
+
+
+def read_numeric(file_path, file_format: FileFormat, engine='chunked', progress=None) -> np.ndarray:
+    '''Read the numeric block of a file in a single pass using a sniffed format.
+
+    The chunked engine is used by default; files it cannot handle are read again
+    as a whole with np.loadtxt, which also reports the parsing error. progress is
+    handed to read_chunked. Formats in FORMAT_READERS are read by their reader.
+    Rows are returned in the order of the file, repeated x values included.
+    '''
+    if file_format.reader != 'text':
+        return importlib.import_module(file_format.reader).read(file_path, file_format, progress=progress)
+
+    if engine == 'chunked':
+        try:
+            f, size = open_stream(file_path)
+            with f:
+                f.seek(file_format.data_offset)
+                size_hint = size - file_format.data_offset if size else None
+                return read_chunked(f, file_format, size_hint, progress=progress)
+        except ChunkParseError:
+            pass
+
+    return _read_loadtxt(file_path, file_format)
+
+
+def _read_loadtxt(file_path, file_format: FileFormat) -> np.ndarray:
+    '''Read the numeric block of a file with np.loadtxt.'''
+    kwargs = {
+        'delimiter': file_format.delimiter,
+        'skiprows': file_format.header_lines,
+        'dtype': file_format.dtype,
+        'usecols': range(file_format.n_columns),
+        'ndmin': 2,
+    }
+    if file_format.decimal != '.':
+        decimal = file_format.decimal
+        kwargs['converters'] = lambda value: float(value.replace(decimal, '.'))
+
+    f, _ = open_stream(file_path)
+    with io.TextIOWrapper(f, encoding='utf-8', errors='replace') as text:
+        return np.loadtxt(text, **kwargs)
+
+
+class _ArchiveStream(io.BufferedReader):
+    '''Buffered stream of an archive member that closes the archive with it.'''
+
+    def __init__(self, raw, archive):
+        super().__init__(raw)
+        self._archive = archive
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._archive.close()
+
+
+def split_member(file_path) -> tuple[str, str | None]:
+    '''Split an 'archive::member' path into the archive path and the member name.'''
+    archive, separator, member = file_path.partition(MEMBER_SEPARATOR)
+    return (archive, member) if separator else (file_path, None)
+
+
+def is_archive(file_path) -> bool:
+    '''Return True for zip and tar archives, compressed or not.'''
+    return MEMBER_SEPARATOR not in file_path and file_path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def data_suffix(file_path) -> str:
+    '''Return the lower-case suffix of a data file, ignoring a compression suffix.'''
+    name = split_member(file_path)[1] or file_path
+    stem, suffix = os.path.splitext(os.path.basename(name).lower())
+    if suffix in COMPRESSORS:
+        suffix = os.path.splitext(stem)[1]
+    return suffix
+
+
+def format_reader(file_path):
+    '''Return the reader module of a file from FORMAT_READERS, None for delimited text.'''
+    suffix = data_suffix(file_path)
+    if suffix[1:].isdigit():
+        suffix = '.0'
+    module = FORMAT_READERS.get(suffix)
+    return None if module is None else importlib.import_module(module)
+
+
+def cacheable(file_format: FileFormat) -> bool:
+    '''Return False for the formats read without parsing, which gain nothing from the cache.'''
+    return file_format.reader == 'text' or getattr(importlib.import_module(file_format.reader), 'CACHE', True)
+
+
+def map_buffer(file_path) -> np.ndarray:
+    '''Return the bytes of a file as a read-only uint8 array.
+
+    Plain files are memory-mapped, so the arrays viewed on the buffer with
+    np.frombuffer read the file without copies. Compressed files and archive
+    members are decompressed in memory.
+    '''
+    if split_member(file_path)[1] is None and os.path.splitext(file_path)[1].lower() not in COMPRESSORS:
+        return np.memmap(file_path, dtype=np.uint8, mode='r')
+    f, _ = open_stream(file_path)
+    with f:
+        return np.frombuffer(f.read(), dtype=np.uint8)
+
+
+def _gzip_size(file_path) -> int | None:
+    '''Uncompressed size stored in the trailer of a gzip file (modulo 4 GB).'''
+    with open(file_path, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        return int.from_bytes(f.read(4), 'little') or None
+
+
+def open_stream(file_path) -> tuple[io.BufferedIOBase, int | None]:
+    '''Open a data file as a binary stream, decompressing it on the fly.
+
+    Handles plain files, .gz/.bz2/.xz files and 'archive::member' paths of zip and
+    tar archives. Nothing is written to disk. Returns the stream and the size of the
+    decompressed data, None if it is not known without reading it.
+    '''
+    archive_path, member = split_member(file_path)
+    if member is not None:
+        if zipfile.is_zipfile(archive_path):
+            archive = zipfile.ZipFile(archive_path)
+            info = archive.getinfo(member)
+            return _ArchiveStream(archive.open(info), archive), info.file_size
+        archive = tarfile.open(archive_path)
+        info = archive.getmember(member)
+        return _ArchiveStream(archive.extractfile(info), archive), info.size
+
+    suffix = os.path.splitext(file_path)[1].lower()
+    if suffix in COMPRESSORS:
+        size = _gzip_size(file_path) if suffix == '.gz' else None
+        return COMPRESSORS[suffix](file_path, 'rb'), size
+    return open(file_path, 'rb'), os.path.getsize(file_path)
+
+
+def _matches(name, patterns) -> bool:
+    '''Return True if a file name matches a pattern, compressed or not.'''
+    name = name.lower()
+    stem, suffix = os.path.splitext(name)
+    if suffix in COMPRESSORS:
+        name = stem
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def archive_members(archive_path, patterns=DATA_PATTERNS) -> list[str]:
+    '''Return the 'archive::member' paths of the data files of an archive, naturally sorted.'''
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            names = [info.filename for info in archive.infolist() if not info.is_dir()]
+    else:
+        with tarfile.open(archive_path) as archive:
+            names = [info.name for info in archive.getmembers() if info.isfile()]
+
+    names = [name for name in names if _matches(os.path.basename(name), patterns)]
+    names.sort(key=lambda name: natural_key(os.path.basename(name)))
+    return [archive_path + MEMBER_SEPARATOR + name for name in names]
+
+
+def expand_archives(file_paths, patterns=DATA_PATTERNS) -> list[str]:
+    '''Replace the archives of a list of files with their data members, keeping the order.'''
+    expanded = []
+    for file_path in file_paths:
+        expanded.extend(archive_members(file_path, patterns) if is_archive(file_path) else [file_path])
+    return expanded
+
+
+def parse_file(file_path) -> tuple[FileFormat, np.ndarray]:
+    '''Sniff and read a file. Used as the worker of bulk loads.'''
+    file_format = sniff_file(file_path)
+    return file_format, read_numeric(file_path, file_format)
+
+
+def natural_key(text) -> list:
+    '''Sort key ordering the digit runs of a string by their numeric value.'''
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', text)]
+
+
+def collect_files(source, patterns=DATA_PATTERNS, sort_key=None) -> list[str]:
+    '''Return the data files of a folder, archive or glob in a deterministic order.
+
+    Compressed data files are included. Files are naturally sorted by name unless a
+    sort_key(file_path) is given.
+    '''
+    if is_archive(source) and os.path.isfile(source):
+        members = archive_members(source, patterns)
+        return members if sort_key is None else sorted(members, key=sort_key)
+
+    if os.path.isdir(source):
+        paths = {path for path in glob.glob(os.path.join(source, '*')) if _matches(os.path.basename(path), patterns)}
+    else:
+        paths = set(glob.glob(source))
+
+    paths = [path for path in paths if os.path.isfile(path)]
+    if sort_key is None:
+        return sorted(paths, key=lambda path: natural_key(os.path.basename(path)))
+    return sorted(paths, key=sort_key)
@@ -0,0 +1,306 @@
+import re
+import numpy as np
+from io_module import FileFormat, open_stream
+from resample_module import axes_match, resample
+
+DATA_LABELS = ('XYDATA', 'XYPOINTS', 'PEAKTABLE')
+
+# ASDF characters: SQZ starts a value, DIF is a difference to the previous value, DUP repeats it
+SQZ_DIGITS = {'@': 0, **{c: i + 1 for i, c in enumerate('ABCDEFGHI')}, **{c: -i - 1 for i, c in enumerate('abcdefghi')}}
+DIF_DIGITS = {'%': 0, **{c: i + 1 for i, c in enumerate('JKLMNOPQR')}, **{c: -i - 1 for i, c in enumerate('jklmnopqr')}}
+DUP_DIGITS = {**{c: i + 1 for i, c in enumerate('STUVWXYZ')}, 's': 9}
+ABSOLUTE, DIFFERENCE, DUPLICATE = 0, 1, 2
+SEPARATORS = b' \t\r\n,;'
+
+COMMENT_PATTERN = re.compile(r'\$\$.*')
+COMPRESSED_PATTERN = re.compile(r'[@A-DF-Za-df-s%]')
+EXPONENT_PATTERN = re.compile(r'[0-9.][Ee][+-]?[0-9]')
+# Variables of a point table form, e.g. XYW in (XYW..XYW)
+POINT_FORM_PATTERN = re.compile(r'\(\s*(?P<variables>[A-Za-z]+)\s*\.\.')
+
+
+def _byte_tables() -> tuple[np.ndarray, ...]:
+    '''Lookup tables indexed by byte value.
+
+    They give whether a byte starts a token, its kind and sign, and the byte it is
+    replaced with so the tokens become plain numbers; separators become spaces.
+    '''
+    leading = np.zeros(256, dtype=bool)
+    kind = np.full(256, ABSOLUTE, dtype=np.int8)
+    sign = np.ones(256)
+    digit = np.arange(256, dtype=np.uint8)
+    for table, table_kind in ((SQZ_DIGITS, ABSOLUTE), (DIF_DIGITS, DIFFERENCE), (DUP_DIGITS, DUPLICATE)):
+        for char, value in table.items():
+            leading[ord(char)] = True
+            kind[ord(char)] = table_kind
+            sign[ord(char)] = -1 if value < 0 else 1
+            digit[ord(char)] = ord(str(abs(value)))
+    leading[[ord('+'), ord('-'), ord('?')]] = True
+    digit[ord('?')] = ord('0')
+
+    separator = np.zeros(256, dtype=bool)
+    separator[list(SEPARATORS)] = True
+    digit[separator] = ord(' ')
+    affn_digit = np.arange(256, dtype=np.uint8)
+    affn_digit[separator] = ord(' ')
+    affn_digit[ord('?')] = ord('0')
+    return leading, kind, sign, digit, separator, affn_digit
+
+
+LEADING, LEAD_KIND, LEAD_SIGN, DIGIT_BYTES, SEPARATOR, AFFN_BYTES = _byte_tables()
+
+
+def normalize_label(label) -> str:
+    '''Label of a JCAMP-DX record without the spaces, hyphens, slashes and underscores.'''
+    return re.sub(r'[\s\-/_]', '', label).upper()
+
+
+def _record_spans(text) -> list[tuple[int, int]]:
+    '''Start of the line and of the label of every labelled data record.
+
+    The ## markers are searched with str.find, which skips the data tables much
+    faster than a multiline regular expression.
+    '''
+    spans = []
+    position = text.find('##')
+    while position >= 0:
+        line_start = text.rfind('\n', 0, position) + 1
+        if not text[line_start:position].strip(' \t'):
+            spans.append((line_start, position + 2))
+        position = text.find('##', position + 2)
+    return spans
+
+
+def _records(text, tables=True) -> list[tuple[str, str]]:
+    '''Split a JCAMP-DX text into (label, value) labelled data records.
+
+    Without tables, the value of a data record stops after its first line, the
+    form of the table, and the table itself is never copied.
+    '''
+    records = []
+    spans = _record_spans(text)
+    for (_, label_start), end in zip(spans, [line_start for line_start, _ in spans[1:]] + [len(text)]):
+        equals = text.find('=', label_start, end)
+        if equals < 0:
+            records.append((normalize_label(text[label_start:end]), ''))
+            continue
+        label = normalize_label(text[label_start:equals])
+        if not tables and label in DATA_LABELS:
+            line_end = text.find('\n', equals, end)
+            end = end if line_end < 0 else line_end + 1
+        records.append((label, text[equals + 1:end]))
+    return records
+
+
+def _value(value) -> str:
+    '''Text of a record value without comments and surrounding whitespace.'''
+    return COMMENT_PATTERN.sub('', value).strip()
+
+
+def _blocks(text, tables=True) -> list[tuple[dict, str, str]]:
+    '''Return the metadata, data label and data table of every block holding data.
+
+    Nested blocks of a link block are returned in the file order. Without tables
+    the data tables are left empty, which is enough to sniff the file.
+    '''
+    blocks = []
+    open_blocks = []
+    for label, value in _records(text, tables):
+        if label == 'TITLE':
+            open_blocks.append({'metadata': {}, 'data': None})
+        if not open_blocks:
+            continue
+        block = open_blocks[-1]
+        if label == 'END':
+            open_blocks.pop()
+            if block['data'] is not None:
+                blocks.append((block['metadata'], *block['data']))
+        elif label in DATA_LABELS:
+            form, _, table = value.partition('\n')
+            block['metadata'][label] = form.strip()
+            block['data'] = (label, table)
+        elif label:
+            block['metadata'][label] = _value(value)
+
+    if not blocks:
+        raise ValueError('No spectra found in the JCAMP-DX file')
+    return blocks
+
+
+def _tokens(table) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Split a data table into values, value kinds and line numbers in bulk.
+
+    The table is handled as a byte array: every leading ASDF character starts a
+    token and is replaced by its digit, and a space is inserted before it, so the
+    values are converted by numpy in one call.
+    '''
+    data = np.frombuffer(COMMENT_PATTERN.sub('', table).encode('latin-1'), dtype=np.uint8)
+    affn = EXPONENT_PATTERN.search(table) and not COMPRESSED_PATTERN.search(table)
+    # In plain AFFN numbers the E of the exponents is not SQZ and the signs do not split
+    leading = data == ord('?') if affn else LEADING[data]
+
+    separator = SEPARATOR[data]
+    after_separator = np.r_[True, separator[:-1]]
+    starts = np.flatnonzero(leading | (~separator & after_separator))
+    if starts.size == 0:
+        raise ValueError('Empty JCAMP-DX data table')
+
+    replaced = AFFN_BYTES[data] if affn else DIGIT_BYTES[data]
+    spaced = np.insert(replaced, np.flatnonzero(leading & ~after_separator), ord(' '))
+    values = np.array(spaced.tobytes().split()).astype(np.float64)
+    if values.size != starts.size:
+        raise ValueError('Malformed JCAMP-DX data table')
+
+    lead = data[starts]
+    line = np.cumsum(data == ord('\n'))[starts]
+    values[lead == ord('?')] = np.nan
+    if affn:
+        return values, np.full(values.size, ABSOLUTE, dtype=np.int8), line
+    values *= LEAD_SIGN[lead]
+    return values, LEAD_KIND[lead], line
+
+
+def _expand(values, kind, line) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Repeat the DUP values and add up the DIF values of the tokens of a table.'''
+    duplicate = kind == DUPLICATE
+    if duplicate.any():
+        repeats = np.ones(values.size, dtype=np.int64)
+        repeats[np.flatnonzero(duplicate) - 1] = values[duplicate].astype(np.int64)
+        keep = ~duplicate
+        values, kind, line = (np.repeat(a[keep], repeats[keep]) for a in (values, kind, line))
+
+    # A DIF value adds to the previous value, an absolute value starts again
+    start = np.maximum.accumulate(np.where(kind != DIFFERENCE, np.arange(values.size), 0))
+    missing = np.isnan(values)
+    cumulative = np.cumsum(np.where(missing, 0, values))
+    values = cumulative - cumulative[start] + values[start]
+    values[missing] = np.nan
+    return values, kind, line
+
+
+def decode_asdf(table) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Decode an (X++(Y..Y)) table in AFFN or compressed ASDF form (SQZ, DIF, DUP).
+
+    Returns the abscissa of every line, the index of the first ordinate of every
+    line and the ordinates, with the DIF ordinate checks removed.
+    '''
+    values, kind, line = _expand(*_tokens(table))
+
+    first = np.r_[True, line[1:] != line[:-1]]
+    last = np.r_[first[1:], True]
+    first_index, last_index = np.flatnonzero(first), np.flatnonzero(last)
+    ordinate = ~first
+
+    # The last ordinate of a line ending in DIF form is repeated at the start of the next line
+    checked = np.flatnonzero(kind[last_index[:-1]] == DIFFERENCE) + 1
+    check_index = first_index[checked] + 1
+    ordinate[check_index[check_index <= last_index[checked]]] = False
+
+    y_start = np.cumsum(ordinate)[first_index]
+    return values[first], y_start, values[ordinate]
+
+
+def _number(metadata, label, default=None) -> float | None:
+    '''Numeric value of a record, default if it is missing or not a number.'''
+    try:
+        return float(metadata[label])
+    except (KeyError, ValueError):
+        return default
+
+
+def decode_points(form, table) -> tuple[np.ndarray, np.ndarray]:
+    '''Decode a point table such as (XY..XY) or (XYW..XYW), in AFFN or compressed ASDF form.
+
+    The values are grouped by the number of variables of the form, and the X and
+    Y variables are returned; others, such as peak widths (W), are left out.
+    '''
+    match = POINT_FORM_PATTERN.match(form)
+    variables = match['variables'].upper() if match else 'XY'
+    if 'X' not in variables or 'Y' not in variables:
+        raise ValueError(f'Unsupported JCAMP-DX point table: {form}')
+
+    values = _expand(*_tokens(table))[0]
+    stride = len(variables)
+    if values.size % stride:
+        raise ValueError(f'The number of values of a {form} table is not a multiple of {stride}')
+    return values[variables.index('X')::stride], values[variables.index('Y')::stride]
+
+
+def decode_block(metadata, label, table) -> tuple[np.ndarray, np.ndarray]:
+    '''Return the x and y values of a data block scaled by XFACTOR and YFACTOR.'''
+    x_factor = _number(metadata, 'XFACTOR', 1.0)
+    y_factor = _number(metadata, 'YFACTOR', 1.0)
+
+    if label == 'XYDATA' and '++' in metadata[label]:
+        x_lines, y_start, y_data = decode_asdf(table)
+        first_x, last_x = _number(metadata, 'FIRSTX'), _number(metadata, 'LASTX')
+        if first_x is not None and last_x is not None and y_data.size > 1:
+            x_data = np.linspace(first_x, last_x, y_data.size)
+        elif x_lines.size > 1:
+            delta_x = (x_lines[-1] - x_lines[0]) / y_start[-1]
+            x_data = (x_lines[0] + delta_x * np.arange(y_data.size)) * x_factor
+        else:
+            raise ValueError('Cannot find the x values of a JCAMP-DX block')
+    else:
+        x_data, y_data = decode_points(metadata[label], table)
+        x_data = x_data * x_factor
+
+    return x_data, y_data * y_factor
+
+
+def _read_text(file_path) -> str:
+    f, _ = open_stream(file_path)
+    with f:
+        return f.read().decode('latin-1')
+
+
+def _header_lines(text) -> list[str]:
+    '''Lines of a JCAMP-DX text before its first data record.'''
+    header = []
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start)
+        end = len(text) if end < 0 else end
+        line = text[start:end].rstrip('\r')
+        if normalize_label(line.lstrip().lstrip('#').partition('=')[0]) in DATA_LABELS:
+            break
+        header.append(line)
+        start = end + 1
+    return header
+
+
+def sniff(file_path) -> FileFormat:
+    '''Read the block structure and the header metadata of a JCAMP-DX file.
+
+    Only the labelled records are parsed; the data tables are left to read().
+    '''
+    text = _read_text(file_path)
+    blocks = _blocks(text, tables=False)
+    metadata = [{key: value for key, value in block_metadata.items() if key not in DATA_LABELS}
+                for block_metadata, _, _ in blocks]
+    header = _header_lines(text)
+
+    return FileFormat(len(header), None, '.', 1 + len(blocks), header=header, reader='jcamp_module',
+                      metadata=metadata)
+
+
+def read(file_path, file_format: FileFormat = None, progress=None) -> np.ndarray:
+    '''Read every spectrum of a JCAMP-DX file, x values in column 0.
+
+    Blocks on another x grid than the first one are resampled onto it.
+    progress(done, total) is called after each block.
+    '''
+    blocks = _blocks(_read_text(file_path))
+    x_data = None
+    columns = []
+    for i, (metadata, label, table) in enumerate(blocks):
+        x_block, y_block = decode_block(metadata, label, table)
+        if x_data is None:
+            x_data = x_block
+        elif not axes_match(x_block, x_data):
+            y_block = resample(x_block, y_block, x_data, fill_value='edge')
+        columns.append(y_block)
+        if progress is not None:
+            progress(i + 1, len(blocks))
+
+    return np.column_stack([x_data] + columns)
@@ -0,0 +1,156 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_MS = 50
+
+
+class JobCancelled(Exception):
+    '''Raised inside a job when it has been cancelled.'''
+
+
+class Job:
+    '''
+    Handle of a background job, passed to the job function.
+
+    Attributes:
+    ----------------
+        generation (int): Submission number of the job in its runner.
+        cancelled (bool): True once cancel() has been called.
+
+    Methods:
+    ----------------
+        cancel(): Ask the job to stop at its next progress report.
+        progress(done, total): Report progress, raises JobCancelled if the job was cancelled.
+    '''
+
+    def __init__(self, generation, events: queue.Queue):
+        self.generation = generation
+        self._events = events
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        '''Ask the job to stop at its next progress report.'''
+        self._cancel_event.set()
+
+    def progress(self, done, total, *args):
+        '''Report progress to the Tk loop. Extra arguments are ignored.'''
+        if self.cancelled:
+            raise JobCancelled()
+        self._events.put((self, 'progress', (done, total)))
+
+
+class JobRunner:
+    '''
+    Runs jobs one at a time on a background thread and hands their results to the Tk loop.
+
+    The job function receives its Job and should report progress through job.progress,
+    which is also where a cancelled job stops. The callbacks are called from the Tk
+    thread by polling with after(). Submitting a job cancels the running one, and the
+    events of a job that is no longer the latest are dropped, so a stale job never
+    overwrites the result of a newer one.
+
+    Attributes:
+    ----------------
+        master (Tk): Window whose after() drives the polling.
+        poll_ms (int): Polling interval in milliseconds.
+        job (Job): Latest submitted job, None before the first one.
+
+    Methods:
+    ----------------
+        submit(function, on_done, on_error, on_progress, on_cancel): Run function(job) in the background.
+        cancel(): Cancel the latest job.
+        busy(): Return True while the latest job has not finished.
+        shutdown(): Cancel the latest job and stop the worker thread.
+    '''
+
+    def __init__(self, master, poll_ms=POLL_MS):
+        self.master = master
+        self.poll_ms = poll_ms
+        self.job: Job = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fittingpy-job')
+        self._events = queue.Queue()
+        self._callbacks = {}
+        self._generation = 0
+        self._polling = False
+
+    def submit(self, function, on_done, on_error=None, on_progress=None, on_cancel=None) -> Job:
+        '''Run function(job) in the background and call on_done(result) in the Tk loop.
+
+        on_error(exception), on_progress(done, total) and on_cancel() are optional.
+        '''
+        if self.job is not None:
+            self.job.cancel()
+
+        self._generation += 1
+        job = Job(self._generation, self._events)
+        self.job = job
+        self._callbacks = {'done': on_done, 'error': on_error, 'progress': on_progress, 'cancelled': on_cancel}
+        self._executor.submit(self._run, job, function)
+
+        if not self._polling:
+            self._polling = True
+            self.master.after(self.poll_ms, self._poll)
+        return job
+
+    def _run(self, job, function):
+        '''Worker side of a job: run it and post its outcome.'''
+        if job.cancelled:
+            self._events.put((job, 'cancelled', None))
+            return
+        try:
+            result = function(job)
+        except JobCancelled:
+            self._events.put((job, 'cancelled', None))
+        except Exception as e:
+            self._events.put((job, 'error', e))
+        else:
+            self._events.put((job, 'cancelled', None) if job.cancelled else (job, 'done', result))
+
+    def _poll(self):
+        '''Dispatch the events of the latest job in the Tk loop.'''
+        progress = None
+        while True:
+            try:
+                job, kind, value = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if job is not self.job:
+                # Stale job
+                continue
+            if kind == 'progress':
+                # Only the last report of a batch is shown
+                progress = value
+                continue
+
+            self.job = None
+            callback = self._callbacks.get(kind)
+            if callback is not None:
+                callback() if kind == 'cancelled' else callback(value)
+            progress = None
+
+        if progress is not None and self._callbacks.get('progress') is not None:
+            self._callbacks['progress'](*progress)
+
+        if self.job is None and self._events.empty():
+            self._polling = False
+        else:
+            self.master.after(self.poll_ms, self._poll)
+
+    def cancel(self):
+        '''Cancel the latest job. Its on_cancel is called once it stops.'''
+        if self.job is not None:
+            self.job.cancel()
+
+    def busy(self) -> bool:
+        return self.job is not None
+
+    def shutdown(self):
+        '''Cancel the latest job and stop the worker thread without waiting for it.'''
+        self.cancel()
+        self.job = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
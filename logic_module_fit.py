@@ -1,7 +1,81 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba_array
+from matplotlib.lines import Line2D
 import datetime
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 from tkinter import simpledialog
+from io_module import (FileFormat, ChunkParseError, sniff_file, read_numeric, parse_file, is_archive, expand_archives,
+                       cacheable, open_stream, iter_chunks, count_rows)
+from cache_module import ParseCache
+from stack_module import SpectraStore, MemmapSpectraStore, SpectrumStack, to_optical_depth, BLOCK_BYTES
+from resample_module import axes_match, resample, monotonic_rows, reorder_rows
+from jobs_module import JobCancelled
+from metadata_module import MetadataTable, filename_fields
+from project_module import write_project, read_project, mapped_from
+from series_module import write_series, ERROR_BOUND
+from decimate_module import MinMaxPyramid
+from watch_module import path_key
+
+STORAGE_BACKENDS = ('memory', 'memmap', 'auto')
+PRECISIONS = (np.float32, np.float64)
+MEMMAP_THRESHOLD = 256 * 1024 ** 2
+# Files parsed or waiting to be written at once by stage_files, per worker
+FILES_IN_FLIGHT = 2
+LOAD_KINDS = ('load', 'add', 'files', 'update')
+# Processing changes kept for undo_recipe
+RECIPE_HISTORY = 50
+# Above this number of spectra the plot draws them as one LineCollection
+COLLECTION_THRESHOLD = 200
+PICK_RADIUS = 5
+LEGEND_ENTRIES = 10
+
+
+class StagedLoad:
+    '''
+    Data read by DataHandler.stage_data, stage_files or stage_update, waiting to be applied.
+
+    Staging only reads and parses, so it can run on a background thread; the
+    handler state changes in DataHandler.apply_load.
+
+    Attributes:
+    ----------------
+        kind (str): 'load' replaces the data, 'add' appends data, 'files' appends files read in bulk,
+            'update' overwrites the spectra of a file read again.
+        file_path (str): Last file read.
+        file_format (FileFormat): Layout of the last file read.
+        stack (SpectrumStack): Stack to install, or the stack holding the staged columns.
+        data (numpy.ndarray): Spectra on the loaded grid, x values in column 0 ('update' only).
+        raw (SpectraStore): Raw spectra on the loaded grid in a store of their own ('add', and 'files'
+            added to loaded data).
+        n_new (int): Number of spectra read.
+        first (int): First overwritten spectrum ('update' only).
+        base (tuple): Stack and spectrum count the data was staged against.
+        records (list): Metadata of every spectrum read.
+        warnings (list): Changes made to the files read, e.g. rows sorted by wavenumber, to report.
+    '''
+
+    def __init__(self, kind, file_path, file_format, stack, data=None, n_new=0, base=(None, 0), records=(),
+                 first=0, raw=None, warnings=()):
+        if kind not in LOAD_KINDS:
+            raise ValueError(f'Unknown load kind: {kind}')
+        self.kind = kind
+        self.file_path = file_path
+        self.file_format = file_format
+        self.stack = stack
+        self.data = data
+        self.n_new = n_new
+        self.base = base
+        self.records = list(records)
+        self.first = first
+        self.raw = raw
+        self.warnings = list(warnings)
+
 
 class DataHandler:
     '''
@@ -10,105 +84,683 @@ class DataHandler:
     Attributes:
     ----------------
         data_file (str): Path to the data file.
-        data_txt (numpy.ndarray): Data from the file.
+        file_format (FileFormat): Layout of the last sniffed file.
+        cache (ParseCache): Cache of parsed arrays, None to always parse the text.
+        resample_method (str | None): Method used to put added data on the loaded grid, None to reject it.
+        storage (str): Backend of the stores: 'memory', 'memmap' or 'auto' (memmap over memmap_threshold bytes).
+        memmap_dir (str | None): Directory of the memmap files, the temporary directory if None.
+        precision (numpy.dtype): Storage precision of the intensities, float32 or float64.
+        stack (SpectrumStack): Loaded spectra with their processing recipe.
+        metadata (MetadataTable): Metadata of every spectrum: source file, header fields and file name fields.
+        filename_pattern (str | None): Regular expression whose named groups are read from the file names.
+        fit_results (dict): Arrays of fit results by name, saved with the project.
+        recipe_history (collections.deque): Recipes before the last RECIPE_HISTORY processing changes, latest last.
+        data_txt (numpy.ndarray): Processed data in the region of interest, x values in column 0, view of the stack.
+        pyramid (MinMaxPyramid): Min/max levels of detail of data_txt, used to plot it.
         data_color (dict): Dictionary with the RGB values for the colors of the lines.
         color_palettes (dict): Dictionary with the RGB values for the color palettes.
 
     Methods:
     ----------------
+        load_file(file_path): Sniff the header lines and delimiter of a file.
+        read_file(file_path): Read the numeric block of a file, through the cache if enabled.
+        read_raw(file_path): Read the axis of a file and its spectra into a store, streaming text.
         load_data(file_path): Load data from a file.
+        add_data(file_path): Add data from a file to the existing data.
+        add_files(file_paths): Load several files in parallel and add them to the data.
+        stage_data(file_path, add), stage_files(file_paths): Read files without changing the data.
+        stage_update(file_path): Read again a loaded file that changed, without changing the data.
+        load_frames(x_data, y_data, source, sequences): Show frames of a stream in place of the data.
+        save_project(file_path, state), open_project(file_path): Save or restore the whole workspace.
+        export_series(file_path, error_bound): Archive the processed spectra in a compact series file.
+        apply_load(staged): Apply staged data to the handler.
+        spectrum_records(file_path, file_format): Metadata of the spectra of a file.
+        align_data(data), align_store(x_data, raw): Resample new data onto the wavenumber grid of the loaded data.
+        set_intensity_units(units): Set the units of the loaded intensities.
+        smooth(method, window): Smooth the converted data.
+        subtract_baseline(points, use_smoothing): Fit and subtract a piecewise linear baseline.
+        set_roi(low, high), clear_roi(): Restrict the processing and data_txt to a wavenumber window.
+        undo_recipe(): Restore the processing recipe before the last change.
         generate_colors(palette, num_lines): Generate colors for the lines in the plot.
     '''
 
-    def __init__(self):
+    def __init__(self, cache: ParseCache | None = None, storage='memory', memmap_dir=None,
+                 memmap_threshold=MEMMAP_THRESHOLD, precision=np.float32):
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError(f'Unknown storage backend: {storage}')
+        if np.dtype(precision) not in PRECISIONS:
+            raise ValueError(f'Unsupported storage precision: {precision}')
         self.data_file = None
-        self.data_txt = None
-        self.data_previous = None
+        self.file_format: FileFormat = None
+        self.cache = cache
+        self.resample_method = 'linear'
+        self.storage = storage
+        self.memmap_dir = memmap_dir
+        self.memmap_threshold = memmap_threshold
+        self.precision = np.dtype(precision)
+        self.stack: SpectrumStack = None
+        self.metadata = MetadataTable()
+        self.filename_pattern = None
+        self.fit_results = {}
+        self.recipe_history = deque(maxlen=RECIPE_HISTORY)
         self.data_color = {}
         self.color_palettes = {}
-        self.original_data = np.array([])
-        self.smooth_data = np.array([])
-        self.smooth_original = np.array([])
         self.intensity_units = str()
-        self.data_baseline = np.array([])
 
     def version(self) -> str:
         return 'DataHandler version: 0.1.2'
 
-    def load_file(self, file_path) -> tuple[int, str]:
-        '''Load data from a file.
+    def new_store(self, rows, capacity, dtype=np.float64) -> SpectraStore:
+        '''Return an empty store on the configured storage backend.'''
+        nbytes = rows * capacity * np.dtype(dtype).itemsize
+        if self.storage == 'memmap' or (self.storage == 'auto' and nbytes > self.memmap_threshold):
+            return MemmapSpectraStore(rows, capacity, dtype, directory=self.memmap_dir)
+        return SpectraStore(rows, capacity, dtype)
+
+    @property
+    def data_txt(self) -> np.ndarray | None:
+        '''Zero-copy view of the processed data, x values in column 0.'''
+        return None if self.stack is None else self.stack.data
+
+    @data_txt.setter
+    def data_txt(self, data):
+        self.recipe_history.clear()
+        if data is None:
+            self.stack = None
+            self.metadata = MetadataTable()
+        else:
+            self.stack = SpectrumStack.from_array(data, self.new_store, self.intensity_units, self.precision)
+            if len(self.metadata) != self.stack.n_spectra:
+                self.metadata = MetadataTable([{}] * self.stack.n_spectra)
+
+    @property
+    def pyramid(self) -> MinMaxPyramid | None:
+        '''Min/max levels of detail of data_txt, kept up to date by the processing.'''
+        return None if self.stack is None else self.stack.pyramid
+
+    @property
+    def smooth_data(self) -> np.ndarray:
+        '''Smoothed data after baseline subtraction, which is what data_txt holds.'''
+        if self.stack is None or self.stack.smoothing[0] == 'None':
+            return np.array([])
+        return self.data_txt
+
+    def load_file(self, file_path) -> tuple[int, str | None]:
+        '''Sniff the layout of a file from its first bytes.
         
         Returns a tuple with:
             header_lines (int): Number of header lines in the file.
-            delimiter (str): Delimiter used in the file.
+            delimiter (str | None): Delimiter used in the file, None for whitespace.
+        '''
+
+        self.file_format = sniff_file(file_path)
+
+        return self.file_format.header_lines, self.file_format.delimiter
+
+    def read_file(self, file_path, file_format: FileFormat = None, progress=None) -> np.ndarray:
+        '''Read the numeric block of a sniffed file.
+
+        Cached arrays are memory-mapped instead of parsing the text again. Binary
+        formats are not cached. progress(bytes_read, total) is called while the
+        text is parsed.
         '''
+        file_format = file_format or self.file_format
+        # The cache can be switched while a load runs in the background
+        cache = self.cache if cacheable(file_format) else None
+        if cache is not None:
+            data = cache.load(file_path)
+            if data is not None:
+                return data
+
+        data = read_numeric(file_path, file_format, progress=progress)
+        if cache is not None:
+            cache.store(file_path, data)
 
-        delimiter = None
-        header_lines = 0
+        return data
 
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-            for i, line in enumerate(lines):
+    def read_raw(self, file_path, file_format: FileFormat = None, progress=None, capacity=0,
+                 warnings=None) -> tuple[np.ndarray, SpectraStore]:
+        '''Read the axis of a sniffed file in float64 and its spectra into a new store.
+
+        The store has room for capacity spectra, or just for those of the file.
+        The rows are sorted by wavenumber and repeated wavenumbers averaged if
+        needed (see monotonic_rows), which is appended to warnings.
+
+        Delimited text missing from the cache is parsed chunk by chunk straight into
+        the store, so besides the store only a chunk of rows is held in memory, and
+        then cached from the store. Other files are read as a whole with read_file
+        and copied into the store.
+        '''
+        file_format = file_format or self.file_format
+        cache = self.cache
+        data = None
+        if file_format.reader == 'text':
+            if cache is not None:
+                data = cache.load(file_path)
+            if data is None:
                 try:
-                    delimiter = ',' if ',' in line else '\t'
-                    _ = [float(value) for value in line.split(delimiter)]
-                    break
-                except ValueError:
-                    header_lines += 1
+                    x_data, raw = self._stream_raw(file_path, file_format, progress, capacity)
+                except ChunkParseError:
+                    # read_file falls back to np.loadtxt, which reports the parsing error
+                    pass
+                else:
+                    if cache is not None:
+                        cache.store(file_path, x_data, raw)
+                    return self._monotonic_store(file_path, x_data, raw, warnings)
+        if data is None:
+            data = self.read_file(file_path, file_format, progress)
+
+        raw = self.new_store(data.shape[0], max(capacity, data.shape[1] - 1), self.precision)
+        raw.append(data[:, 1:])
+        return self._monotonic_store(file_path, np.array(data[:, 0], dtype=np.float64), raw, warnings)
+
+    def _stream_raw(self, file_path, file_format: FileFormat, progress, capacity) -> tuple[np.ndarray, SpectraStore]:
+        '''Parse delimited text into a store sized from its line count; see read_raw.'''
+        n_spectra = file_format.n_columns - 1
+        rows = count_rows(file_path, file_format)
+        x_data = np.empty(rows)
+        raw = self.new_store(rows, max(capacity, n_spectra), self.precision)
+        row_bytes = n_spectra * raw.buffer.itemsize
+        n_rows = released = 0
+        f, size = open_stream(file_path)
+        with f:
+            f.seek(file_format.data_offset)
+            size_hint = size - file_format.data_offset if size else None
+            for chunk in iter_chunks(f, file_format, size_hint, progress=progress):
+                end = n_rows + chunk.shape[0]
+                if end > rows:
+                    raise ChunkParseError('The file changed while it was read')
+                x_data[n_rows:end] = chunk[:, 0]
+                raw.buffer[n_rows:end, :n_spectra] = chunk[:, 1:]
+                n_rows = end
+                if (n_rows - released) * row_bytes >= BLOCK_BYTES:
+                    raw.release()
+                    released = n_rows
+        if n_rows == 0:
+            raise ChunkParseError('No data rows found')
+        raw.n_columns = n_spectra
+        if n_rows == rows:
+            raw.release()
+            return x_data, raw
+
+        # Blank or comment lines were counted: move the rows into a store of the exact size
+        exact = self.new_store(n_rows, raw.capacity, self.precision)
+        for first, last in raw.blocks(start=0):
+            exact.write(first, raw.buffer[:n_rows, first:last])
+            raw.release()
+        exact.n_columns = n_spectra
+        return x_data[:n_rows], exact
+
+    def _monotonic(self, file_path, x_data, warnings) -> tuple[np.ndarray, np.ndarray | None, np.ndarray | None]:
+        '''Strictly monotonic axis of a file as returned by monotonic_rows, the changes appended to warnings.'''
+        x_new, order, starts = monotonic_rows(x_data)
+        if warnings is not None:
+            name = os.path.basename(file_path)
+            if order is not None:
+                warnings.append(f'{name}: rows sorted by wavenumber')
+            if starts is not None:
+                warnings.append(f'{name}: {x_data.size - x_new.size} rows repeating a wavenumber averaged')
+        return x_new, order, starts
 
-        if delimiter is None:
-            raise ValueError('Delimiter not found')
+    def _monotonic_data(self, file_path, data, warnings) -> np.ndarray:
+        '''Data of a file, x values in column 0, on a strictly monotonic axis; see _monotonic.'''
+        x_data, order, starts = self._monotonic(file_path, data[:, 0], warnings)
+        if order is None and starts is None:
+            return data
+        return np.column_stack((x_data, reorder_rows(data[:, 1:], order, starts)))
 
-        return header_lines, delimiter
+    def _monotonic_store(self, file_path, x_data, raw: SpectraStore, warnings) -> tuple[np.ndarray, SpectraStore]:
+        '''Axis and store of a file on a strictly monotonic axis, reordered column block by column block.'''
+        x_new, order, starts = self._monotonic(file_path, x_data, warnings)
+        if order is None and starts is None:
+            return x_data, raw
+        out = raw if starts is None else self.new_store(x_new.size, raw.capacity, self.precision)
+        for first, last in raw.blocks(start=0):
+            out.buffer[:, first:last] = reorder_rows(raw.buffer[:, first:last], order, starts)
+            raw.release()
+            out.release()
+        out.n_columns = raw.n_columns
+        return x_new, out
 
-    def load_data(self, file_path) -> tuple[int, str]:
+    def load_data(self, file_path) -> tuple[int, str | None]:
         '''Load data from a file.
         
         Returns a tuple with:
             header_lines (int): Number of header lines in the file.
-            delimiter (str): Delimiter used in the file.
+            delimiter (str | None): Delimiter used in the file.
 
         '''
-        header_lines, delimiter = self.load_file(file_path)
-
-        try:
-            self.data_txt = np.loadtxt(file_path, delimiter=delimiter, skiprows=header_lines)
-            self.original_data = self.convert_data(self.data_txt)
+        staged = self.stage_data(file_path)
+        self.apply_load(staged)
 
-            self.data_file = file_path
-        except Exception as e:
-            raise ValueError(f'Failed to load data: {e}')
-        
-        return header_lines, delimiter
+        return staged.file_format.header_lines, staged.file_format.delimiter
     
-    def add_data(self, file_path) -> tuple[int, str, str]:
+    def add_data(self, file_path) -> tuple[int, str | None]:
         '''Add data from a file to the existing data.
+
+        Spectra on another wavenumber grid are resampled with resample_method.
         
         Returns a tuple with:
             header_lines (int): Number of header lines in the file.
             delimiter (str): Delimiter used in the file.
 
         '''
+        staged = self.stage_data(file_path, add=True)
+        self.apply_load(staged)
+
+        return staged.file_format.header_lines, staged.file_format.delimiter
+
+    def stage_data(self, file_path, add=False, progress=None) -> StagedLoad:
+        '''Read a file to load it, or to add it if add is True, without changing the data.
 
-        if self.data_file is None:
+        Compressed files are decompressed on the fly. Every data member of a zip or tar
+        archive is read into one stack with stage_files. progress(bytes_read, total) is
+        called while the text is parsed.
+        '''
+        if add and self.data_file is None:
             raise ValueError('No data loaded yet')
-        
-        header_lines, delimiter = self.load_file(file_path)
+        if is_archive(file_path):
+            return self.stage_files([file_path], progress=progress, replace=not add)
 
+        file_format = sniff_file(file_path)
+        warnings = []
         try:
-            new_data_txt = np.loadtxt(file_path, delimiter=delimiter, skiprows=header_lines)
-            new_data_converted = self.convert_data(new_data_txt)
-            if new_data_converted.shape[0] != self.original_data.shape[0]:
-                raise ValueError('New data has different number of lines than the original data')
-            
-            self.data_txt = np.column_stack((self.data_txt, new_data_converted[:,1:]))
-            self.original_data = np.column_stack((self.original_data, new_data_converted[:,1:]))
-            self.data_file = file_path
+            x_data, raw = self.read_raw(file_path, file_format, progress, warnings=warnings)
+            if add:
+                raw = self.align_store(x_data, raw)
+                return StagedLoad('add', file_path, file_format, self.stack, n_new=raw.n_columns,
+                                  base=(self.stack, self.stack.n_spectra),
+                                  records=self.spectrum_records(file_path, file_format), raw=raw, warnings=warnings)
+
+            stack = SpectrumStack.from_raw(x_data, raw, self.new_store, self.intensity_units)
+            stack.build_pyramid()
+        except JobCancelled:
+            raise
         except Exception as e:
             raise ValueError(f'Failed to load data: {e}')
-        
-        return header_lines, delimiter
+
+        return StagedLoad('load', file_path, file_format, stack, n_new=stack.n_spectra,
+                          records=self.spectrum_records(file_path, file_format), warnings=warnings)
+
+    def apply_load(self, staged: StagedLoad):
+        '''Apply data staged by stage_data, stage_files or stage_update.
+
+        Added or updated data is rejected if the loaded spectra changed since it was staged.
+        '''
+        if staged.kind != 'load':
+            base_stack, base_spectra = staged.base
+            if base_stack is not self.stack or (base_stack is not None and base_stack.n_spectra != base_spectra):
+                raise ValueError('The loaded data changed while the files were read')
+
+        if staged.kind == 'update':
+            # Only the spectra of the file are reprocessed
+            self.stack.write_raw(staged.first, staged.data[:, 1:])
+            self.stack.refresh(staged.first, staged.first + staged.n_new)
+            self.metadata.replace(staged.first, staged.records)
+        elif staged.raw is not None:
+            self.stack.extend(staged.raw)
+        else:
+            if staged.kind == 'files':
+                staged.stack.commit(staged.n_new - staged.stack.n_spectra)
+            self.stack = staged.stack
+            self.recipe_history.clear()
+
+        if staged.kind == 'load' or staged.base[0] is None:
+            self.metadata = MetadataTable(staged.records)
+        elif staged.kind != 'update':
+            self.metadata.append(staged.records)
+        self.file_format = staged.file_format
+        self.data_file = staged.file_path
     
+    def spectrum_records(self, file_path, file_format: FileFormat) -> list[dict]:
+        '''Metadata of the spectra of a file from its sniffed header and its name.
+
+        Fields matched by filename_pattern take precedence over the header fields.
+        '''
+        n_spectra = file_format.n_columns - 1
+        headers = file_format.metadata if len(file_format.metadata) == n_spectra else [{}] * n_spectra
+        fields = filename_fields(file_path, self.filename_pattern)
+        return [{**header, **fields, 'source': file_path, 'source_column': i + 1} for i, header in enumerate(headers)]
+
+    def align_data(self, data, x_reference=None) -> np.ndarray:
+        '''Put the spectra of new data on the wavenumber grid of the loaded data.
+
+        Data on another grid is resampled with resample_method, or rejected if it is None.
+        Reference points beyond the range of the new data take its first or last value.
+        '''
+        if x_reference is None:
+            x_reference = self.stack.x
+        if axes_match(data[:, 0], x_reference):
+            return data
+        if self.resample_method is None:
+            raise ValueError('New data has a different wavenumber axis than the original data')
+
+        y_data = resample(data[:, 0], data[:, 1:], x_reference, self.resample_method, fill_value='edge')
+        return np.column_stack((x_reference, y_data))
+
+    def align_store(self, x_data, raw: SpectraStore, x_reference=None) -> SpectraStore:
+        '''Put spectra read into a store on the wavenumber grid of the loaded data, as align_data does.
+
+        Spectra on another grid are resampled column block by column block into a new store.
+        '''
+        if x_reference is None:
+            x_reference = self.stack.x
+        if axes_match(x_data, x_reference):
+            return raw
+        if self.resample_method is None:
+            raise ValueError('New data has a different wavenumber axis than the original data')
+
+        aligned = self.new_store(x_reference.size, raw.n_columns, self.precision)
+        for first, last in raw.blocks(start=0):
+            aligned.write(first, resample(x_data, raw.buffer[:, first:last], x_reference, self.resample_method,
+                                          fill_value='edge'))
+            raw.release()
+        aligned.n_columns = raw.n_columns
+        return aligned
+
+    def _parse_cached(self, file_path) -> tuple[FileFormat, np.ndarray]:
+        '''Sniff and read a file through the cache. Used as the worker of bulk loads.'''
+        file_format = sniff_file(file_path)
+        return file_format, self.read_file(file_path, file_format)
+
+    def add_files(self, file_paths, max_workers=None, use_processes=False, progress=None) -> int:
+        '''Load several files in parallel and add them to the data in the given order.
+
+        Returns the number of spectra added.
+        '''
+        staged = self.stage_files(file_paths, max_workers, use_processes, progress)
+        self.apply_load(staged)
+
+        return staged.n_new
+
+    def stage_files(self, file_paths, max_workers=None, use_processes=False, progress=None,
+                    replace=False) -> StagedLoad:
+        '''Read several files in parallel into a block allocated once for all of them.
+
+        The files are sniffed first so the block is allocated with its final size, and
+        every parsed file is resampled if needed and written straight into its columns.
+        Zip and tar archives are replaced by their data members. Without loaded data, or
+        with replace, the first file is read with read_raw and provides the wavenumber
+        grid of a new stack whose uncommitted columns are the block; otherwise the block
+        is a store of its own, appended to the loaded stack by apply_load. At most
+        FILES_IN_FLIGHT files per worker are parsed or waiting to be written at a time.
+        The loaded stack is never touched here, so this can run on a background thread.
+        progress(done, total, file_path) is called from the calling thread after each file.
+        '''
+        file_paths = expand_archives(file_paths)
+        if not file_paths:
+            raise ValueError('No files to add')
+
+        current = None if replace else self.stack
+        formats = [sniff_file(file_path) for file_path in file_paths]
+        base = current.n_spectra if current is not None else 0
+        starts = np.cumsum([base] + [file_format.n_columns - 1 for file_format in formats])
+        n_new = int(starts[-1] - base)
+        pending = iter(range(len(file_paths)))
+        warnings = []
+
+        if current is not None:
+            stack = None
+            x_reference = current.x.copy()
+            staging = self.new_store(x_reference.size, n_new, self.precision)
+        else:
+            # The first file is read ahead to fix the wavenumber grid
+            x_data, raw = self.read_raw(file_paths[next(pending)], formats[0], capacity=n_new, warnings=warnings)
+            stack = SpectrumStack.from_raw(x_data, raw, self.new_store, self.intensity_units)
+            x_reference = stack.x.copy()
+            if progress is not None:
+                progress(1, len(file_paths), file_paths[0])
+
+        max_workers = max_workers or os.cpu_count()
+        if use_processes:
+            executor, worker = ProcessPoolExecutor(max_workers), parse_file
+        else:
+            executor, worker = ThreadPoolExecutor(max_workers), self._parse_cached
+
+        with executor:
+            window = islice(pending, FILES_IN_FLIGHT * max_workers)
+            futures = {executor.submit(worker, file_paths[i]): i for i in window}
+            done = 1 if current is None else 0
+            try:
+                while futures:
+                    finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        i = futures.pop(future)
+                        try:
+                            data = self._monotonic_data(file_paths[i], future.result()[1], warnings)
+                            y_data = self.align_data(data, x_reference)[:, 1:]
+                            if stack is None:
+                                staging.write(starts[i] - base, y_data)
+                            else:
+                                stack.write_raw(starts[i], y_data)
+                        except Exception as e:
+                            raise ValueError(f'Failed to load {os.path.basename(file_paths[i])}: {e}')
+
+                        for j in islice(pending, 1):
+                            futures[executor.submit(worker, file_paths[j])] = j
+                        done += 1
+                        if progress is not None:
+                            progress(done, len(file_paths), file_paths[i])
+            except BaseException:
+                for future_left in futures:
+                    future_left.cancel()
+                raise
+
+        records = [record for file_path, file_format in zip(file_paths, formats)
+                   for record in self.spectrum_records(file_path, file_format)]
+        if replace:
+            stack.commit(n_new - stack.n_spectra)
+            stack.build_pyramid()
+            return StagedLoad('load', file_paths[-1], formats[-1], stack, n_new=n_new, records=records,
+                              warnings=warnings)
+
+        if current is None:
+            return StagedLoad('files', file_paths[-1], formats[-1], stack, n_new=n_new, records=records,
+                              warnings=warnings)
+        staging.n_columns = n_new
+        return StagedLoad('files', file_paths[-1], formats[-1], current, n_new=n_new, base=(current, base),
+                          records=records, raw=staging, warnings=warnings)
+
+    def stage_update(self, file_path, progress=None) -> StagedLoad:
+        '''Read again a loaded file that changed on disk, to overwrite its spectra in place.
+
+        The file must still hold as many spectra as were loaded from it. Its
+        spectra are found by source, compared by path_key if no source has the
+        same spelling as file_path.
+        '''
+        if self.stack is None:
+            raise ValueError('No data loaded')
+        columns = self.metadata.equal('source', file_path)
+        if columns.size == 0:
+            key = path_key(file_path)
+            columns = np.flatnonzero([bool(source) and path_key(source) == key
+                                      for source in self.metadata.column('source')])
+        if columns.size == 0:
+            raise ValueError(f'{os.path.basename(file_path)} is not loaded')
+
+        file_format = sniff_file(file_path)
+        first = int(columns[0])
+        if file_format.n_columns - 1 != columns.size or columns[-1] - first + 1 != columns.size:
+            raise ValueError(f'{os.path.basename(file_path)} no longer has {columns.size} spectra')
+
+        warnings = []
+        data = self._monotonic_data(file_path, self.read_file(file_path, file_format, progress), warnings)
+        data = self.align_data(data)
+        return StagedLoad('update', file_path, file_format, self.stack, data, columns.size,
+                          (self.stack, self.stack.n_spectra), self.spectrum_records(file_path, file_format), first,
+                          warnings=warnings)
+
+    def load_frames(self, x_data, y_data, source, sequences):
+        '''Show frames of a stream (one per column) in place of the loaded data.
+
+        While the axis and the number of frames stay the same the stack is
+        overwritten in place, keeping its processing recipe and buffers. A new
+        stack, e.g. while the ring fills, takes the recipe of the previous one;
+        its region and baseline are dropped if they do not fit the new axis.
+        '''
+        y_data = np.asarray(y_data)
+        stack = self.stack
+        if (stack is None or stack.n_spectra != y_data.shape[1] or stack.rows != len(x_data)
+                or not axes_match(stack.x, x_data)):
+            recipe = None if stack is None else stack.recipe()
+            stack = SpectrumStack(x_data, self.new_store, y_data.shape[1], self.precision)
+            stack.intensity_units = self.intensity_units
+            if recipe is not None:
+                try:
+                    stack.set_recipe(recipe)
+                except ValueError:
+                    stack.set_recipe({**recipe, 'roi': None, 'baseline_points': None})
+            stack.append(y_data)
+            self.stack = stack
+        else:
+            stack.write_raw(0, y_data)
+            stack.refresh()
+
+        self.metadata = MetadataTable([{'source': source, 'sequence': int(sequence)} for sequence in sequences])
+        self.file_format = None
+        self.data_file = source
+
+    def save_project(self, file_path, state=None):
+        '''Save the spectra, processing recipe, metadata and fit results with a GUI state.
+
+        The raw and display blocks are written as they are, so opening the project
+        needs neither parsing nor processing. Arrays memory-mapped from file_path,
+        i.e. when saving an opened project over itself, are read into memory first.
+        '''
+        if self.stack is None:
+            raise ValueError('No data loaded')
+        self.stack.load_mapped(file_path)
+        self.fit_results = {name: np.array(value) if mapped_from(value, file_path) else value
+                            for name, value in self.fit_results.items()}
+        arrays = {'x': self.stack.x, 'raw': self.stack.raw.data, 'display': self.stack.display.data}
+        arrays.update({f'fit/{name}': value for name, value in self.fit_results.items()})
+        document = {
+            'recipe': self.stack.recipe(),
+            'metadata': self.metadata.fields,
+            'data_file': self.data_file,
+            'resample_method': self.resample_method,
+            'state': state or {},
+        }
+        try:
+            write_project(file_path, arrays, document)
+        except (OSError, TypeError) as e:
+            raise ValueError(f'Failed to save the project: {e}')
+
+    def open_project(self, file_path) -> dict:
+        '''Restore the workspace saved in a project and return its GUI state.
+
+        The arrays are memory-mapped copy-on-write: nothing is read or processed
+        until it is used, and changes never reach the project file.
+        '''
+        try:
+            arrays, document = read_project(file_path)
+            stack = SpectrumStack.from_stores(arrays['x'], SpectraStore.wrap(arrays['raw']),
+                                              SpectraStore.wrap(arrays['display']), document.get('recipe'))
+            metadata = MetadataTable.from_fields(document.get('metadata', {}), stack.n_spectra)
+        except (OSError, KeyError, zipfile.BadZipFile) as e:
+            raise ValueError(f'Failed to open the project: {e}')
+
+        self.stack = stack
+        self.metadata = metadata
+        self.fit_results = {name[len('fit/'):]: array for name, array in arrays.items() if name.startswith('fit/')}
+        self.intensity_units = stack.intensity_units
+        self.resample_method = document.get('resample_method', self.resample_method)
+        self.data_file = document.get('data_file')
+        self.file_format = None
+        self.recipe_history.clear()
+        return document.get('state', {})
+
+    def export_series(self, file_path, error_bound=ERROR_BOUND, codec='zlib', progress=None):
+        '''Archive the processed spectra and their metadata in a series file (see series_module).
+
+        The stored values differ from data_txt by at most error_bound. The file can
+        be loaded back like any data file.
+        '''
+        if self.stack is None:
+            raise ValueError('No data loaded')
+        records = [self.metadata.row(i) for i in range(len(self.metadata))]
+        try:
+            write_series(file_path, self.stack.roi_x, self.stack.y, error_bound, codec, metadata=records,
+                         progress=progress)
+        except OSError as e:
+            raise ValueError(f'Failed to export the series: {e}')
+
+    def set_intensity_units(self, intensity_units):
+        '''Set the units of the loaded intensities and convert the stack to optical depth.
+
+        The raw data is kept untouched; only the recorded transform changes.
+        '''
+        if self.stack is not None:
+            self._change_recipe(self.stack.set_units, intensity_units)
+        self.intensity_units = intensity_units
+
+    def smooth(self, method, window=5, sigma=1.0) -> int | float | None:
+        '''Smooth the converted data; the current baseline stays subtracted.
+
+        Returns the parameter actually used: the window size, the sigma of the
+        Gaussian filter or None without smoothing.
+        '''
+        if self.stack is None:
+            raise ValueError('No data loaded yet')
+        return self._change_recipe(self.stack.set_smoothing, method, window, sigma)
+
+    def subtract_baseline(self, baseline_points, use_smoothing=False) -> list[float]:
+        '''Fit a piecewise linear baseline through the given wavenumbers and subtract it.
+
+        The baseline is fitted on the smoothed spectra if use_smoothing is set, otherwise
+        on the converted data. The x range ends are added to the points. Returns the
+        sorted points used.
+        '''
+        if self.stack is None:
+            raise ValueError('No source data available for baseline fitting')
+        return self._change_recipe(self.stack.set_baseline, baseline_points, use_smoothing)
+
+    def set_roi(self, low, high) -> bool:
+        '''Restrict smoothing, baseline and data_txt to the wavenumbers from low to high.
+
+        data_txt becomes a view of the rows inside the window, for ascending and
+        descending axes. Returns False if the baseline was removed because fewer
+        than two of its points fall inside the window.
+        '''
+        if self.stack is None:
+            raise ValueError('No data loaded yet')
+        return self._change_recipe(self.stack.set_roi, low, high)
+
+    def clear_roi(self) -> bool:
+        '''Process the whole wavenumber range again.'''
+        if self.stack is None:
+            raise ValueError('No data loaded yet')
+        return self._change_recipe(self.stack.clear_roi)
+
+    def _change_recipe(self, setter, *args):
+        '''Call a recipe setter of the stack, keeping the previous recipe for undo_recipe if it changed.
+
+        A change of the same fields as the last one, such as every keystroke in the
+        smoothing window, is merged into it, so undo goes back to before the whole run.
+        '''
+        previous = self.stack.recipe()
+        result = setter(*args)
+        recipe = self.stack.recipe()
+        if recipe == previous:
+            return result
+        last = self.recipe_history[-1] if self.recipe_history else None
+        if last is not None and _changed_fields(last, previous) == _changed_fields(previous, recipe):
+            if recipe == last:
+                self.recipe_history.pop()
+        else:
+            self.recipe_history.append(previous)
+        return result
+
+    def undo_recipe(self) -> dict:
+        '''Restore the processing recipe before the last change and return it.'''
+        if self.stack is None or not self.recipe_history:
+            raise ValueError('No previous processing to undo')
+        recipe = self.recipe_history[-1]
+        self.stack.set_recipe(recipe)
+        self.recipe_history.pop()
+        self.intensity_units = self.stack.intensity_units
+        return recipe
+
     def convert_data_txt(self, data) -> np.ndarray:
         data_converted = self.convert_data(data)
         return data_converted
@@ -124,30 +776,12 @@ class DataHandler:
         self.data_color = palettes.get(palette, palettes['Thermometer'])
 
     def convert_data(self, data) -> np.ndarray:
-        '''Convert the data to the format needed for the plot.'''
-        x_data = np.array(data[:, 0])
-        y_data = np.array(data[:, 1:])
-
-        
-        factor = 1
-        intensity_unit = self.intensity_units.upper()
-
-        if intensity_unit == 'ABSORBANCE':
-            # absorbance to optical depth
-            factor = np.log(10)
-        elif intensity_unit == 'TRANSMITTANCE':
-            # transmittance to optical depth
-            factor = -np.log(10)
-        elif intensity_unit == 'OPTICAL DEPTH':
-            # transmittance to optical depth
-            factor = 1
-
-        y_data = np.array(y_data) * factor
+        '''Convert the data to optical depth, x values in column 0.'''
+        data_converted = np.empty(data.shape)
+        data_converted[:, 0] = data[:, 0]
+        to_optical_depth(data[:, 1:], self.intensity_units, out=data_converted[:, 1:])
 
-        print(f'Shape of x_data: {x_data.shape}')
-        print(f'Shape of y_data: {y_data.shape}')
-
-        return np.column_stack((x_data, y_data))
+        return data_converted
 
 class PlotHandler:
     '''
@@ -157,12 +791,27 @@ class PlotHandler:
     ----------------
         fig (matplotlib.figure.Figure): Figure object.
         ax (matplotlib.axes.Axes): Axes object.
-        lines (list): List with the lines in the plot.
+        lines (list): Line of every spectrum, None when they are drawn as a collection.
+        collection (LineCollection): All the spectra as one artist, None when they are drawn as lines.
+        collection_threshold (int): Number of spectra above which they are drawn as a collection.
+        n_lines (int): Number of spectra plotted.
+        blit (bool): Whether offset, color and visibility changes redraw only the lines.
+        decimate (bool): Whether the lines get the min/max of every pixel of the view instead of every point.
+        on_pick (callable): Called with the indices of the spectra clicked on, None to ignore clicks.
+        legend_labels (list | None): Labels of the spectra in the legend, None without legend.
 
     Methods:
     ----------------
         setup_plot(): Set up the plot.
-        update_plot(data_txt, offset, colors): Update the plot with the data.
+        set_blit(enabled): Turn the blitting of the lines on or off.
+        blit_lines(): Redraw the lines over the cached background.
+        set_decimate(enabled): Turn the decimation of the lines on or off.
+        display_data(): Plotted points of the spectra in the current view.
+        update_plot(data_txt, offset, colors, pyramid): Update the plot with the data.
+        update_lines(data_txt, first, last, offset, colors, pyramid): Redraw only the lines of some spectra.
+        set_colors(colors): Set the line colors.
+        set_visibility(visible): Show or hide lines.
+        show_legend(labels): Show a legend of the spectra, or remove it.
     '''
 
     def __init__(self):
@@ -172,10 +821,33 @@ class PlotHandler:
         self.fig.tight_layout()
         self.lines: plt.Line2D
         self.lines = None
+        self.collection: LineCollection = None
+        self.collection_threshold = COLLECTION_THRESHOLD
+        self.n_lines = 0
+        self.on_pick = None
+        self._colors = None
+        self._rgba = None
+        self._visible = None
+        self.legend_labels = None
+        self._y_buffer = None
+        self._x_plotted = None
+        self._data = None
+        self._shift = None
+        self._pyramid: MinMaxPyramid = None
+        self._own_pyramid = False
+        self._shown_view = None
+        self.blit = False
+        self._background = None
+        self.decimate = True
         self.setup_plot()
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        self.fig.canvas.mpl_connect('pick_event', self._on_pick)
+        self.fig.canvas.mpl_connect('resize_event', self._on_view_changed)
+        self.ax.callbacks.connect('xlim_changed', self._on_view_changed)
+        self.ax.callbacks.connect('ylim_changed', self._invalidate_background)
 
     def version(self) -> str:
-        return 'PlotHandler version: 0.0.2'
+        return 'PlotHandler version: 0.0.7'
 
     def setup_plot(self):
         '''Set up the plot.'''
@@ -184,44 +856,322 @@ class PlotHandler:
         self.ax.set_ylabel('Optical Depth')
         self.fig.subplots_adjust(left=0.12, right=0.98, top=0.92, bottom=0.12)
 
-<<<<<<< HEAD
-    def update_plot(self, data_txt, offset, title, colors=None, intensity_units: str='OPTICAL DEPTH'):
-=======
-    def update_plot(self, data_txt, offset, colors=None):
->>>>>>> 523a77b26fbbd9505ee6772a5b9fd69ea6cfb71c
-        '''Update the plot with the data.'''
-        self.ax.clear()
-        x_data = data_txt[:, 0]
-        y_data = np.zeros([data_txt.shape[0], data_txt.shape[1] - 1])
+    def update_plot(self, data_txt, offset, title, colors=None, intensity_units: str='OPTICAL DEPTH', pyramid=None):
+        '''Update the plot with the data.
+
+        The line artists are kept between calls and only their data and colors
+        change; they are rebuilt only when the number of spectra changes. The view
+        follows the data unless it was zoomed or panned since the last rebuild.
+        pyramid is the MinMaxPyramid of data_txt kept by the stack; without it
+        one is built from data_txt.
+        '''
+        n_spectra = data_txt.shape[1] - 1
+        rebuild = self.n_lines != n_spectra or (self.collection is not None) != (n_spectra > self.collection_threshold)
+        same_x = self._set_data(data_txt, offset, pyramid) and not rebuild
+
+        if rebuild:
+            self._build_artists(n_spectra)
+            # New data is shown whole, even after a zoom
+            self.ax.set_autoscale_on(True)
 
-        for i in range(0, y_data.shape[1]):
-            y_data[:, i] = np.array(data_txt[:, i + 1]) - data_txt[1, i + 1] + offset * i
+        if colors and colors is not self._colors:
+            self.set_colors(colors, draw=False)
+        same_title = self.ax.get_title() == title
+        if not same_title:
+            self.ax.set_title(title)
+        fits_view = self._set_data_limits()
+
+        if self.blit and same_x and same_title and fits_view:
+            # Only the lines changed and the axes stay as they are
+            self._show_lines()
+            self.blit_lines()
+            return
+        self.ax.autoscale_view()
+        # The limits callback has shown the lines if the view changed
+        if self._shown_view != self._view():
+            self._show_lines()
+        self.fig.canvas.draw_idle()
+
+    def _build_artists(self, n_spectra):
+        '''Replace the artists of the spectra: one line each, or one LineCollection above collection_threshold.
+
+        A LineCollection is a single artist, so there is no per-line overhead when
+        drawing, picking or setting colors, which are one array of the collection.
+        Lines get the colors of the color cycle until a palette is set.
+        '''
+        for artist in self._artists():
+            artist.remove()
+        x_data, y_data = self.display_data()
+        self._shown_view = self._view()
+        if n_spectra > self.collection_threshold:
+            cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+            self._rgba = to_rgba_array([cycle[i % len(cycle)] for i in range(n_spectra)])
+            self.collection = LineCollection(_segments(x_data, y_data), colors=self._rgba, picker=True,
+                                             pickradius=PICK_RADIUS, animated=self.blit)
+            self.ax.add_collection(self.collection, autolim=False)
+            self.lines = None
+        else:
+            self.lines = self.ax.plot(x_data, y_data, animated=self.blit, picker=True, pickradius=PICK_RADIUS)
+            self.collection = None
+        self.n_lines = n_spectra
+        self._visible = np.ones(n_spectra, dtype=bool)
+        self._colors = None
+
+    def _artists(self) -> list:
+        return [self.collection] if self.collection is not None else self.lines or []
+
+    def _set_data(self, data_txt, offset, pyramid=None, first=0, last=None) -> bool:
+        '''Keep the data to plot, its pyramid and the offset of every spectrum.
+
+        Without a pyramid of the same shape, the one of the plot is built, or only
+        updated for the columns first to last. Returns True if the x values did not change.
+        '''
+        x_data, y_data = data_txt[:, 0], data_txt[:, 1:]
+        same_x = self._x_plotted is not None and np.array_equal(self._x_plotted, x_data)
+        if not same_x:
+            self._x_plotted = np.array(x_data)
+        self._data = data_txt
+        self._shown_view = None
+        # Every spectrum starts at zero and is stacked by offset; a NaN start is not shifted
+        self._shift = np.nan_to_num(y_data[1]) - offset * np.arange(y_data.shape[1])
+
+        if pyramid is not None and pyramid.shape == y_data.shape:
+            self._pyramid, self._own_pyramid = pyramid, False
+        elif self._own_pyramid and same_x:
+            self._pyramid.update(y_data, first, last)
+        else:
+            self._pyramid, self._own_pyramid = MinMaxPyramid(self._x_plotted, y_data), True
+        return same_x
+
+    def _set_data_limits(self) -> bool:
+        '''Set the data limits from the limits of the pyramid, shifted by the offsets.'''
+        mins, maxs = self._pyramid.limits()
+        return self.set_data_limits(self._x_plotted[[0, -1]], np.concatenate((mins - self._shift, maxs - self._shift)))
+
+    def set_data_limits(self, x_data, y_data) -> bool:
+        '''Set the data limits of the axes from the plotted arrays, without relim() going through every line.
+
+        Returns True if the data fits in the current view, or the view is not autoscaled.
+        '''
+        with np.errstate(invalid='ignore'):
+            limits = np.array([[np.nanmin(x_data), np.nanmin(y_data)], [np.nanmax(x_data), np.nanmax(y_data)]])
+        if not np.isfinite(limits).all():
+            return False
+        self.ax.dataLim.set_points(limits)
+        self.ax.ignore_existing_data_limits = False
+
+        view = self.ax.viewLim
+        fits_x = not self.ax.get_autoscalex_on() or (min(view.x0, view.x1) <= limits[0, 0] and limits[1, 0] <= max(view.x0, view.x1))
+        fits_y = not self.ax.get_autoscaley_on() or (min(view.y0, view.y1) <= limits[0, 1] and limits[1, 1] <= max(view.y0, view.y1))
+        return fits_x and fits_y
+
+    def set_blit(self, enabled):
+        '''Turn blitting on or off.
+
+        With blitting the lines are animated artists: the figure without them
+        (axes, ticks, labels) is cached after every full draw, and offset, color
+        and visibility changes only draw the lines over it. Zoom, pan and resize
+        draw the whole figure, which caches the background again.
+        '''
+        self.blit = bool(enabled) and self.fig.canvas.supports_blit
+        for artist in self._artists():
+            artist.set_animated(self.blit)
+        self._background = None
+        self.fig.canvas.draw_idle()
+
+    def _invalidate_background(self, *args):
+        self._background = None
+
+    def set_decimate(self, enabled):
+        '''Turn the decimation of the lines on or off.'''
+        self.decimate = bool(enabled)
+        if self.n_lines:
+            self._show_lines()
+            self.fig.canvas.draw_idle()
+
+    def display_data(self) -> tuple[np.ndarray, np.ndarray]:
+        '''Points of the spectra given to the lines, offsets included.
+
+        With decimation, the rows in the x range of the view are reduced to their
+        minimum and maximum in every pixel column of the axes, all spectra at once,
+        from the coarsest level of the pyramid that still has a bin per pixel. Agg
+        then draws a few thousand points per line and a zoom or pan costs the same
+        whatever the length of the spectra. The offsets are applied after the
+        reduction, since they shift whole spectra.
+        '''
+        if not self.decimate:
+            y_data = self._data[:, 1:]
+            if self._y_buffer is None or self._y_buffer.shape != y_data.shape or self._y_buffer.dtype != y_data.dtype:
+                self._y_buffer = np.empty(y_data.shape, dtype=y_data.dtype, order='F')
+            return self._x_plotted, np.subtract(y_data, self._shift, out=self._y_buffer)
+        x_data, y_data = self._pyramid.view(*self.ax.get_xlim(), int(self.ax.bbox.width))
+        return x_data, y_data - self._shift
+
+    def _view(self) -> tuple:
+        return (*self.ax.get_xlim(), int(self.ax.bbox.width))
+
+    def _show_lines(self, indices=None):
+        '''Give the lines (all, or the ones in indices while the others are unchanged) their display data.'''
+        x_data, y_data = self.display_data()
+        self._shown_view = self._view()
+        if self.collection is not None:
+            self.collection.set_segments(_segments(x_data, y_data))
+            return
+        for i in range(len(self.lines)) if indices is None else indices:
+            self.lines[i].set_data(x_data, y_data[:, i])
+
+    def _on_view_changed(self, *args):
+        '''Zoom, pan or resize: decimate the lines again for the new view.'''
+        self._invalidate_background()
+        if self.decimate and self.n_lines and self._pyramid is not None and self._view() != self._shown_view:
+            self._show_lines()
+
+    def _on_draw(self, event):
+        '''After a full draw, cache the background and draw the animated lines on top.'''
+        if not self.blit or event is None:
+            return
+        if not event.canvas.is_saving():
+            self._background = event.canvas.copy_from_bbox(self.fig.bbox)
+        # Animated artists are left out of the figure draw, also when it is saved
+        for artist in self._artists():
+            if artist.get_visible():
+                artist.draw(event.renderer)
+
+    def blit_lines(self):
+        '''Draw the lines over the cached background, or the whole figure if there is none.'''
+        canvas = self.fig.canvas
+        if self._background is None:
+            canvas.draw_idle()
+            return
+        canvas.restore_region(self._background)
+        for artist in self._artists():
+            if artist.get_visible():
+                self.ax.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+
+    def set_colors(self, colors, draw=True):
+        '''Set the line colors from the Red, Green and Blue arrays of a palette.'''
+        if self.collection is not None:
+            n = self.n_lines
+            self._rgba = np.column_stack((colors['Red'][:n], colors['Green'][:n], colors['Blue'][:n], np.ones(n)))
+            self._set_collection_colors()
+        else:
+            for i, line in enumerate(self.lines or []):
+                line.set_color((colors['Red'][i], colors['Green'][i], colors['Blue'][i]))
+        self._colors = colors
+        if self.legend_labels:
+            # The legend is in the background, so the whole figure is drawn
+            self.show_legend(self.legend_labels, draw=draw)
+        elif draw:
+            self.blit_lines() if self.blit else self.fig.canvas.draw_idle()
+
+    def _set_collection_colors(self):
+        '''Give the collection its colors, hidden spectra fully transparent.'''
+        rgba = self._rgba.copy()
+        rgba[~self._visible, 3] = 0
+        self.collection.set_color(rgba)
+
+    def set_visibility(self, visible):
+        '''Show or hide every line from a sequence of booleans, one per spectrum.'''
+        if self.collection is not None:
+            self._visible[:len(visible)] = np.asarray(visible, dtype=bool)[:self.n_lines]
+            self._set_collection_colors()
+        else:
+            for line, shown in zip(self.lines or [], visible):
+                line.set_visible(bool(shown))
+        self.blit_lines() if self.blit else self.fig.canvas.draw_idle()
+
+    def line_colors(self) -> np.ndarray:
+        '''RGBA color of every spectrum.'''
+        if self.collection is not None:
+            return self._rgba
+        return to_rgba_array([line.get_color() for line in self.lines or []])
+
+    def show_legend(self, labels=None, draw=True):
+        '''Show a legend of the spectra with one label each, or remove it with None.
+
+        The entries are drawn with proxy lines in the colors of the spectra, so the
+        legend is the same for lines and for a collection. Above LEGEND_ENTRIES
+        spectra, evenly spaced ones are listed.
+        '''
+        legend = self.ax.get_legend()
+        if legend is not None:
+            legend.remove()
+        self.legend_labels = list(labels) if labels else None
+        if self.legend_labels and self.n_lines:
+            rgba = self.line_colors()
+            n = min(len(self.legend_labels), self.n_lines)
+            entries = np.unique(np.linspace(0, n - 1, min(n, LEGEND_ENTRIES)).round().astype(int))
+            handles = [Line2D([], [], color=rgba[i]) for i in entries]
+            self.ax.legend(handles, [self.legend_labels[i] for i in entries], fontsize='small')
+        if draw:
+            self.fig.canvas.draw_idle()
+
+    def _on_pick(self, event):
+        '''Pass the indices of the visible spectra under the mouse to on_pick.'''
+        if self.on_pick is None:
+            return
+        if self.collection is not None and event.artist is self.collection:
+            indices = [int(i) for i in event.ind if self._visible[i]]
+        elif self.lines and event.artist in self.lines and event.artist.get_visible():
+            indices = [self.lines.index(event.artist)]
+        else:
+            return
+        if indices:
+            self.on_pick(indices)
+
+    def update_lines(self, data_txt, first, last=None, offset=0, colors=None, pyramid=None) -> bool:
+        '''Redraw the lines of the spectra first to last, adding lines for new spectra.
+
+        The other lines are kept as they are, only their colors are set again.
+        Returns False without drawing when the plotted lines do not cover the
+        spectra before first, in which case the whole plot must be updated.
+        '''
+        n_spectra = data_txt.shape[1] - 1
+        last = n_spectra if last is None else last
+        if not self.n_lines or self.n_lines < first or self.n_lines > n_spectra:
+            return False
+        if (self.collection is not None) != (n_spectra > self.collection_threshold):
+            return False
+
+        self._set_data(data_txt, offset, pyramid, first, last)
+        if self.collection is not None:
+            self._show_lines()
+            if n_spectra > self.n_lines:
+                n_new = n_spectra - self.n_lines
+                self._rgba = np.vstack((self._rgba, np.tile(self._rgba[-1], (n_new, 1))))
+                self._visible = np.append(self._visible, np.ones(n_new, dtype=bool))
+                self.n_lines = n_spectra
+                self._set_collection_colors()
+        else:
+            shown = min(last, len(self.lines))
+            self._show_lines(range(first, shown))
+            if last > shown:
+                x_data, y_data = self.display_data()
+                self.lines.extend(self.ax.plot(x_data, y_data[:, shown:last], animated=self.blit, picker=True,
+                                               pickradius=PICK_RADIUS))
+                self._visible = np.append(self._visible, np.ones(last - shown, dtype=bool))
+                self.n_lines = len(self.lines)
 
-        self.lines = self.ax.plot(x_data, y_data)
         if colors:
-            for i, line in enumerate(self.lines):
-                color_line = (colors['Red'][i], colors['Green'][i], colors['Blue'][i])
-                line.set_color(color_line)
+            self.set_colors(colors, draw=False)
 
-        self.ax.set_title(title)
-        self.ax.invert_xaxis()
-        self.ax.set_xlabel(r'Wavenumber (cm$^{-1}$)')
-        self.ax.set_ylabel('Optical Depth')
-        self.fig.canvas.draw()
+        self._set_data_limits()
+        self.ax.autoscale_view()
+        self.fig.canvas.draw_idle()
+        return True
 
-    def update_plot(self, data_txt, offset, colors=None, *args, **kwargs):
-        '''Update the plot with the data.'''
 
-        x_min, x_max = self.ax.get_xlim()
-        y_min, y_max = self.ax.get_ylim()
+def _changed_fields(before, after) -> set:
+    '''Names of the recipe fields that differ between two recipes.'''
+    return {name for name in after if before.get(name) != after[name]}
 
-        self.plot_data(data_txt, offset, colors)
 
-        self.ax.set_xlim(x_min, x_max)
-        self.ax.set_ylim(y_min, y_max)
-        self.fig.canvas.draw()
+def _segments(x_data, y_data) -> np.ndarray:
+    '''Points of every spectrum as the (spectra, points, 2) array of a LineCollection.'''
+    y_data = y_data.T
+    return np.stack((np.broadcast_to(x_data, y_data.shape), y_data), axis=-1)
 
-        
 
 class Logger:
     '''
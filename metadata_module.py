@@ -0,0 +1,156 @@
+import os
+import re
+import numpy as np
+
+NUMBER_PATTERN = re.compile(r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+UNITS_PATTERN = re.compile(r'\([^)]*\)|\[[^\]]*\]')
+
+
+def field_name(key) -> str:
+    '''Normalize a metadata key: lower case, units in brackets removed, words joined by _.'''
+    return re.sub(r'[^0-9a-z]+', '_', UNITS_PATTERN.sub('', key).lower()).strip('_')
+
+
+def numeric_value(text) -> float:
+    '''Leading number of a metadata value, NaN if it does not start with one.'''
+    match = NUMBER_PATTERN.match(str(text))
+    return float(match.group(1)) if match else np.nan
+
+
+def filename_fields(file_path, pattern) -> dict:
+    '''Named groups of a regular expression searched in the name of a file or archive member.'''
+    if not pattern:
+        return {}
+    match = re.search(pattern, os.path.basename(file_path.rpartition('::')[2]))
+    return {} if match is None else {key: value for key, value in match.groupdict().items() if value is not None}
+
+
+class MetadataTable:
+    '''
+    Metadata of every spectrum of the stack, one row per spectrum in stack order.
+
+    Values are kept as text under normalized field names (see field_name). Numeric
+    views and sorted indices of the fields are built on the first query and reused
+    until rows are added, so queries never go back to the files.
+
+    Attributes:
+    ----------------
+        fields (dict): Values of every field, one list of strings per field.
+        n_rows (int): Number of spectra.
+
+    Methods:
+    ----------------
+        from_fields(fields): Build a table from the values of every field.
+        append(records): Add the metadata dictionaries of new spectra.
+        replace(first, records): Replace the metadata of consecutive spectra.
+        row(index): Return the metadata of one spectrum.
+        column(name): Return the values of a field.
+        numeric(name): Return the values of a field as floats, NaN where not numeric.
+        between(name, low, high): Indices of the spectra with a numeric field in [low, high].
+        equal(name, value): Indices of the spectra with a field equal to a value.
+    '''
+
+    def __init__(self, records=()):
+        self.fields = {}
+        self.n_rows = 0
+        self._numeric = {}
+        self._sorted = {}
+        self._values = {}
+        self.append(records)
+
+    @classmethod
+    def from_fields(cls, fields, n_rows) -> 'MetadataTable':
+        '''Build a table from the fields attribute of another table, e.g. saved in a project.'''
+        table = cls()
+        for name, values in fields.items():
+            if len(values) != n_rows:
+                raise ValueError(f'Metadata field {name} has {len(values)} values for {n_rows} spectra')
+            table.fields[field_name(name)] = [str(value) for value in values]
+        table.n_rows = n_rows
+        return table
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def append(self, records):
+        '''Add one row per dictionary. Missing fields are left empty.'''
+        records = list(records)
+        if not records:
+            return
+
+        for i, record in enumerate(records):
+            for key, value in record.items():
+                name = field_name(str(key))
+                if not name:
+                    continue
+                values = self.fields.setdefault(name, [''] * self.n_rows)
+                values.extend([''] * (self.n_rows + i - len(values)))
+                values.append(str(value))
+        self.n_rows += len(records)
+        for values in self.fields.values():
+            values.extend([''] * (self.n_rows - len(values)))
+
+        self._clear_indices()
+
+    def replace(self, first, records):
+        '''Replace the rows from first on, one per dictionary, e.g. for a file read again.'''
+        records = list(records)
+        if first < 0 or first + len(records) > self.n_rows:
+            raise ValueError('Metadata rows out of range')
+
+        for values in self.fields.values():
+            values[first:first + len(records)] = [''] * len(records)
+        for i, record in enumerate(records):
+            for key, value in record.items():
+                name = field_name(str(key))
+                if name:
+                    self.fields.setdefault(name, [''] * self.n_rows)[first + i] = str(value)
+        self._clear_indices()
+
+    def _clear_indices(self):
+        self._numeric.clear()
+        self._sorted.clear()
+        self._values.clear()
+
+    def row(self, index) -> dict:
+        '''Return the non-empty fields of one spectrum.'''
+        return {name: values[index] for name, values in self.fields.items() if values[index] != ''}
+
+    def column(self, name) -> list[str]:
+        '''Return the values of a field, empty strings where missing.'''
+        return self.fields.get(field_name(name), [''] * self.n_rows)
+
+    def numeric(self, name) -> np.ndarray:
+        '''Return the values of a field as floats, NaN where missing or not numeric.'''
+        name = field_name(name)
+        if name not in self._numeric:
+            self._numeric[name] = np.array([numeric_value(value) for value in self.column(name)], dtype=np.float64)
+        return self._numeric[name]
+
+    def between(self, name, low=-np.inf, high=np.inf) -> np.ndarray:
+        '''Indices of the spectra whose numeric field lies in [low, high], in stack order.
+
+        The column of a spectrum in data_txt is its index plus one.
+        '''
+        name = field_name(name)
+        if name not in self._sorted:
+            values = self.numeric(name)
+            order = np.argsort(values, kind='stable')
+            # NaNs sort last and are left out of the index
+            order = order[:np.count_nonzero(~np.isnan(values))]
+            self._sorted[name] = (values[order], order)
+
+        sorted_values, order = self._sorted[name]
+        first = np.searchsorted(sorted_values, low, side='left')
+        last = np.searchsorted(sorted_values, high, side='right')
+        return np.sort(order[first:last])
+
+    def equal(self, name, value) -> np.ndarray:
+        '''Indices of the spectra whose field equals a value as text, in stack order.'''
+        name = field_name(name)
+        if name not in self._values:
+            index = {}
+            for i, field_value in enumerate(self.column(name)):
+                index.setdefault(field_value, []).append(i)
+            self._values[name] = index
+        return np.array(self._values[name].get(str(value), []), dtype=np.intp)
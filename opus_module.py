@@ -0,0 +1,143 @@
+import numpy as np
+from io_module import FileFormat, map_buffer
+from resample_module import axes_match, resample
+
+CACHE = False
+MAGIC = b'\x0a\x0a\x0a\x0a'
+HEADER_BYTES = 24
+DIRECTORY_ENTRY = np.dtype([('data_type', 'u1'), ('channel_type', 'u1'), ('text_type', 'u1'),
+                            ('extra', 'u1'), ('length', '<i4'), ('offset', '<i4')])
+# Block types of the spectra read, their parameter block has the data type plus PARAMETER_TYPE
+SPECTRUM_TYPES = {15: 'AB'}
+PARAMETER_TYPE = 16
+SAMPLE_TYPE = 160
+PARAMETER_TYPES = {0: '<i4', 1: '<f8'}
+Y_UNITS = {'AB': 'Absorbance', 'TR': 'Transmittance'}
+
+
+class Block:
+    '''
+    Entry of the directory of an OPUS file.
+
+    Attributes:
+    ----------------
+        data_type (int): Type of the data in the block.
+        channel_type (int): Channel of the data (sample, reference...).
+        offset (int): Byte offset of the block.
+        length (int): Length of the block in 4-byte words.
+    '''
+
+    def __init__(self, data_type, channel_type, offset, length):
+        self.data_type = data_type
+        self.channel_type = channel_type
+        self.offset = offset
+        self.length = length
+
+
+def _directory(buffer) -> list[Block]:
+    '''Read the block directory of an OPUS file.'''
+    if buffer.size < HEADER_BYTES or buffer[:4].tobytes() != MAGIC:
+        raise ValueError('Not an OPUS file')
+    directory_offset, max_blocks, n_blocks = np.frombuffer(buffer, '<i4', 3, 12)
+    n_blocks = min(int(n_blocks), int(max_blocks))
+    if directory_offset + n_blocks * DIRECTORY_ENTRY.itemsize > buffer.size:
+        raise ValueError('OPUS directory is truncated')
+
+    entries = np.frombuffer(buffer, DIRECTORY_ENTRY, n_blocks, int(directory_offset))
+    return [Block(int(entry['data_type']), int(entry['channel_type']), int(entry['offset']), int(entry['length']))
+            for entry in entries if entry['offset'] > 0]
+
+
+def _parameters(buffer, block: Block) -> dict:
+    '''Read a parameter block into a dictionary of three-letter names.'''
+    parameters = {}
+    cursor = block.offset
+    end = min(block.offset + 4 * block.length, buffer.size)
+    while cursor + 8 <= end:
+        name = buffer[cursor:cursor + 3].tobytes().decode('latin-1')
+        if name == 'END':
+            break
+        value_type, size = np.frombuffer(buffer, '<i2', 2, cursor + 4)
+        start = cursor + 8
+        if int(value_type) in PARAMETER_TYPES:
+            value = np.frombuffer(buffer, PARAMETER_TYPES[int(value_type)], 1, start)[0].item()
+        else:
+            value = buffer[start:start + 2 * int(size)].tobytes().split(b'\0', 1)[0].decode('latin-1')
+        parameters[name] = value
+        cursor = start + 2 * int(size)
+    return parameters
+
+
+def _spectra(buffer) -> tuple[list[tuple[Block, dict]], dict]:
+    '''Return the spectrum blocks with their parameters, and the sample parameters.'''
+    blocks = _directory(buffer)
+    parameter_blocks = {(block.data_type, block.channel_type): block for block in blocks}
+    sample = {}
+    if (SAMPLE_TYPE, 0) in parameter_blocks:
+        sample = _parameters(buffer, parameter_blocks[(SAMPLE_TYPE, 0)])
+
+    spectra = []
+    for block in blocks:
+        if block.data_type not in SPECTRUM_TYPES:
+            continue
+        parameter_block = parameter_blocks.get((block.data_type + PARAMETER_TYPE, block.channel_type))
+        if parameter_block is None:
+            continue
+        spectra.append((block, _parameters(buffer, parameter_block)))
+
+    if not spectra:
+        raise ValueError('No absorbance or transmittance block found in the OPUS file')
+    return spectra, sample
+
+
+def _metadata(block: Block, parameters, sample) -> dict:
+    '''Header metadata of one spectrum, with the record names used for JCAMP-DX.'''
+    kind = parameters.get('PLF', SPECTRUM_TYPES[block.data_type])
+    metadata = {
+        'TITLE': str(sample.get('SNM', '')),
+        'DATE': f'{parameters.get("DAT", "")} {parameters.get("TIM", "")}'.strip(),
+        'XUNITS': str(parameters.get('DXU', '')),
+        'YUNITS': Y_UNITS.get(kind, kind),
+        'NPOINTS': str(parameters.get('NPT', '')),
+    }
+    metadata.update({name: str(value) for name, value in parameters.items()})
+    return metadata
+
+
+def sniff(file_path) -> FileFormat:
+    '''Read the directory and the parameters of an OPUS file.'''
+    buffer = map_buffer(file_path)
+    spectra, sample = _spectra(buffer)
+    return FileFormat(0, None, '.', 1 + len(spectra), reader='opus_module',
+                      metadata=[_metadata(block, parameters, sample) for block, parameters in spectra])
+
+
+def read(file_path, file_format: FileFormat = None, progress=None) -> np.ndarray:
+    '''Read the absorbance or transmittance blocks of an OPUS file, x values in column 0.
+
+    The data is viewed with np.frombuffer on the memory-mapped file and scaled by
+    the CSF parameter. Blocks whose range (FXV, LXV, NPT) differs from the first
+    are resampled linearly onto its axis, points beyond their range taking their
+    first or last value. progress(done, total) is called after each block.
+    '''
+    buffer = map_buffer(file_path)
+    spectra, _ = _spectra(buffer)
+
+    first = spectra[0][1]
+    n_points = int(first['NPT'])
+    data = np.empty((n_points, 1 + len(spectra)))
+    data[:, 0] = np.linspace(first['FXV'], first['LXV'], n_points)
+    for i, (block, parameters) in enumerate(spectra):
+        block_points = int(parameters['NPT'])
+        if block.length < block_points:
+            raise ValueError(f'OPUS block {i + 1} is shorter than its {block_points} points')
+        y_view = np.frombuffer(buffer, '<f4', block_points, block.offset)
+        x_block = np.linspace(parameters['FXV'], parameters['LXV'], block_points)
+        if axes_match(x_block, data[:, 0]):
+            np.multiply(y_view, parameters.get('CSF', 1.0), out=data[:, 1 + i])
+        else:
+            data[:, 1 + i] = resample(x_block, y_view * parameters.get('CSF', 1.0), data[:, 0], fill_value='edge')
+        if progress is not None:
+            progress(i + 1, len(spectra))
+
+    return data
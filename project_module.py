@@ -0,0 +1,96 @@
+import json
+import os
+import struct
+import tempfile
+import zipfile
+import numpy as np
+
+PROJECT_VERSION = 1
+PROJECT_SUFFIX = '.npz'
+DOCUMENT_NAME = 'project.json'
+# Local file header of a zip member: fixed part, then the name and the extra field
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+
+def write_project(file_path, arrays, document):
+    '''Write a project: npy arrays and a JSON document in an uncompressed zip.
+
+    The container is an npz file, so np.load can read the arrays. The members are
+    stored without compression so read_project can memory-map them. The zip is
+    written to a temporary file next to file_path and moved over it once complete,
+    so a failed save leaves the previous project intact.
+    '''
+    directory = os.path.dirname(os.path.abspath(file_path))
+    handle, temporary_path = tempfile.mkstemp(suffix=PROJECT_SUFFIX, dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, array in arrays.items():
+                array = np.asanyarray(array)
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array(member, array, allow_pickle=False)
+            archive.writestr(DOCUMENT_NAME, json.dumps({'version': PROJECT_VERSION, **document}))
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def mapped_from(array, file_path) -> bool:
+    '''Whether array is memory-mapped from file_path, e.g. by read_project.'''
+    filename = getattr(array, 'filename', None)
+    if not isinstance(array, np.memmap) or filename is None or not os.path.exists(file_path):
+        return False
+    return os.path.samefile(filename, file_path)
+
+
+def _data_offset(f, info: zipfile.ZipInfo) -> int:
+    '''Byte offset of the data of a zip member in the file.'''
+    f.seek(info.header_offset)
+    fields = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+    if fields[0] != b'PK\x03\x04':
+        raise ValueError(f'Corrupt project member: {info.filename}')
+    name_length, extra_length = fields[-2:]
+    return info.header_offset + LOCAL_HEADER.size + name_length + extra_length
+
+
+def _map_member(file_path, f, info: zipfile.ZipInfo, mode) -> np.ndarray:
+    '''Memory-map a stored npy member of a zip file.'''
+    f.seek(_data_offset(f, info))
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if dtype.hasobject:
+        raise ValueError(f'Project member {info.filename} holds objects')
+    if 0 in shape:
+        return np.empty(shape, dtype, order='F' if fortran_order else 'C')
+    return np.memmap(file_path, dtype, mode, f.tell(), shape, 'F' if fortran_order else 'C')
+
+
+def read_project(file_path, mode='c') -> tuple[dict, dict]:
+    '''Read the arrays and the document of a project.
+
+    Stored arrays are memory-mapped, copy-on-write by default, so opening a
+    project reads only the headers whatever the size of the arrays; compressed
+    ones are read into memory.
+    '''
+    with zipfile.ZipFile(file_path) as archive:
+        if DOCUMENT_NAME not in archive.namelist():
+            raise ValueError('Not a Fittingpy project')
+        document = json.loads(archive.read(DOCUMENT_NAME))
+        if document.get('version', 0) > PROJECT_VERSION:
+            raise ValueError(f'Project version {document["version"]} is newer than this version of Fittingpy')
+
+        arrays = {}
+        with open(file_path, 'rb') as f:
+            for info in archive.infolist():
+                if not info.filename.endswith('.npy'):
+                    continue
+                name = info.filename[:-len('.npy')]
+                if info.compress_type == zipfile.ZIP_STORED:
+                    arrays[name] = _map_member(file_path, f, info, mode)
+                else:
+                    with archive.open(info) as member:
+                        arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+    return arrays, document
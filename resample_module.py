@@ -0,0 +1,138 @@
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+RESAMPLE_METHODS = ('linear', 'cubic', 'rebin')
+
+
+def axes_match(x_data, x_reference, rtol=1e-9) -> bool:
+    '''Return True if two wavenumber axes hold the same points.'''
+    return x_data.shape == x_reference.shape and np.allclose(x_data, x_reference, rtol=rtol, atol=0)
+
+
+def monotonic_rows(x_data) -> tuple[np.ndarray, np.ndarray | None, np.ndarray | None]:
+    '''Make the axis of rows that may be unsorted or repeat x values strictly monotonic.
+
+    The rows are sorted, keeping the order of equal x, in the direction from the
+    first to the last x, and the rows sharing an x value are merged, as written
+    by some instruments. Returns the new axis, the order of the rows (None if
+    they are sorted) and the first sorted row of every x value (None without
+    repeats), to be applied to the spectra with reorder_rows.
+    '''
+    order = None
+    descending = x_data[0] > x_data[-1]
+    steps = np.diff(x_data)
+    if np.any(steps > 0) if descending else np.any(steps < 0):
+        order = np.argsort(-x_data if descending else x_data, kind='stable')
+        x_data = x_data[order]
+
+    repeated = x_data[1:] == x_data[:-1]
+    if not repeated.any():
+        return x_data, order, None
+    starts = np.flatnonzero(np.concatenate(([True], ~repeated)))
+    return x_data[starts], order, starts
+
+
+def reorder_rows(y_data, order, starts) -> np.ndarray:
+    '''Sort the rows of spectra in the order of monotonic_rows and average the rows of every repeated x.'''
+    if order is not None:
+        y_data = y_data[order]
+    if starts is None:
+        return y_data
+    counts = np.diff(np.append(starts, y_data.shape[0]))
+    merged = np.add.reduceat(y_data, starts, axis=0, dtype=np.float64)
+    merged /= counts.reshape((-1,) + (1,) * (merged.ndim - 1))
+    return merged
+
+
+def _ascending(x_data, y_data) -> tuple[np.ndarray, np.ndarray]:
+    '''Return the axis and the columns ordered by increasing x.'''
+    if x_data[0] > x_data[-1]:
+        return x_data[::-1], y_data[::-1]
+    return x_data, y_data
+
+
+def interp_columns(x_data, y_data, x_new, fill_value=np.nan) -> np.ndarray:
+    '''Linear interpolation of every column of y_data at once. x_data must be ascending.'''
+    idx = np.clip(np.searchsorted(x_data, x_new, side='right'), 1, x_data.size - 1)
+    x0, x1 = x_data[idx - 1], x_data[idx]
+    weight = ((x_new - x0) / (x1 - x0))[:, np.newaxis]
+    y_new = y_data[idx - 1] * (1 - weight) + y_data[idx] * weight
+    y_new[(x_new < x_data[0]) | (x_new > x_data[-1])] = fill_value
+    return y_new
+
+
+def _bin_edges(centers) -> np.ndarray:
+    '''Edges of the bins around ascending bin centers.'''
+    edges = np.empty(centers.size + 1)
+    edges[1:-1] = (centers[:-1] + centers[1:]) / 2
+    edges[0] = centers[0] - (centers[1] - centers[0]) / 2
+    edges[-1] = centers[-1] + (centers[-1] - centers[-2]) / 2
+    return edges
+
+
+def _rebin_columns(x_data, y_data, x_new, fill_value) -> np.ndarray:
+    '''Flux-conserving rebin of every column of y_data at once. Both axes must be ascending.
+
+    Bins partly outside the source are averaged over the part they cover; only
+    bins entirely outside get fill_value.
+    '''
+    edges = _bin_edges(x_data)
+    new_edges = np.clip(_bin_edges(x_new), edges[0], edges[-1])
+
+    # Integral of the piecewise-constant spectra up to each source edge
+    cumulative = np.zeros((edges.size, y_data.shape[1]))
+    np.cumsum(y_data * np.diff(edges)[:, np.newaxis], axis=0, out=cumulative[1:])
+
+    flux = np.diff(interp_columns(edges, cumulative, new_edges), axis=0)
+    widths = np.diff(new_edges)
+    outside = widths <= 0
+    y_new = flux / np.where(outside, 1, widths)[:, np.newaxis]
+    y_new[outside] = fill_value
+    return y_new
+
+
+def resample(x_data, y_data, x_reference, method='linear', fill_value=np.nan) -> np.ndarray:
+    '''Resample spectra onto a reference wavenumber grid.
+
+    All the columns of y_data are resampled in one batched operation. Both axes may
+    be ascending or descending. Points outside the range of x_data get fill_value,
+    or the first or last value of x_data with fill_value='edge', so that the
+    processing stages never see NaN introduced by the resampling.
+
+    Methods:
+        linear: Linear interpolation.
+        cubic: Cubic spline interpolation.
+        rebin: Flux-conserving rebin, the integral over each reference bin is kept.
+    '''
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f'Unknown resample method: {method}')
+    hold_edges = isinstance(fill_value, str)
+    if hold_edges and fill_value != 'edge':
+        raise ValueError(f'Unknown fill value: {fill_value}')
+
+    y_data = np.asarray(y_data)
+    squeeze = y_data.ndim == 1
+    if squeeze:
+        y_data = y_data[:, np.newaxis]
+    if x_data.size < 2:
+        raise ValueError('At least two points are needed to resample')
+
+    x_data, y_data = _ascending(np.asarray(x_data, dtype=np.float64), y_data)
+    order = np.argsort(x_reference, kind='stable')
+    x_sorted = np.asarray(x_reference, dtype=np.float64)[order]
+
+    fill = np.nan if hold_edges else fill_value
+    if method == 'linear':
+        y_sorted = interp_columns(x_data, y_data, x_sorted, fill)
+    elif method == 'cubic':
+        y_sorted = CubicSpline(x_data, y_data, axis=0, extrapolate=False)(x_sorted)
+        y_sorted[(x_sorted < x_data[0]) | (x_sorted > x_data[-1])] = fill
+    else:
+        y_sorted = _rebin_columns(x_data, y_data, x_sorted, fill)
+    if hold_edges:
+        y_sorted[x_sorted < x_data[0]] = y_data[0]
+        y_sorted[x_sorted > x_data[-1]] = y_data[-1]
+
+    y_new = np.empty_like(y_sorted)
+    y_new[order] = y_sorted
+    return y_new[:, 0] if squeeze else y_new
@@ -0,0 +1,205 @@
+import json
+import lzma
+import struct
+import zlib
+import numpy as np
+from io_module import FileFormat, map_buffer
+
+CACHE = False
+MAGIC = b'FPSA'
+VERSION = 1
+# File header: magic, version, length of the JSON header that follows
+HEADER = struct.Struct('<4sHI')
+# One entry per spectrum, after the x values: where its column is and how it is encoded
+INDEX_ENTRY = np.dtype([('offset', '<u8'), ('length', '<u8'), ('mode', 'u1'), ('itemsize', 'u1')])
+LOSSLESS, DELTA = 0, 1
+ERROR_BOUND = 1e-5
+CODECS = {'zlib': (lambda data, level: zlib.compress(data, level), zlib.decompress, 6),
+          'lzma': (lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 6)}
+BLOCK_BYTES = 32 * 1024 ** 2
+# Quantized values must stay exact in float64
+MAX_QUANTUM = 2.0 ** 52
+
+
+def _shuffle(values) -> bytes:
+    '''Bytes of an array grouped by byte position, which compresses better.'''
+    return values.view(np.uint8).reshape(-1, values.itemsize).T.tobytes()
+
+
+def _unshuffle(data, dtype) -> np.ndarray:
+    dtype = np.dtype(dtype)
+    return np.frombuffer(data, np.uint8).reshape(dtype.itemsize, -1).T.copy().view(dtype).ravel()
+
+
+def _delta_itemsize(max_delta) -> int:
+    '''Smallest signed integer size holding the deltas of a column.'''
+    for itemsize in (1, 2, 4):
+        if max_delta < 2 ** (8 * itemsize - 1):
+            return itemsize
+    return 8
+
+
+def _encode_block(y_block, step) -> list[tuple[int, int, bytes]]:
+    '''Encode the columns of a block as (mode, itemsize, uncompressed bytes).
+
+    Values are quantized to multiples of step and delta-encoded along the axis in
+    one pass over the block; columns that cannot be quantized (non-finite values,
+    or no error bound) are kept as floats.
+    '''
+    y_block = np.asarray(y_block)
+    if step == 0:
+        return [(LOSSLESS, y_block.itemsize, _shuffle(np.ascontiguousarray(column))) for column in y_block.T]
+
+    scaled = np.divide(y_block, step, dtype=np.float64)
+    quantizable = np.isfinite(scaled).all(axis=0) & (np.abs(scaled).max(axis=0, initial=0) < MAX_QUANTUM)
+    quanta = np.rint(np.where(quantizable, scaled, 0)).astype(np.int64)
+    deltas = np.diff(quanta, axis=0, prepend=0)
+    max_deltas = np.abs(deltas).max(axis=0, initial=0)
+
+    encoded = []
+    for j in range(y_block.shape[1]):
+        if not quantizable[j]:
+            encoded.append((LOSSLESS, y_block.itemsize, _shuffle(np.ascontiguousarray(y_block[:, j]))))
+            continue
+        itemsize = _delta_itemsize(max_deltas[j])
+        encoded.append((DELTA, itemsize, _shuffle(deltas[:, j].astype(f'<i{itemsize}'))))
+    return encoded
+
+
+def write_series(file_path, x_data, y_data, error_bound=ERROR_BOUND, codec='zlib', level=None, metadata=None,
+                 progress=None):
+    '''Write spectra sharing one axis (one per column of y_data) as a compact series file.
+
+    The axis is stored once. Every spectrum is quantized to 2 * error_bound, so no
+    value is off by more than error_bound, delta-encoded and compressed on its own
+    with zlib or lzma, so any spectrum can be read without the others. error_bound=0
+    stores the values exactly. metadata is an optional list of dictionaries, one per
+    spectrum. progress(done, total) is called after each block of columns.
+    '''
+    if codec not in CODECS:
+        raise ValueError(f'Unknown codec: {codec}')
+    if error_bound < 0:
+        raise ValueError('The error bound must not be negative')
+    x_data = np.asarray(x_data, dtype='<f8')
+    n_points, n_spectra = np.shape(y_data)
+    if x_data.size != n_points:
+        raise ValueError('The axis and the spectra have different number of lines')
+    if metadata is not None and len(metadata) != n_spectra:
+        raise ValueError('Expected one metadata dictionary per spectrum')
+
+    compress, _, default_level = CODECS[codec]
+    level = default_level if level is None else level
+    step = 2.0 * error_bound
+    header = json.dumps({'n_points': n_points, 'n_spectra': n_spectra, 'error_bound': error_bound, 'step': step,
+                         'codec': codec, 'metadata': metadata or []}).encode()
+    index = np.zeros(n_spectra, INDEX_ENTRY)
+
+    with open(file_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(header)) + header)
+        f.write(x_data.tobytes())
+        index_offset = f.tell()
+        f.write(index.tobytes())
+
+        columns = max(1, BLOCK_BYTES // max(1, n_points * 8))
+        for first in range(0, n_spectra, columns):
+            last = min(first + columns, n_spectra)
+            for j, (mode, itemsize, data) in enumerate(_encode_block(y_data[:, first:last], step), first):
+                compressed = compress(data, level)
+                index[j] = (f.tell(), len(compressed), mode, itemsize)
+                f.write(compressed)
+            if progress is not None:
+                progress(last, n_spectra)
+
+        f.seek(index_offset)
+        f.write(index.tobytes())
+
+
+class SeriesReader:
+    '''
+    Random access to the spectra of a series file written by write_series.
+
+    Only the header, the axis and the index are read when the file is opened; the
+    file is memory-mapped and every spectrum is decompressed on its own.
+
+    Attributes:
+    ----------------
+        x (numpy.ndarray): Shared axis.
+        error_bound (float): Largest difference from the written values.
+        codec (str): Compression codec.
+        metadata (list): Metadata of every spectrum, empty if none was written.
+
+    Methods:
+    ----------------
+        spectrum(index): Decode one spectrum.
+        spectra(indices): Decode some spectra, one per column.
+        data(): Decode the whole series, axis in column 0.
+    '''
+
+    def __init__(self, file_path):
+        self.buffer = map_buffer(file_path)
+        if self.buffer.size < HEADER.size:
+            raise ValueError('File too short for a series header')
+        magic, version, header_length = HEADER.unpack(self.buffer[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError('Not a Fittingpy series file')
+        if version > VERSION:
+            raise ValueError(f'Series version {version} is newer than this version of Fittingpy')
+
+        offset = HEADER.size + header_length
+        header = json.loads(self.buffer[HEADER.size:offset].tobytes())
+        n_points, n_spectra = header['n_points'], header['n_spectra']
+        if offset + 8 * n_points + INDEX_ENTRY.itemsize * n_spectra > self.buffer.size:
+            raise ValueError('Series file is truncated')
+        self.x = np.frombuffer(self.buffer, '<f8', n_points, offset)
+        self.index = np.frombuffer(self.buffer, INDEX_ENTRY, n_spectra, offset + 8 * n_points)
+        self.error_bound = header['error_bound']
+        self.step = header['step']
+        self.codec = header['codec']
+        self.metadata = header['metadata']
+        if self.codec not in CODECS:
+            raise ValueError(f'Unknown codec: {self.codec}')
+
+    def __len__(self) -> int:
+        return self.index.size
+
+    def spectrum(self, index) -> np.ndarray:
+        '''Decode one spectrum; the rest of the file is not read.'''
+        offset, length, mode, itemsize = self.index[index].item()
+        if offset + length > self.buffer.size:
+            raise ValueError('Series file is truncated')
+        data = CODECS[self.codec][1](self.buffer[offset:offset + length])
+        if mode == LOSSLESS:
+            return _unshuffle(data, f'<f{itemsize}').astype(np.float64)
+        return np.cumsum(_unshuffle(data, f'<i{itemsize}'), dtype=np.int64) * self.step
+
+    def spectra(self, indices=None, out=None, progress=None) -> np.ndarray:
+        '''Decode some spectra (all by default) into the columns of out.'''
+        indices = range(len(self)) if indices is None else indices
+        if out is None:
+            out = np.empty((self.x.size, len(indices)))
+        for j, index in enumerate(indices):
+            out[:, j] = self.spectrum(index)
+            if progress is not None:
+                progress(j + 1, len(indices))
+        return out
+
+    def data(self, progress=None) -> np.ndarray:
+        '''Decode the whole series with the axis in column 0.'''
+        data = np.empty((self.x.size, 1 + len(self)))
+        data[:, 0] = self.x
+        self.spectra(out=data[:, 1:], progress=progress)
+        return data
+
+
+def sniff(file_path) -> FileFormat:
+    '''Read the header of a series file.'''
+    reader = SeriesReader(file_path)
+    return FileFormat(0, None, '.', 1 + len(reader), reader='series_module', metadata=reader.metadata)
+
+
+def read(file_path, file_format: FileFormat = None, progress=None) -> np.ndarray:
+    '''Read every spectrum of a series file, x values in column 0.
+
+    progress(done, total) is called after each spectrum.
+    '''
+    return SeriesReader(file_path).data(progress)
@@ -0,0 +1,199 @@
+import datetime
+import numpy as np
+from io_module import FileFormat, map_buffer
+from resample_module import axes_match, resample
+
+CACHE = False
+NEW_FORMAT = 0x4B
+TSPREC, TMULTI, TXYXYS, TXVALS = 0x01, 0x04, 0x40, 0x80
+FLOAT_EXPONENT = -128
+
+MAIN_HEADER = np.dtype([
+    ('ftflgs', 'u1'), ('fversn', 'u1'), ('fexper', 'u1'), ('fexp', 'i1'), ('fnpts', '<i4'),
+    ('ffirst', '<f8'), ('flast', '<f8'), ('fnsub', '<i4'), ('fxtype', 'u1'), ('fytype', 'u1'),
+    ('fztype', 'u1'), ('fpost', 'u1'), ('fdate', '<u4'), ('fres', 'S9'), ('fsource', 'S9'),
+    ('fpeakpt', '<u2'), ('fspare', '<f4', (8,)), ('fcmnt', 'S130'), ('fcatxt', 'S30'), ('flogoff', '<i4'),
+    ('fmods', '<i4'), ('fprocs', 'u1'), ('flevel', 'u1'), ('fsampin', '<u2'), ('ffactor', '<f4'),
+    ('fmethod', 'S48'), ('fzinc', '<f4'), ('fwplanes', '<i4'), ('fwinc', '<f4'), ('fwtype', 'u1'),
+    ('freserv', 'S187'),
+])
+SUB_HEADER = np.dtype([
+    ('subflgs', 'u1'), ('subexp', 'i1'), ('subindx', '<u2'), ('subtime', '<f4'), ('subnext', '<f4'),
+    ('subnois', '<f4'), ('subnpts', '<i4'), ('subscan', '<i4'), ('subwlevel', '<f4'), ('subresv', 'S4'),
+])
+
+X_UNITS = {0: 'Arbitrary', 1: 'Wavenumber (cm-1)', 2: 'Micrometers', 3: 'Nanometers', 4: 'Seconds',
+           5: 'Minutes', 6: 'Hertz', 7: 'Kilohertz', 8: 'Megahertz', 9: 'Mass (M/z)', 10: 'Parts per million',
+           11: 'Days', 12: 'Years', 13: 'Raman Shift (cm-1)', 14: 'eV'}
+Y_UNITS = {0: 'Arbitrary Intensity', 1: 'Interferogram', 2: 'Absorbance', 3: 'Kubelka-Munk', 4: 'Counts',
+           10: 'Log(1/R)', 11: 'Percent', 12: 'Intensity', 13: 'Relative Intensity', 128: 'Transmittance',
+           129: 'Reflectance', 131: 'Emission'}
+
+
+class Subfile:
+    '''
+    Position of one spectrum in an SPC file.
+
+    Attributes:
+    ----------------
+        header (numpy.void): Subfile header.
+        x_offset (int | None): Byte offset of its own x values, None if it uses the shared axis.
+        y_offset (int): Byte offset of its y values.
+        n_points (int): Number of points.
+    '''
+
+    def __init__(self, header, x_offset, y_offset, n_points):
+        self.header = header
+        self.x_offset = x_offset
+        self.y_offset = y_offset
+        self.n_points = n_points
+
+
+def _date(packed) -> str:
+    '''Decode the packed date of the main header.'''
+    packed = int(packed)
+    try:
+        date = datetime.datetime(packed >> 20, (packed >> 16) & 0xF, (packed >> 11) & 0x1F,
+                                 (packed >> 6) & 0x1F, packed & 0x3F)
+    except ValueError:
+        return ''
+    return date.isoformat(sep=' ')
+
+
+def _text(value) -> str:
+    return value.split(b'\0', 1)[0].decode('latin-1').strip()
+
+
+def _layout(buffer) -> tuple[np.void, list[Subfile]]:
+    '''Read the main header and locate the subfiles without reading their data.'''
+    if buffer.size < MAIN_HEADER.itemsize:
+        raise ValueError('File too short for an SPC header')
+    header = np.frombuffer(buffer, MAIN_HEADER, count=1)[0]
+    if header['fversn'] != NEW_FORMAT:
+        raise ValueError(f'Unsupported SPC version: 0x{int(header["fversn"]):02X}')
+
+    flags = int(header['ftflgs'])
+    y_size = 2 if flags & TSPREC else 4
+    n_sub = max(int(header['fnsub']), 1) if flags & TMULTI else 1
+    offset = MAIN_HEADER.itemsize
+    if flags & TXVALS and not flags & TXYXYS:
+        offset += 4 * int(header['fnpts'])
+
+    subfiles = []
+    if not flags & TXYXYS:
+        # Subfiles of the same size: all the headers are read at once through a strided view
+        n_points = int(header['fnpts'])
+        stride = SUB_HEADER.itemsize + y_size * n_points
+        if offset + stride * n_sub > buffer.size:
+            raise ValueError('SPC file is truncated')
+        headers = np.ndarray((n_sub,), SUB_HEADER, buffer, offset, (stride,))
+        for i in range(n_sub):
+            y_offset = offset + i * stride + SUB_HEADER.itemsize
+            subfiles.append(Subfile(headers[i], None, y_offset, n_points))
+        return header, subfiles
+
+    for _ in range(n_sub):
+        if offset + SUB_HEADER.itemsize > buffer.size:
+            raise ValueError('SPC file is truncated')
+        sub_header = np.frombuffer(buffer, SUB_HEADER, count=1, offset=offset)[0]
+        n_points = int(sub_header['subnpts'])
+        x_offset = offset + SUB_HEADER.itemsize
+        subfiles.append(Subfile(sub_header, x_offset, x_offset + 4 * n_points, n_points))
+        offset = x_offset + (4 + y_size) * n_points
+    if offset > buffer.size:
+        raise ValueError('SPC file is truncated')
+    return header, subfiles
+
+
+def _metadata(header, subfile: Subfile) -> dict:
+    '''Header metadata of one spectrum, with the record names used for JCAMP-DX.'''
+    return {
+        'TITLE': _text(header['fcmnt']),
+        'DATE': _date(header['fdate']),
+        'SOURCE': _text(header['fsource']),
+        'RESOLUTION': _text(header['fres']),
+        'XUNITS': X_UNITS.get(int(header['fxtype']), str(header['fxtype'])),
+        'YUNITS': Y_UNITS.get(int(header['fytype']), str(header['fytype'])),
+        'SUBINDEX': str(subfile.header['subindx']),
+        'Z': str(subfile.header['subtime']),
+        'NPOINTS': str(subfile.n_points),
+    }
+
+
+def _y_format(header, subfiles) -> tuple[str, np.ndarray | None]:
+    '''Data type of the stored y values and the scale of every subfile, None for floats.
+
+    The y values are floats when the exponent is FLOAT_EXPONENT, otherwise integers
+    scaled by 2**(exponent - bits). Returns (None, None) when the subfiles mix both.
+    '''
+    flags = int(header['ftflgs'])
+    if flags & TMULTI:
+        exponents = np.array([int(subfile.header['subexp']) for subfile in subfiles])
+    else:
+        exponents = np.full(len(subfiles), int(header['fexp']))
+    if (exponents == FLOAT_EXPONENT).all():
+        return '<f4', None
+    if (exponents == FLOAT_EXPONENT).any():
+        return None, None
+    dtype, bits = ('<i2', 16) if flags & TSPREC else ('<i4', 32)
+    return dtype, 2.0 ** (exponents - bits)
+
+
+def _y_values(buffer, header, subfile: Subfile) -> np.ndarray:
+    '''View the y values of one subfile on the buffer, scaled to float64.'''
+    dtype, scale = _y_format(header, [subfile])
+    y_data = np.frombuffer(buffer, dtype, subfile.n_points, subfile.y_offset)
+    return y_data.astype(np.float64) if scale is None else y_data * scale[0]
+
+
+def sniff(file_path) -> FileFormat:
+    '''Read the headers of an SPC file.'''
+    buffer = map_buffer(file_path)
+    header, subfiles = _layout(buffer)
+    return FileFormat(0, None, '.', 1 + len(subfiles), reader='spc_module',
+                      metadata=[_metadata(header, subfile) for subfile in subfiles])
+
+
+def read(file_path, file_format: FileFormat = None, progress=None) -> np.ndarray:
+    '''Read every spectrum of an SPC file, single or multifile, x values in column 0.
+
+    The data is viewed with np.frombuffer on the memory-mapped file. Subfiles with
+    their own x values are resampled onto the axis of the first one.
+    progress(done, total) is called after each subfile.
+    '''
+    buffer = map_buffer(file_path)
+    header, subfiles = _layout(buffer)
+    flags = int(header['ftflgs'])
+    n_points = subfiles[0].n_points
+
+    if flags & TXYXYS:
+        x_data = np.frombuffer(buffer, '<f4', n_points, subfiles[0].x_offset).astype(np.float64)
+    elif flags & TXVALS:
+        x_data = np.frombuffer(buffer, '<f4', n_points, MAIN_HEADER.itemsize).astype(np.float64)
+    else:
+        x_data = np.linspace(header['ffirst'], header['flast'], n_points)
+
+    data = np.empty((n_points, 1 + len(subfiles)))
+    data[:, 0] = x_data
+    dtype, scale = _y_format(header, subfiles)
+    if not flags & TXYXYS and dtype is not None:
+        # Evenly spaced subfiles: a strided view over all the y values, converted in one pass
+        itemsize = np.dtype(dtype).itemsize
+        stride = SUB_HEADER.itemsize + itemsize * n_points
+        y_view = np.ndarray((len(subfiles), n_points), dtype, buffer, subfiles[0].y_offset, (stride, itemsize))
+        np.multiply(y_view.T, 1.0 if scale is None else scale, out=data[:, 1:])
+        if progress is not None:
+            progress(len(subfiles), len(subfiles))
+        return data
+
+    for i, subfile in enumerate(subfiles):
+        y_data = _y_values(buffer, header, subfile)
+        if subfile.x_offset is not None and i > 0:
+            x_sub = np.frombuffer(buffer, '<f4', subfile.n_points, subfile.x_offset).astype(np.float64)
+            if not axes_match(x_sub, x_data):
+                y_data = resample(x_sub, y_data, x_data, fill_value='edge')
+        data[:, 1 + i] = y_data
+        if progress is not None:
+            progress(i + 1, len(subfiles))
+
+    return data
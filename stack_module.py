@@ -0,0 +1,722 @@
+import mmap
+import os
+import tempfile
+import weakref
+import numpy as np
+from scipy.signal import savgol_filter
+from scipy.ndimage import gaussian_filter1d, convolve1d
+from resample_module import interp_columns
+from decimate_module import MinMaxPyramid
+from project_module import mapped_from
+
+GROWTH_FACTOR = 2
+MIN_CAPACITY = 8
+BLOCK_BYTES = 8 * 1024 ** 2
+SMOOTH_METHODS = ('None', 'Savitzky-Golay', 'Gaussian', 'Moving Average')
+LN10 = np.log(10)
+TRANSMITTANCE_FLOOR = 1e-10
+# Transform from each intensity unit to optical depth, recorded as metadata of the stack
+UNIT_TRANSFORMS = {
+    'OPTICAL DEPTH': 'tau',
+    'ABSORBANCE': 'tau = ln(10) * A',
+    'TRANSMITTANCE': 'tau = -ln(max(T, TRANSMITTANCE_FLOOR))',
+}
+
+
+class SpectraStore:
+    '''
+    Growable column store for a stack of spectra sharing the first (x) column.
+
+    Columns are kept in a Fortran-ordered buffer with spare capacity, so appending
+    spectra writes into free columns in place and the buffer is only reallocated
+    when it is full, growing geometrically (amortized linear appends). Views taken
+    before a reallocation keep pointing to the old buffer.
+
+    Attributes:
+    ----------------
+        buffer (numpy.ndarray): Fortran-ordered buffer, shape (rows, capacity).
+        n_columns (int): Number of used columns, the x column included.
+
+    Methods:
+    ----------------
+        from_array(data): Build a store holding a copy of a 2-D array.
+        wrap(buffer): Build a store around an existing Fortran-ordered buffer.
+        append(columns): Append one or more spectra.
+        write(column, columns): Write spectra into reserved columns.
+        reserve(n_spectra): Make room for n_spectra more spectra.
+        blocks(): Iterate over the spectra in column blocks of bounded size.
+        release(): Drop the resident pages of an out-of-core buffer.
+        data: Zero-copy view of the used columns, shape (rows, n_columns).
+    '''
+
+    def __init__(self, rows, capacity=MIN_CAPACITY, dtype=np.float64):
+        self.buffer = np.empty((rows, max(capacity, 1)), dtype=dtype, order='F')
+        self.n_columns = 0
+
+    @classmethod
+    def from_array(cls, data, capacity=None, **kwargs) -> 'SpectraStore':
+        '''Build a store holding a copy of a 2-D array with the x values in column 0.'''
+        data = np.asarray(data)
+        if data.ndim != 2:
+            raise ValueError(f'Expected a 2-D array, got {data.ndim} dimensions')
+        store = cls(data.shape[0], capacity or data.shape[1], data.dtype, **kwargs)
+        store.append(data)
+        return store
+
+    @classmethod
+    def wrap(cls, buffer, n_columns=None) -> 'SpectraStore':
+        '''Build a SpectraStore around a Fortran-ordered buffer, e.g. a memory map, without copying.
+
+        All the columns are used unless n_columns is given. Growing the store moves
+        the data to a new in-memory buffer.
+        '''
+        if buffer.ndim != 2 or not buffer.flags.f_contiguous:
+            raise ValueError('Expected a Fortran-ordered 2-D buffer')
+        store = SpectraStore.__new__(SpectraStore)
+        store.buffer = buffer
+        store.n_columns = buffer.shape[1] if n_columns is None else n_columns
+        return store
+
+    @property
+    def capacity(self) -> int:
+        return self.buffer.shape[1]
+
+    @property
+    def rows(self) -> int:
+        return self.buffer.shape[0]
+
+    @property
+    def n_spectra(self) -> int:
+        return max(self.n_columns - 1, 0)
+
+    @property
+    def data(self) -> np.ndarray:
+        '''Zero-copy view of the used columns.'''
+        return self.buffer[:, :self.n_columns]
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.buffer[:, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.buffer[:, 1:self.n_columns]
+
+    def reserve(self, n_spectra):
+        '''Make room for n_spectra more spectra, reallocating at most once.'''
+        needed = self.n_columns + n_spectra
+        if needed <= self.capacity:
+            return
+        self._grow(max(needed, self.capacity * GROWTH_FACTOR, MIN_CAPACITY))
+
+    def _grow(self, capacity):
+        '''Reallocate the buffer with a larger capacity.'''
+        buffer = np.empty((self.rows, capacity), dtype=self.buffer.dtype, order='F')
+        buffer[:, :self.n_columns] = self.data
+        self.buffer = buffer
+
+    def blocks(self, start=1, stop=None, block_bytes=BLOCK_BYTES):
+        '''Yield (first, last) column ranges of at most block_bytes each.
+
+        Columns are counted in the buffer, so the default start skips the x column.
+        '''
+        stop = self.n_columns if stop is None else stop
+        step = max(1, block_bytes // max(1, self.rows * self.buffer.itemsize))
+        for first in range(start, stop, step):
+            yield first, min(first + step, stop)
+
+    def append(self, columns):
+        '''Append one spectrum (1-D) or several spectra (2-D, one per column).'''
+        columns = np.asarray(columns)
+        if columns.ndim == 1:
+            columns = columns[:, np.newaxis]
+        if columns.shape[0] != self.rows:
+            raise ValueError('New data has different number of lines than the original data')
+
+        self.reserve(columns.shape[1])
+        self.write(self.n_columns, columns)
+        self.n_columns += columns.shape[1]
+
+    def write(self, column, columns):
+        '''Write spectra into the buffer starting at a column index within the capacity.
+
+        Used to fill reserved columns out of order; n_columns is left to the caller.
+        '''
+        columns = np.asarray(columns)
+        if columns.ndim == 1:
+            columns = columns[:, np.newaxis]
+        if columns.shape[0] != self.rows:
+            raise ValueError('New data has different number of lines than the original data')
+        if column + columns.shape[1] > self.capacity:
+            raise ValueError('Not enough reserved columns')
+
+        step = max(1, BLOCK_BYTES // max(1, self.rows * self.buffer.itemsize))
+        for first in range(0, columns.shape[1], step):
+            last = min(first + step, columns.shape[1])
+            self.buffer[:, column + first:column + last] = columns[:, first:last]
+            self.release()
+
+    def release(self):
+        '''Drop the resident pages of the buffer once written; nothing to do in memory.'''
+
+
+def _remove_file(file_path):
+    '''Delete a backing file, ignoring files that are gone or still mapped.'''
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+class MemmapSpectraStore(SpectraStore):
+    '''
+    Out-of-core SpectraStore whose buffer is a np.memmap over a temporary file.
+
+    The Fortran order keeps every column contiguous in the file, so growing the
+    store only extends the file and maps it again, without copying. The file is
+    deleted when the store is garbage collected.
+
+    Attributes:
+    ----------------
+        directory (str): Directory of the backing file.
+        file_path (str): Path of the backing file.
+    '''
+
+    def __init__(self, rows, capacity=MIN_CAPACITY, dtype=np.float64, directory=None):
+        self.directory = directory or tempfile.gettempdir()
+        os.makedirs(self.directory, exist_ok=True)
+        fd, self.file_path = tempfile.mkstemp(suffix='.spectra', dir=self.directory)
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, _remove_file, self.file_path)
+        self.buffer = self._map(rows, max(capacity, 1), np.dtype(dtype))
+        self.n_columns = 0
+
+    def _map(self, rows, capacity, dtype) -> np.memmap:
+        '''Map the backing file with the given capacity, extending the file if needed.'''
+        return np.memmap(self.file_path, dtype=dtype, mode='r+', shape=(rows, capacity), order='F')
+
+    def _grow(self, capacity):
+        '''Extend the backing file and map it again.'''
+        self.buffer.flush()
+        self.buffer = self._map(self.rows, capacity, self.buffer.dtype)
+
+    def flush(self):
+        '''Write the dirty pages of the buffer to the backing file.'''
+        self.buffer.flush()
+
+    def release(self):
+        '''Unmap the pages of the buffer, so the memory used stays bounded by a block.
+
+        The pages stay in the file, written back first if dirty, and are read
+        again on the next access.
+        '''
+        mapping = getattr(self.buffer, '_mmap', None)
+        if mapping is not None and hasattr(mmap, 'MADV_DONTNEED'):
+            mapping.madvise(mmap.MADV_DONTNEED)
+
+
+def to_optical_depth(y_data, intensity_units, out=None) -> np.ndarray:
+    '''Convert intensities to optical depth, writing into out if given.
+
+    Empty units are taken as optical depth. Transmittance is clipped to
+    TRANSMITTANCE_FLOOR so zero or negative (noisy) values give a finite depth.
+    '''
+    units = intensity_units.upper() or 'OPTICAL DEPTH'
+    if units not in UNIT_TRANSFORMS:
+        raise ValueError(f'Unknown intensity units: {intensity_units}')
+    if out is None:
+        out = np.empty(np.shape(y_data), dtype=np.float64)
+
+    if units == 'ABSORBANCE':
+        return np.multiply(y_data, LN10, out=out)
+    if units == 'TRANSMITTANCE':
+        np.maximum(y_data, TRANSMITTANCE_FLOOR, out=out)
+        np.log(out, out=out)
+        return np.negative(out, out=out)
+    np.copyto(out, y_data)
+    return out
+
+
+def roi_slice(x_data, low, high) -> slice:
+    '''Rows of a strictly monotonic axis with low <= x <= high, found with searchsorted.
+
+    Descending axes are searched through a reversed view, so nothing is copied.
+    '''
+    low, high = min(low, high), max(low, high)
+    if x_data[0] <= x_data[-1]:
+        return slice(int(np.searchsorted(x_data, low, 'left')), int(np.searchsorted(x_data, high, 'right')))
+    n = x_data.size
+    reversed_x = x_data[::-1]
+    return slice(n - int(np.searchsorted(reversed_x, high, 'right')), n - int(np.searchsorted(reversed_x, low, 'left')))
+
+
+def smoothing_parameter(method, window=5, sigma=1.0) -> int | float | None:
+    '''Return the parameter actually used by a smoothing method.
+
+    The window of Savitzky-Golay is made odd and at least 3, the Gaussian filter
+    uses sigma and no smoothing has no parameter.
+    '''
+    if method not in SMOOTH_METHODS:
+        raise ValueError(f'Unknown smoothing method: {method}')
+    window = max(1, int(window))
+    if method == 'Savitzky-Golay':
+        return max(3, window + 1 if window % 2 == 0 else window)
+    return {'None': None, 'Gaussian': sigma}.get(method, window)
+
+
+def smooth_columns(y_data, method, parameter) -> np.ndarray:
+    '''Smooth every column of y_data with a method of SMOOTH_METHODS.'''
+    if method == 'Savitzky-Golay':
+        return savgol_filter(y_data, parameter, polyorder=2, axis=0)
+    if method == 'Gaussian':
+        return gaussian_filter1d(y_data, sigma=parameter, axis=0)
+    if method == 'Moving Average':
+        # Same alignment as np.convolve(mode='same') for even windows
+        return convolve1d(y_data, np.ones(parameter) / parameter, axis=0, mode='constant',
+                          origin=-1 if parameter % 2 == 0 else 0)
+    return y_data
+
+
+class SpectrumStack:
+    '''
+    Stack of spectra on one wavenumber axis with a lazily applied processing chain.
+
+    Only two blocks are stored: the raw intensities as loaded and the display stage,
+    whose column 0 holds the wavenumber axis so that data is a zero-copy 2-D view.
+    Both blocks use the storage precision (dtype), while the axis is also kept once
+    in float64 for processing. The processing recipe (intensity units, smoothing,
+    baseline anchors) is kept as parameters and the intermediate stages are computed
+    in float64, column block by column block, when requested. The raw block is never
+    modified; the unit conversion is written through out= buffers, straight into the
+    display block when it is the only step, so switching units allocates nothing.
+
+    A region of interest (set_roi) restricts the processing and the data views to
+    a wavenumber window. It is a row slice of the blocks, so the views are not
+    copies; display rows outside the region are only refreshed once it is cleared.
+
+    The min/max pyramid of the display spectra in the region, used to plot them,
+    is built on first access and then updated by refresh for the refreshed
+    columns only. Processing, like building the pyramid, goes column block by
+    column block and releases the pages of out-of-core stores after each block.
+
+    Invariants:
+    ----------------
+        - The wavenumber axis is strictly monotonic.
+        - raw and display have the same rows, and display has one column more than
+          raw (the axis).
+        - Inside the region of interest, every display column equals
+          smoothed(converted(raw)) - baseline for the current recipe; the recipe
+          setters refresh the display to keep it so.
+
+    Attributes:
+    ----------------
+        raw (SpectraStore): Raw intensities, one spectrum per column, no axis.
+        display (SpectraStore): Axis in column 0 followed by the processed spectra.
+        dtype (numpy.dtype): Storage precision of the intensities.
+        intensity_units (str): Units of the raw intensities, converted to optical depth.
+        smoothing (tuple): Smoothing method and its parameter.
+        baseline_points (list | None): Wavenumbers of the baseline anchors.
+        baseline_use_smoothing (bool): Whether the baseline is fitted on the smoothed stage.
+        roi (slice): Rows of the region of interest, all the rows without one.
+        roi_range (tuple | None): Wavenumbers bounding the region of interest.
+        pyramid (MinMaxPyramid): Levels of detail of the display spectra in the region.
+
+    Methods:
+    ----------------
+        from_array(data): Build a stack from a 2-D array with the axis in column 0.
+        from_raw(x_data, raw): Build a stack around a store of raw spectra and process them.
+        from_stores(x_data, raw, display, recipe): Build a stack around already processed stores.
+        append(y_data), extend(raw): Append spectra and process only the new columns.
+        set_units(units), set_smoothing(method, window), set_baseline(points): Change the recipe.
+        set_roi(low, high), clear_roi(): Restrict the processing to a wavenumber window or not.
+        recipe(), set_recipe(recipe): Return the processing recipe as a dictionary, or apply one.
+        build_pyramid(): Build the min/max pyramid used to plot the spectra.
+        load_mapped(file_path): Read the stores mapped from a file into memory.
+        converted(first, last), smoothed(first, last), baseline(first, last): Stages of a column range.
+        validate(): Check the invariants.
+    '''
+
+    def __init__(self, x_data, store_factory=SpectraStore, capacity=MIN_CAPACITY, dtype=np.float64):
+        x_data = np.asarray(x_data, dtype=np.float64)
+        steps = np.diff(x_data)
+        if x_data.ndim != 1 or x_data.size < 2 or not (np.all(steps > 0) or np.all(steps < 0)):
+            raise ValueError('The wavenumber axis must be strictly monotonic')
+
+        self.store_factory = store_factory
+        self.dtype = np.dtype(dtype)
+        self._x = x_data.copy()
+        self.raw: SpectraStore = store_factory(x_data.size, capacity, self.dtype)
+        self.display: SpectraStore = store_factory(x_data.size, capacity + 1, self.dtype)
+        self.display.append(x_data)
+        self.intensity_units = ''
+        self.smoothing = ('None', None)
+        self.baseline_points = None
+        self.baseline_use_smoothing = False
+        self.roi = slice(0, x_data.size)
+        self.roi_range = None
+        self._anchor_index = None
+        self._scratch = None
+        self._pyramid = None
+
+    @classmethod
+    def from_array(cls, data, store_factory=SpectraStore, intensity_units='', dtype=None) -> 'SpectrumStack':
+        '''Build a stack from a 2-D array holding the axis in column 0 and one spectrum per column.
+
+        The intensities are stored with dtype, the precision of data by default.
+        '''
+        data = np.asarray(data)
+        if data.ndim != 2 or data.shape[1] < 2:
+            raise ValueError('Expected the wavenumber axis followed by at least one spectrum')
+        stack = cls(data[:, 0], store_factory, data.shape[1] - 1, dtype or data.dtype)
+        stack.intensity_units = intensity_units
+        stack.append(data[:, 1:])
+        return stack
+
+    @classmethod
+    def from_raw(cls, x_data, raw: SpectraStore, store_factory=SpectraStore, intensity_units='') -> 'SpectrumStack':
+        '''Build a stack around a store of raw spectra, e.g. parsed straight into it, and process them.'''
+        if raw.rows != np.size(x_data):
+            raise ValueError('The axis and the spectra have different number of lines')
+        stack = cls(x_data, store_factory, capacity=1, dtype=raw.buffer.dtype)
+        stack.raw = raw
+        stack.display = store_factory(raw.rows, raw.capacity + 1, raw.buffer.dtype)
+        stack.display.append(stack.x)
+        stack.display.n_columns += raw.n_columns
+        stack.intensity_units = intensity_units
+        stack.refresh()
+        return stack
+
+    @classmethod
+    def from_stores(cls, x_data, raw: SpectraStore, display: SpectraStore, recipe=None) -> 'SpectrumStack':
+        '''Build a stack around a raw store and its display store, without processing.
+
+        The display store holds the axis in column 0 followed by the raw spectra
+        processed with recipe (see recipe()), e.g. both memory-mapped from a project.
+        '''
+        stack = cls(x_data, capacity=1, dtype=raw.buffer.dtype)
+        stack.raw, stack.display = raw, display
+        for name, value in stack._recipe_values(recipe or {}).items():
+            setattr(stack, name, value)
+        stack.validate()
+        return stack
+
+    def recipe(self) -> dict:
+        '''Processing recipe of the display stage, as taken by from_stores.'''
+        return {
+            'intensity_units': self.intensity_units,
+            'smoothing': list(self.smoothing),
+            'baseline_points': self.baseline_points,
+            'baseline_use_smoothing': self.baseline_use_smoothing,
+            'roi': None if self.roi_range is None else list(self.roi_range),
+        }
+
+    def set_recipe(self, recipe):
+        '''Apply a whole recipe as returned by recipe(), e.g. to undo changes, and refresh the display.'''
+        values = self._recipe_values(recipe)
+        if values['roi'] != self.roi:
+            self._pyramid = None
+        self._change_recipe(**values)
+
+    def _recipe_values(self, recipe) -> dict:
+        '''Attributes of the stack for a recipe, checked against the axis.'''
+        to_optical_depth(np.empty(0), recipe.get('intensity_units', ''))
+        method, parameter = recipe.get('smoothing', ('None', None))
+        if method not in SMOOTH_METHODS:
+            raise ValueError(f'Unknown smoothing method: {method}')
+        values = {
+            'intensity_units': recipe.get('intensity_units', ''),
+            'smoothing': (method, parameter),
+            'roi': slice(0, self.rows),
+            'roi_range': None,
+            'baseline_points': None,
+            '_anchor_index': None,
+            'baseline_use_smoothing': False,
+        }
+        if recipe.get('roi'):
+            values['roi_range'] = tuple(recipe['roi'])
+            values['roi'] = self._roi_rows(*values['roi_range'])
+        if recipe.get('baseline_points'):
+            values['baseline_points'], values['_anchor_index'] = self._anchors(recipe['baseline_points'], values['roi'])
+            values['baseline_use_smoothing'] = bool(recipe.get('baseline_use_smoothing', False))
+        return values
+
+    @property
+    def rows(self) -> int:
+        return self.raw.rows
+
+    @property
+    def n_spectra(self) -> int:
+        return self.raw.n_columns
+
+    @property
+    def nbytes(self) -> int:
+        return self.raw.buffer.nbytes + self.display.buffer.nbytes
+
+    @property
+    def x(self) -> np.ndarray:
+        '''Wavenumber axis in float64.'''
+        return self._x
+
+    @property
+    def roi_x(self) -> np.ndarray:
+        '''Wavenumber axis in float64 inside the region of interest.'''
+        return self._x[self.roi]
+
+    @property
+    def y(self) -> np.ndarray:
+        '''Zero-copy view of the processed spectra inside the region of interest.'''
+        return self.display.y[self.roi]
+
+    @property
+    def data(self) -> np.ndarray:
+        '''Zero-copy view of the axis followed by the processed spectra, inside the region of interest.'''
+        return self.display.data[self.roi]
+
+    @property
+    def pyramid(self) -> MinMaxPyramid:
+        '''Min/max levels of detail of the display spectra in the region of interest.'''
+        return self.build_pyramid() if self._pyramid is None else self._pyramid
+
+    def build_pyramid(self) -> MinMaxPyramid:
+        '''Build the pyramid from the display spectra, e.g. on the thread that loaded them.'''
+        pyramid = MinMaxPyramid(self.roi_x, self.y[:, :0])
+        for first, last in self._blocks():
+            pyramid.update(self.y, first, last)
+            self._release()
+        self._pyramid = pyramid
+        return pyramid
+
+    def load_mapped(self, file_path):
+        '''Read into memory the stores memory-mapped from file_path, e.g. before it is overwritten.'''
+        for store in (self.raw, self.display):
+            if mapped_from(store.buffer, file_path):
+                store.buffer = np.array(store.buffer, order='F')
+        if self._pyramid is not None:
+            self._pyramid.y = self.y
+
+    def reserve(self, n_spectra):
+        '''Make room for n_spectra more spectra.'''
+        self.raw.reserve(n_spectra)
+        self.display.reserve(n_spectra)
+
+    def write_raw(self, column, y_data):
+        '''Write raw spectra into reserved columns; they count once commit() is called.'''
+        self.raw.write(column, y_data)
+
+    def commit(self, n_spectra):
+        '''Count n_spectra written with write_raw and process them.'''
+        first = self.raw.n_columns
+        self.raw.n_columns += n_spectra
+        self.display.n_columns += n_spectra
+        self.refresh(first)
+
+    def append(self, y_data):
+        '''Append raw spectra (one per column) and process only the new columns.'''
+        y_data = np.asarray(y_data)
+        if y_data.ndim == 1:
+            y_data = y_data[:, np.newaxis]
+        self.reserve(y_data.shape[1])
+        self.write_raw(self.raw.n_columns, y_data)
+        self.commit(y_data.shape[1])
+
+    def extend(self, raw: SpectraStore):
+        '''Append the spectra of a store of raw spectra, column block by column block, and process them.'''
+        self.reserve(raw.n_columns)
+        for first, last in raw.blocks(start=0):
+            self.write_raw(self.raw.n_columns + first, raw.buffer[:, first:last])
+            raw.release()
+        self.commit(raw.n_columns)
+
+    def _blocks(self, first=0, last=None):
+        return self.raw.blocks(start=first, stop=last)
+
+    def _release(self):
+        self.raw.release()
+        self.display.release()
+
+    @property
+    def unit_transform(self) -> str:
+        '''Transform applied to the raw intensities, as recorded in UNIT_TRANSFORMS.'''
+        return UNIT_TRANSFORMS[self.intensity_units.upper() or 'OPTICAL DEPTH']
+
+    def _scratch_block(self, n_columns) -> np.ndarray:
+        '''Return a reusable float64 buffer for the conversion of n_columns spectra in the region.'''
+        rows = self.roi.stop - self.roi.start
+        if self._scratch is None or self._scratch.shape[1] < n_columns or self._scratch.shape[0] != rows:
+            self._scratch = np.empty((rows, n_columns), order='F')
+        return self._scratch[:, :n_columns]
+
+    def _processed(self) -> bool:
+        return self.smoothing[0] != 'None' or self._anchor_index is not None
+
+    def _stages(self, first, last, out=None) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        '''Compute the converted, smoothed and baseline stages of a column range in float64.
+
+        The converted stage is written into out, or into the reusable scratch buffer.
+        '''
+        if out is None:
+            out = self._scratch_block(last - first)
+        converted = to_optical_depth(self.raw.buffer[self.roi, first:last], self.intensity_units, out=out)
+        smoothed = smooth_columns(converted, *self.smoothing)
+        if self._anchor_index is None:
+            return converted, smoothed, None
+
+        source = smoothed if self.baseline_use_smoothing and self.smoothing[0] != 'None' else converted
+        x_data = self.roi_x
+        x_anchor = x_data[self._anchor_index]
+        baseline = interp_columns(x_anchor, source[self._anchor_index], np.clip(x_data, x_anchor[0], x_anchor[-1]))
+        return converted, smoothed, baseline
+
+    def _stage(self, index, first, last) -> np.ndarray:
+        '''Assemble one stage over a column range from its blocks.'''
+        out = np.empty((self.roi.stop - self.roi.start, last - first))
+        for block_first, block_last in self._blocks(first, last):
+            block_out = out[:, block_first - first:block_last - first]
+            stage = self._stages(block_first, block_last, block_out if index == 0 else None)[index]
+            if stage is not block_out:
+                block_out[...] = 0 if stage is None else stage
+        return out
+
+    def converted(self, first, last) -> np.ndarray:
+        '''Raw spectra of a column range converted to the display units, inside the region of interest.
+
+        The stages are computed into a new float64 array, so large stacks are read
+        a column range at a time.
+        '''
+        return self._stage(0, first, last)
+
+    def smoothed(self, first, last) -> np.ndarray:
+        '''Converted spectra of a column range after smoothing.'''
+        return self._stage(1, first, last)
+
+    def baseline(self, first, last) -> np.ndarray:
+        '''Baseline of the spectra of a column range, zero without baseline.'''
+        return self._stage(2, first, last)
+
+    def refresh(self, first=0, last=None):
+        '''Recompute the display stage of a column range from the raw spectra, inside the region.
+
+        The pyramid, once built, is updated for the same columns.
+        '''
+        last = self.n_spectra if last is None else last
+        for block_first, block_last in self._blocks(first, last):
+            out = self.display.buffer[self.roi, 1 + block_first:1 + block_last]
+            if not self._processed():
+                to_optical_depth(self.raw.buffer[self.roi, block_first:block_last], self.intensity_units, out=out)
+            else:
+                _, smoothed, baseline = self._stages(block_first, block_last)
+                if baseline is not None:
+                    np.subtract(smoothed, baseline, out=baseline)
+                out[...] = smoothed if baseline is None else baseline
+            if self._pyramid is not None:
+                self._pyramid.update(self.y, block_first, block_last)
+            self._release()
+
+    def _change_recipe(self, **changes):
+        '''Set attributes of the recipe and refresh the display.
+
+        If the refresh fails, e.g. a smoothing window longer than the region, the
+        previous values are restored with their display and the error is raised again.
+        '''
+        previous = {name: getattr(self, name) for name in changes}
+        for name, value in changes.items():
+            setattr(self, name, value)
+        try:
+            self.refresh()
+        except Exception:
+            for name, value in previous.items():
+                setattr(self, name, value)
+            self.refresh()
+            raise
+
+    def set_units(self, intensity_units):
+        '''Set the units of the raw intensities and refresh the display.'''
+        to_optical_depth(np.empty(0), intensity_units)
+        self._change_recipe(intensity_units=intensity_units)
+
+    def set_smoothing(self, method, window=5, sigma=1.0) -> int | float | None:
+        '''Set the smoothing and refresh the display. Returns the parameter used.'''
+        parameter = smoothing_parameter(method, window, sigma)
+        self._change_recipe(smoothing=(method, parameter))
+        return parameter
+
+    def set_baseline(self, baseline_points, use_smoothing=False) -> list[float]:
+        '''Set the wavenumbers of a piecewise linear baseline and refresh the display.
+
+        The x range ends are added to the points. Returns the sorted points used.
+        '''
+        baseline_points, anchor_index = self._anchors(baseline_points)
+        self._change_recipe(_anchor_index=anchor_index, baseline_points=baseline_points,
+                            baseline_use_smoothing=use_smoothing)
+        return baseline_points
+
+    def _anchors(self, baseline_points, rows=None) -> tuple[list[float], np.ndarray]:
+        '''Sorted baseline points with the x range ends, and the indices of their anchors.
+
+        Points outside the region of interest, or the rows given instead, are left out.
+        '''
+        x_data = self.roi_x if rows is None else self.x[rows]
+        low, high = min(x_data[0], x_data[-1]), max(x_data[0], x_data[-1])
+        baseline_points = sorted(float(point) for point in baseline_points if low <= float(point) <= high)
+        if len(baseline_points) < 2:
+            raise ValueError('At least two baseline points are required')
+        # The ends of the range, whichever the direction of the axis
+        if baseline_points[0] > low:
+            baseline_points.insert(0, float(low))
+        if baseline_points[-1] < high:
+            baseline_points.append(float(high))
+
+        anchor_index = np.unique([np.argmin(np.abs(x_data - point)) for point in baseline_points])
+        if anchor_index.size < 2:
+            raise ValueError('At least two distinct baseline points are required')
+
+        return baseline_points, anchor_index[np.argsort(x_data[anchor_index])]
+
+    def _roi_rows(self, low, high) -> slice:
+        rows = roi_slice(self.x, low, high)
+        if rows.stop - rows.start < 2:
+            raise ValueError('The region of interest must hold at least two points')
+        return rows
+
+    def set_roi(self, low, high) -> bool:
+        '''Restrict the processing and the data views to low <= x <= high, and refresh.
+
+        The baseline anchors are placed again inside the region; the baseline is
+        removed if fewer than two of its points fall inside. Returns False then.
+        '''
+        rows = self._roi_rows(low, high)
+        return self._apply_roi(rows, (min(low, high), max(low, high)))
+
+    def clear_roi(self) -> bool:
+        '''Process the whole axis again and refresh.'''
+        return self._apply_roi(slice(0, self.rows), None)
+
+    def _apply_roi(self, rows, roi_range) -> bool:
+        anchor_index, baseline_points, kept = self._anchor_index, self.baseline_points, True
+        if baseline_points is not None:
+            try:
+                anchor_index = self._anchors(baseline_points, rows)[1]
+            except ValueError:
+                anchor_index, baseline_points, kept = None, None, False
+        # The pyramid covers the rows of the region, it is built again when needed
+        self._pyramid = None
+        self._change_recipe(roi=rows, roi_range=roi_range, _anchor_index=anchor_index, baseline_points=baseline_points)
+        return kept
+
+    def clear_baseline(self):
+        '''Remove the baseline and refresh the display.'''
+        self._anchor_index = None
+        self.baseline_points = None
+        self.refresh()
+
+    def validate(self):
+        '''Raise ValueError if an invariant of the stack does not hold.'''
+        steps = np.diff(self.x)
+        if not (np.all(steps > 0) or np.all(steps < 0)):
+            raise ValueError('The wavenumber axis must be strictly monotonic')
+        if self.x.size != self.raw.rows:
+            raise ValueError('The wavenumber axis and the spectra have different number of lines')
+        if self.raw.rows != self.display.rows:
+            raise ValueError('Raw and display stages have different number of lines')
+        if self.display.n_columns != self.raw.n_columns + 1:
+            raise ValueError('Raw and display stages have different number of spectra')
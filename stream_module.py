@@ -0,0 +1,263 @@
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from stack_module import MemmapSpectraStore
+
+MAGIC = b'FPYS'
+# Stream header: magic, number of points, then the x values as float64
+HEADER = struct.Struct('<4sI')
+# Every frame: sequence number, then the intensities as float32
+FRAME_HEADER = struct.Struct('<Q')
+FRAME_DTYPE = np.dtype('<f4')
+RING_CAPACITY = 4096
+DISPLAY_FRAMES = 100
+RATE_WINDOW = 1.0
+
+
+def parse_address(address) -> tuple[int, object]:
+    '''Socket family and address of 'host:port' (TCP) or a socket file path (Unix).'''
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return socket.AF_INET, (host or 'localhost', int(port))
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ValueError(f'Expected host:port, got {address!r}')
+    return socket.AF_UNIX, address
+
+
+def pack_header(x_data) -> bytes:
+    '''Stream header sent once by the instrument before the frames.'''
+    x_data = np.asarray(x_data, dtype='<f8')
+    return HEADER.pack(MAGIC, x_data.size) + x_data.tobytes()
+
+
+def pack_frame(sequence, y_data) -> bytes:
+    '''One frame of the stream.'''
+    return FRAME_HEADER.pack(sequence) + np.asarray(y_data, dtype=FRAME_DTYPE).tobytes()
+
+
+def _receive_into(connection, view) -> bool:
+    '''Fill a writable buffer from the socket. Returns False if the stream ended first.'''
+    view = memoryview(view).cast('B')
+    received = 0
+    while received < len(view):
+        n = connection.recv_into(view[received:])
+        if n == 0:
+            return False
+        received += n
+    return True
+
+
+class RingBuffer:
+    '''
+    Fixed-size ring of the latest frames of a stream, one spectrum per column.
+
+    The buffer is Fortran-ordered like SpectraStore, so every frame is a contiguous
+    column the socket is read into without a copy. A single writer fills slot() and
+    calls commit(); readers copy frames out and drop the ones overwritten while
+    they were being copied.
+
+    Attributes:
+    ----------------
+        x (numpy.ndarray): Shared x values of the frames.
+        buffer (numpy.ndarray): Fortran-ordered frames, shape (rows, capacity).
+        sequence (numpy.ndarray): Sequence number of the frame in every slot.
+        count (int): Number of frames committed since the start.
+
+    Methods:
+    ----------------
+        slot(): Column the next frame is written into.
+        commit(sequence): Count the frame written into slot().
+        latest(n): Copy of the n latest frames in time order.
+        decimated(n): Copy of n frames evenly spread over the ring.
+    '''
+
+    def __init__(self, x_data, capacity=RING_CAPACITY, dtype=FRAME_DTYPE):
+        if capacity < 1:
+            raise ValueError('The ring capacity must be positive')
+        self.x = np.asarray(x_data, dtype=np.float64)
+        self.buffer = np.zeros((self.x.size, capacity), dtype=dtype, order='F')
+        self.sequence = np.full(capacity, -1, dtype=np.int64)
+        self.count = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.buffer.shape[1]
+
+    @property
+    def rows(self) -> int:
+        return self.buffer.shape[0]
+
+    def slot(self) -> np.ndarray:
+        '''Contiguous column the next frame is written into.'''
+        return self.buffer[:, self.count % self.capacity]
+
+    def commit(self, sequence):
+        '''Count the frame written into slot().'''
+        self.sequence[self.count % self.capacity] = sequence
+        self.count += 1
+
+    def _copy(self, frames) -> tuple[np.ndarray, np.ndarray]:
+        '''Copy frames given by their global index, without the ones overwritten meanwhile.'''
+        slots = frames % self.capacity
+        y_data = self.buffer[:, slots]
+        sequence = self.sequence[slots]
+        # The writer may be filling the slot of frame count - capacity
+        valid = frames > self.count - self.capacity
+        return sequence[valid], y_data[:, valid]
+
+    def latest(self, n) -> tuple[np.ndarray, np.ndarray]:
+        '''Sequence numbers and copy of the n latest frames, oldest first.'''
+        count = self.count
+        n = min(n, count, self.capacity - 1)
+        return self._copy(np.arange(count - n, count))
+
+    def decimated(self, n) -> tuple[np.ndarray, np.ndarray]:
+        '''Sequence numbers and copy of n frames evenly spread over the ring, oldest first.
+
+        The display follows the whole history held in the ring at a fixed cost,
+        whatever the frame rate.
+        '''
+        count = self.count
+        available = min(count, self.capacity - 1)
+        if available <= n:
+            return self.latest(available)
+        frames = count - available + np.linspace(0, available - 1, n).round().astype(np.int64)
+        return self._copy(frames)
+
+
+class StreamReceiver:
+    '''
+    Reads spectra from a local TCP or Unix socket into a RingBuffer on a background thread.
+
+    The instrument (or benchmarks/simulate_stream.py) sends a header with the
+    x values and then frames with a sequence number. Gaps in the sequence numbers
+    are counted as dropped frames. With spill_dir, every frame is also appended to a
+    MemmapSpectraStore, so the whole run is kept out of core beyond the ring.
+
+    Attributes:
+    ----------------
+        address (str): 'host:port' or socket file path.
+        capacity (int): Number of frames of the ring.
+        ring (RingBuffer): Latest frames, None until the header is received.
+        spill (MemmapSpectraStore): Every frame received, x values in column 0, None without spill_dir.
+        received (int): Number of frames received.
+        dropped (int): Number of frames missing from the sequence.
+        error (Exception): Error that stopped the stream, None otherwise.
+
+    Methods:
+    ----------------
+        start(): Connect and start receiving.
+        stop(): Stop receiving and close the connection.
+        running(): Return True while frames are being received.
+        stats(): Counters and throughput of the stream.
+    '''
+
+    def __init__(self, address, capacity=RING_CAPACITY, spill_dir=None, timeout=5.0):
+        self.address = address
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+        self.timeout = timeout
+        self.ring: RingBuffer = None
+        self.spill: MemmapSpectraStore = None
+        self.received = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.error = None
+        self._connection = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._started = None
+        self._last_stats = (0.0, 0)
+
+    def start(self):
+        '''Connect to the stream and start the receiving thread.'''
+        family, address = parse_address(self.address)
+        connection = socket.socket(family, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+        try:
+            connection.connect(address)
+            header = bytearray(HEADER.size)
+            if not _receive_into(connection, header):
+                raise ValueError('The stream closed before its header')
+            magic, n_points = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError('Not a Fittingpy spectrum stream')
+            x_data = np.empty(n_points, dtype='<f8')
+            if not _receive_into(connection, x_data):
+                raise ValueError('The stream closed before its header')
+        except (OSError, ValueError):
+            connection.close()
+            raise
+
+        connection.settimeout(None)
+        self.ring = RingBuffer(x_data, self.capacity)
+        if self.spill_dir is not None:
+            self.spill = MemmapSpectraStore(n_points, self.capacity, FRAME_DTYPE, self.spill_dir)
+            self.spill.append(x_data)
+        self._connection = connection
+        self._started = time.perf_counter()
+        self._last_stats = (self._started, 0)
+        self._thread = threading.Thread(target=self._run, name='fittingpy-stream', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        '''Receiving loop: every frame is read straight into its ring slot.'''
+        frame_header = bytearray(FRAME_HEADER.size)
+        frame_bytes = FRAME_HEADER.size + self.ring.rows * FRAME_DTYPE.itemsize
+        last_sequence = None
+        try:
+            while not self._stop.is_set():
+                slot = self.ring.slot()
+                if not _receive_into(self._connection, frame_header) or not _receive_into(self._connection, slot):
+                    break
+                sequence, = FRAME_HEADER.unpack(frame_header)
+                if last_sequence is not None and sequence > last_sequence + 1:
+                    self.dropped += sequence - last_sequence - 1
+                last_sequence = sequence
+
+                self.ring.commit(sequence)
+                if self.spill is not None:
+                    self.spill.append(slot)
+                self.received += 1
+                self.bytes += frame_bytes
+        except OSError as e:
+            if not self._stop.is_set():
+                self.error = e
+        finally:
+            self._connection.close()
+
+    def stop(self):
+        '''Stop receiving and close the connection. The ring and the spill are kept.'''
+        self._stop.set()
+        if self._connection is not None:
+            try:
+                self._connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(self.timeout)
+        if self.spill is not None:
+            self.spill.flush()
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self) -> dict:
+        '''Frame counters, sustained throughput since the start and rate since the previous call.'''
+        now = time.perf_counter()
+        elapsed = now - self._started if self._started is not None else 0.0
+        last_time, last_received = self._last_stats
+        received = self.received
+        if now - last_time >= RATE_WINDOW:
+            self._last_stats = (now, received)
+        return {
+            'received': received,
+            'dropped': self.dropped,
+            'elapsed': elapsed,
+            'frames_per_s': received / elapsed if elapsed > 0 else 0.0,
+            'mb_per_s': self.bytes / elapsed / 1024 ** 2 if elapsed > 0 else 0.0,
+            'recent_frames_per_s': (received - last_received) / (now - last_time) if now > last_time else 0.0,
+            'spilled': self.spill.n_columns - 1 if self.spill is not None else 0,
+        }
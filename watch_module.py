@@ -0,0 +1,86 @@
+import os
+from io_module import DATA_PATTERNS, collect_files
+
+POLL_MS = 2000
+
+
+def path_key(file_path) -> str:
+    '''Absolute, case-normalized form of a path, equal for every spelling of the same file.'''
+    return os.path.normcase(os.path.abspath(file_path))
+
+
+class FolderWatcher:
+    '''
+    Polls a folder for new or changed data files.
+
+    A file is reported once its size and modification time are the same on two
+    consecutive polls, so files still being written are left for a later poll.
+    Reported files only count as seen once accept() is called, so a batch that
+    could not be loaded is reported again.
+
+    Attributes:
+    ----------------
+        folder (str): Watched folder.
+        patterns (tuple): Glob patterns of the data files.
+        poll_ms (int): Polling interval in milliseconds.
+        seen (dict): Signature (size, mtime_ns) of every accepted file, by path_key.
+
+    Methods:
+    ----------------
+        prime(file_paths): Mark files as seen without reporting them.
+        poll(): Return the new and the changed files that stopped changing.
+        accept(file_paths): Mark reported files as seen.
+    '''
+
+    def __init__(self, folder, patterns=DATA_PATTERNS, poll_ms=POLL_MS):
+        if not os.path.isdir(folder):
+            raise ValueError(f'Not a folder: {folder}')
+        self.folder = folder
+        self.patterns = patterns
+        self.poll_ms = poll_ms
+        self.seen = {}
+        self._pending = {}
+
+    @staticmethod
+    def signature(file_path) -> tuple[int, int] | None:
+        '''Size and modification time of a file, None if it is gone.'''
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def prime(self, file_paths):
+        '''Mark files as seen, e.g. the files already loaded.'''
+        for file_path in file_paths:
+            signature = self.signature(file_path)
+            if signature is not None:
+                self.seen[path_key(file_path)] = signature
+
+    def poll(self) -> tuple[list[str], list[str]]:
+        '''Return the new and the changed files, in natural order.
+
+        Only the folder listing and one stat per file are read, nothing is parsed.
+        Files are matched with the seen ones by path_key, so a file primed with
+        another spelling of its path is not reported as new.
+        '''
+        current = {}
+        file_paths = {}
+        for file_path in collect_files(self.folder, self.patterns):
+            key = path_key(file_path)
+            signature = self.signature(file_path)
+            if signature is not None and signature[0] > 0 and signature != self.seen.get(key):
+                current[key] = signature
+                file_paths[key] = file_path
+
+        stable = [key for key, signature in current.items() if self._pending.get(key) == signature]
+        self._pending = current
+        new = [file_paths[key] for key in stable if key not in self.seen]
+        changed = [file_paths[key] for key in stable if key in self.seen]
+        return new, changed
+
+    def accept(self, file_paths):
+        '''Mark reported files as seen with the signature they were reported with.'''
+        for key in map(path_key, file_paths):
+            if key in self._pending:
+                self.seen[key] = self._pending.pop(key)